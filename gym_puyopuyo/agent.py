@@ -4,33 +4,130 @@ import numpy as np
 
 import puyocore as core
 from gym_puyopuyo.field import TallField
+from gym_puyopuyo.versus import VersusState
 
 GAMMA = 0.95
 
 
-def tree_search_actions(state, depth, factor=0.22, occupation_threshold=0.0):
-    colors = []
-    for deal in state.deals[1:]:
-        colors.extend(deal)
+def _children_scores(state, search_fields):
+    """
+    Score the children of the root by stepping clones of the state in Python.
+
+    The fields of the children are scored with search_fields that takes a list of fields.
+    """
+    children = []
+    for index, (child, score) in enumerate(state.get_children(True)):
+        if child:
+            children.append((index, child, score))
+    tree_scores = search_fields([child.field.data for _, child, _ in children])
 
+    scores = [None] * len(state.actions)
+    popcounts = [None] * len(state.actions)
+    for (index, child, score), tree_score in zip(children, tree_scores):
+        scores[index] = score + GAMMA * tree_score
+        popcounts[index] = child.field.popcount
+    return scores, popcounts
+
+
+def _action_mask(state):
     action_mask = 0
     for action in state.actions:
-        action_mask |= 1 << state._validation_actions.index(action)
+        action_mask |= 1 << state._action_indices[action]
+    return action_mask
+
+
+def make_searcher(state, depth, factor=0.22, table=None, num_threads=1, beam_width=0):
+    """
+    Return a core searcher for states with the rules of the given one.
 
-    search_args = [
+    The searcher keeps its scratch memory between searches so that repeated searches don't allocate.
+    A positive beam width only expands that many of the most promising moves of every deal below the root.
+    """
+    return core.Searcher(
         state.num_layers,
+        state.width,
+        isinstance(state.field, TallField),
+        state.tsu_rules,
         state.has_garbage,
-        action_mask,
-        colors,
-        depth - 1,
+        _action_mask(state),
+        depth,
         factor,
-    ]
-    search_fun = core.bottom_tree_search
-    if isinstance(state.field, TallField):
-        search_args.insert(1, state.tsu_rules)
-        search_args.insert(1, state.width)
-        search_fun = core.tall_tree_search
+        table,
+        num_threads,
+        beam_width,
+    )
+
+
+def root_scores(
+    state, depth, factor=0.22, table=None, num_threads=1, time_budget=None, searcher=None, beam_width=0
+):
+    """
+    Score every action of the state with a tree search.
+
+    With a time budget in milliseconds the search deepens iteratively up to the given depth until the budget runs out.
+    A searcher from make_searcher replaces the depth, factor, table, number of threads and beam width.
+    See make_searcher for the beam width.
+    Returns (scores, popcounts, depth reached) with None scores for invalid actions.
+    """
+    colors = []
+    for deal in state.deals:
+        colors.extend(deal)
+
+    if searcher is None:
+        searcher = make_searcher(state, depth, factor, table, num_threads, beam_width)
+
+    if isinstance(state, VersusState):
+        # Versus steps only resolve a single link of a chain so the root is expanded in Python.
+        depth_reached = [searcher.depth]
+
+        def search_fields(fields):
+            tree_scores, depth_reached[0] = searcher.search_fields(fields, colors[2:], time_budget or 0)
+            return tree_scores
+        scores, popcounts = _children_scores(state, search_fields)
+        return scores, popcounts, depth_reached[0]
 
+    root_scores, root_popcounts, depth = searcher.search(state.field.data, colors, time_budget or 0)
+    indices = [state._action_indices[action] for action in state.actions]
+    scores = [root_scores[index] for index in indices]
+    popcounts = [root_popcounts[index] for index in indices]
+    return scores, popcounts, depth
+
+
+def batch_root_scores(states, depth, factor=0.22, table=None, num_threads=1, beam_width=0):
+    """
+    Score every action of many single player states sharing the same rules in a single core call.
+
+    Returns (scores, popcounts) arrays with one row per state where invalid actions have None scores.
+    """
+    template = states[0]
+    fields = np.frombuffer(b"".join(bytes(state.field.data) for state in states), dtype=np.uint64)
+    fields = fields.reshape(len(states), -1)
+    colors = np.array([state.deals for state in states], dtype=np.intc)
+    scores = np.zeros((len(states), core.NUM_ACTIONS))
+    popcounts = np.zeros((len(states), core.NUM_ACTIONS), dtype=np.intc)
+    action_mask = _action_mask(template)
+
+    if isinstance(template.field, TallField):
+        core.tall_root_search_batch(
+            fields, template.num_layers, template.width, template.tsu_rules, template.has_garbage, action_mask,
+            colors, depth, factor, scores, popcounts, table, num_threads, beam_width
+        )
+    else:
+        core.bottom_root_search_batch(
+            fields, template.num_layers, template.has_garbage, action_mask,
+            colors, depth, factor, scores, popcounts, table, num_threads, beam_width
+        )
+    indices = [template._action_indices[action] for action in template.actions]
+    scores = scores[:, indices].astype(object)
+    popcounts = popcounts[:, indices]
+    scores[popcounts < 0] = None
+    return scores, popcounts
+
+
+def select_actions(state, scores, popcounts, occupation_threshold=0.0):
+    """
+    Return the indices of the best scoring actions avoiding early chains on sparse fields.
+    """
     base_popcount = state.field.popcount
     prevent_chains = (base_popcount < occupation_threshold * state.width * state.height)
 
@@ -39,16 +136,11 @@ def tree_search_actions(state, depth, factor=0.22, occupation_threshold=0.0):
 
     possible_indices = []
     possible_score = float("-inf")
-    for index, (child, score) in enumerate(state.get_children(True)):
-        if not child:
+    for index, (child_score, popcount) in enumerate(zip(scores, popcounts)):
+        if child_score is None:
             continue
 
-        args = [child.field.data] + search_args
-        tree_score = search_fun(*args)
-
-        child_score = score + GAMMA * tree_score
-
-        if prevent_chains and child.field.popcount < base_popcount:
+        if prevent_chains and popcount < base_popcount:
             if child_score > possible_score:
                 possible_indices = [index]
                 possible_score = child_score
@@ -63,12 +155,87 @@ def tree_search_actions(state, depth, factor=0.22, occupation_threshold=0.0):
     return best_indices or possible_indices or [np.random.randint(0, len(state.actions))]
 
 
+def tree_search_actions(
+    state, depth, factor=0.22, occupation_threshold=0.0, table=None, num_threads=1, time_budget=None
+):
+    scores, popcounts, _ = root_scores(state, depth, factor, table, num_threads, time_budget)
+    return select_actions(state, scores, popcounts, occupation_threshold)
+
+
 class BaseTreeSearchAgent(object):
+    # Base two logarithm of the number of transposition table entries. Zero disables the table.
+    table_size = 16
+    # Number of threads used to search the children of the root.
+    num_threads = 1
+    # Milliseconds per move. When set the search deepens iteratively up to max_depth instead of using depth.
+    time_budget = None
+    max_depth = 8
+    # Number of moves expanded per deal below the root. Zero expands every move.
+    beam_width = 0
+
     def __init__(self, returns_distribution=False):
         self.returns_distribution = returns_distribution
+        self.table = None
+        self.searcher = None
+        self._searcher_key = None
+        self.last_depth = None
+
+    def get_table(self):
+        """
+        Return the transposition table shared by successive searches of this agent.
+        """
+        if self.table is None and self.table_size:
+            self.table = core.transposition_table(self.table_size)
+        core.age_transposition_table(self.table)
+        return self.table
+
+    def get_searcher(self, state, depth, table):
+        """
+        Return the searcher reused by successive searches of states with the same rules.
+        """
+        key = (
+            type(state.field), state.num_layers, state.width, state.tsu_rules, state.has_garbage,
+            depth, self.factor, table, self.num_threads, self.beam_width,
+        )
+        if key != self._searcher_key:
+            self.searcher = make_searcher(state, depth, self.factor, table, self.num_threads, self.beam_width)
+            self._searcher_key = key
+        return self.searcher
 
     def get_action(self, state):
-        indices = tree_search_actions(state, self.depth, self.factor, self.occupation_threshold)
+        depth = self.depth if self.time_budget is None else self.max_depth
+        table = self.get_table()
+        searcher = self.get_searcher(state, depth, table)
+        scores, popcounts, self.last_depth = root_scores(
+            state,
+            depth,
+            self.factor,
+            table,
+            self.num_threads,
+            self.time_budget,
+            searcher,
+            self.beam_width,
+        )
+        return self._choose(state, scores, popcounts)
+
+    def get_actions(self, states):
+        """
+        Choose actions for many states sharing the same rules with a single batched search.
+
+        The fixed depth is used even if a time budget is set. Versus states are searched one by one.
+        """
+        if not states:
+            return []
+        if isinstance(states[0], VersusState):
+            return [self.get_action(state) for state in states]
+        scores, popcounts = batch_root_scores(
+            states, self.depth, self.factor, self.get_table(), self.num_threads, self.beam_width
+        )
+        self.last_depth = self.depth
+        return [self._choose(state, *row) for state, row in zip(states, zip(scores, popcounts))]
+
+    def _choose(self, state, scores, popcounts):
+        indices = select_actions(state, scores, popcounts, self.occupation_threshold)
         if self.returns_distribution:
             dist = np.zeros(len(state.actions))
             for index in indices:
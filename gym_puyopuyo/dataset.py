@@ -0,0 +1,227 @@
+import sys
+import threading
+
+import numpy as np
+import six
+from gym.utils import seeding
+from six.moves import queue
+
+import puyocore as core
+from gym_puyopuyo.field import TallField
+from gym_puyopuyo.record import BINARY_MAGIC, BinaryRecordReader, infer_deal_and_action, load_stacks
+
+_END = object()
+
+
+class _Failure(object):
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
+def _is_binary(path):
+    with open(path, "rb") as f:
+        return f.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+class RecordDataset(object):
+    """
+    Training batches of (observations, actions, rewards) replayed from game records.
+
+    Sources are paths to binary records, paths to JSON records or open binary record readers.
+    JSON records need a base state to infer the deals from. All the records must share the same rules.
+    Every game is replayed in a single core call on a background thread that keeps up to prefetch batches ready.
+
+    Observations are (deals, field) arrays batched along the first axis like PuyoPuyoEndlessBatchEnv.
+    Actions index the action space of the environments.
+    The games end at their first invalid action which gets a reward of -1.
+    """
+
+    def __init__(self, sources, batch_size, base_state=None, prefetch=4, shuffle=False, drop_last=False, seed=None):
+        if batch_size < 1:
+            raise ValueError("Batch size must be positive")
+        if prefetch < 1:
+            raise ValueError("Need to prefetch at least one batch")
+        self.batch_size = batch_size
+        self.prefetch = prefetch
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.base_state = base_state
+
+        self.sources = []
+        self._games = []
+        self._opened = []
+        for source in sources:
+            if isinstance(source, six.string_types) and _is_binary(source):
+                source = BinaryRecordReader(source)
+                self._opened.append(source)
+            if isinstance(source, BinaryRecordReader):
+                self._set_base_state(source.base_state)
+                self._games.extend((len(self.sources), index) for index in range(len(source)))
+            else:
+                if base_state is None:
+                    raise ValueError("JSON records need a base state")
+                self._games.append((len(self.sources), None))
+            self.sources.append(source)
+        if self.base_state is None:
+            raise ValueError("No records given")
+
+        state = self.base_state
+        if state.has_garbage:
+            raise NotImplementedError("Records with garbage are not supported")
+        self.tall = isinstance(state.field, TallField)
+        self.observation_shapes = (
+            (state.num_colors, state.num_deals, 2),
+            (state.num_colors, state.height, state.width),
+        )
+        self._moves = np.array([state._action_indices[action] for action in state.actions], dtype=np.intc)
+        self._action_numbers = {action: index for index, action in enumerate(state.actions)}
+        self.seed(seed)
+
+    def _set_base_state(self, state):
+        if self.base_state is None:
+            self.base_state = state
+            return
+        base = self.base_state
+        if (state.height, state.width, state.num_colors, state.num_deals, state.tsu_rules) != (
+            base.height, base.width, base.num_colors, base.num_deals, base.tsu_rules
+        ):
+            raise ValueError("All records must share the same rules")
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        return [seed]
+
+    @property
+    def num_games(self):
+        return len(self._games)
+
+    def _load_game(self, source, index):
+        """
+        Return the initial field, the deals in order of appearance and the actions of a game.
+        """
+        if index is not None:
+            record = source[index]
+            return record.snapshots[0].tobytes(), record.deals, record.actions
+
+        state = self.base_state
+        if isinstance(source, six.string_types):
+            with open(source) as f:
+                stacks = load_stacks(f, state)
+        else:
+            stacks = load_stacks(source, state)
+        deals = []
+        actions = []
+        for stack in stacks:
+            deal, action = infer_deal_and_action(state, stack)
+            deals.append(deal)
+            actions.append(self._action_numbers[action])
+        # The deals after the end of the record are unknown so random ones stand in for them.
+        tail = self.np_random.randint(0, state.num_colors, size=(state.num_deals - 1, 2))
+        deals = np.concatenate((np.array(deals, dtype=np.uint8).reshape(-1, 2), tail.astype(np.uint8)))
+        return bytes(state.field.data), deals, np.array(actions, dtype=np.uint8)
+
+    def replay_game(self, source, index=None):
+        """
+        Replay a single game and return its (observations, actions, rewards) arrays.
+        """
+        field, deals, actions = self._load_game(source, index)
+        state = self.base_state
+        num_moves = len(actions)
+        fields = np.empty((num_moves,) + self.observation_shapes[1], dtype=np.int8)
+        rewards = np.empty(num_moves, dtype=np.intc)
+        num_moves = core.replay_game(
+            bytearray(field),
+            state.num_colors,
+            state.width,
+            state.height,
+            self.tall,
+            state.tsu_rules,
+            np.ascontiguousarray(deals[:num_moves], dtype=np.uint8),
+            self._moves[actions],
+            fields,
+            rewards,
+        )
+
+        # Move i sees the deals i to i + num_deals - 1.
+        windows = np.arange(num_moves)[:, None] + np.arange(state.num_deals)
+        colors = deals[windows]
+        encoded = np.zeros((num_moves,) + self.observation_shapes[0], dtype=np.int8)
+        moves = np.arange(num_moves)[:, None, None]
+        slots = np.arange(state.num_deals)[None, :, None]
+        encoded[moves, colors, slots, np.arange(2)] = 1
+        return (encoded, fields[:num_moves]), actions[:num_moves].astype(np.intc), rewards[:num_moves]
+
+    def _batches(self, order, stop):
+        pending = []
+        num_pending = 0
+        for source_index, index in order:
+            if stop.is_set():
+                return
+            (deals, fields), actions, rewards = self.replay_game(self.sources[source_index], index)
+            pending.append((deals, fields, actions, rewards))
+            num_pending += len(actions)
+            if num_pending < self.batch_size:
+                continue
+            arrays = [np.concatenate(parts) for parts in zip(*pending)]
+            if self.shuffle:
+                permutation = self.np_random.permutation(num_pending)
+                arrays = [array[permutation] for array in arrays]
+            start = 0
+            while num_pending - start >= self.batch_size:
+                deals, fields, actions, rewards = [array[start:start + self.batch_size] for array in arrays]
+                yield (deals, fields), actions, rewards
+                start += self.batch_size
+            pending = [tuple(array[start:] for array in arrays)]
+            num_pending -= start
+        if num_pending and not self.drop_last:
+            deals, fields, actions, rewards = [np.concatenate(parts) for parts in zip(*pending)]
+            yield (deals, fields), actions, rewards
+
+    def _produce(self, order, batches, stop):
+        try:
+            for batch in self._batches(order, stop):
+                batches.put(batch)
+                if stop.is_set():
+                    return
+            batches.put(_END)
+        except Exception:
+            batches.put(_Failure(sys.exc_info()))
+
+    def __iter__(self):
+        """
+        Yield ((deals, fields), actions, rewards) batches of one pass over the games.
+
+        The games are visited in a random order when shuffling and the moves are shuffled between nearby games.
+        """
+        order = list(self._games)
+        if self.shuffle:
+            self.np_random.shuffle(order)
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._produce, args=(order, batches, stop))
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is _END:
+                    return
+                if isinstance(batch, _Failure):
+                    six.reraise(*batch.exc_info)
+                yield batch
+        finally:
+            stop.set()
+            # Make room for the producer in case it's blocked on a full queue.
+            while thread.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    pass
+                thread.join(0.01)
+
+    def close(self):
+        """
+        Close the binary records opened from paths.
+        """
+        for source in self._opened:
+            source.close()
@@ -0,0 +1,93 @@
+import numpy as np
+from gym import spaces
+from gym.utils import seeding
+
+import puyocore as core
+from gym_puyopuyo.field import TallField
+from gym_puyopuyo.state import State
+
+
+class PuyoPuyoEndlessBatchEnv(object):
+    """
+    A batch of single player endless mode environments stepped in a single core call.
+
+    The fields are stored in one contiguous array and finished games are reset automatically.
+    Observations are written into preallocated arrays that are reused between steps.
+    """
+
+    def __init__(self, num_envs, height, width, num_colors, num_deals, tsu_rules=False):
+        self.num_envs = num_envs
+        self._template = State(height, width, num_colors, num_deals, tsu_rules=tsu_rules)
+        state = self._template
+        self.tall = isinstance(state.field, TallField)
+        self.reward_range = (-1, state.max_score)
+
+        self.action_space = spaces.Discrete(len(state.actions))
+        self.observation_space = spaces.Tuple((
+            spaces.Box(0, 1, (state.num_colors, state.num_deals, 2), dtype=np.int8),
+            spaces.Box(0, 1, (state.num_colors, state.height, state.width), dtype=np.int8),
+        ))
+
+        self._moves = np.array([state._action_indices[action] for action in state.actions], dtype=np.intc)
+
+        num_words = len(state.field.data) // 8
+        self.fields = np.zeros((num_envs, num_words), dtype=np.uint64)
+        self.deals = np.zeros((num_envs, state.num_deals, 2), dtype=np.uint8)
+        self.rngs = np.zeros(num_envs, dtype=np.uint64)
+        self.observations = (
+            np.zeros((num_envs,) + self.observation_space.spaces[0].shape, dtype=np.int8),
+            np.zeros((num_envs,) + self.observation_space.spaces[1].shape, dtype=np.int8),
+        )
+        self.rewards = np.zeros(num_envs, dtype=np.intc)
+        self.dones = np.zeros(num_envs, dtype=np.bool_)
+        self.seed()
+
+    def _core_args(self):
+        state = self._template
+        return [
+            self.fields,
+            self.deals,
+            self.rngs,
+            self.observations[0],
+            self.observations[1],
+            state.num_colors,
+            state.num_deals,
+            state.width,
+            state.height,
+            self.tall,
+            state.tsu_rules,
+        ]
+
+    def seed(self, seed=None):
+        self.np_random, seed = seeding.np_random(seed)
+        self.rngs[:] = self.np_random.randint(1, 1 << 62, size=self.num_envs)
+        return [seed]
+
+    def reset(self):
+        core.batch_reset(*self._core_args())
+        return self.observations
+
+    def step(self, actions):
+        """
+        Step every environment with the corresponding action.
+
+        Returns (observations, rewards, dones, info) where the arrays are reused between calls.
+        The observations of finished environments are the ones after the automatic reset.
+        """
+        actions = np.asarray(actions)
+        if actions.shape != (self.num_envs,):
+            raise ValueError("Expected {} actions, got shape {}".format(self.num_envs, actions.shape))
+        if actions.dtype.kind not in "iu" or (actions < 0).any() or (actions >= self.action_space.n).any():
+            raise ValueError("Actions must be integers in range({})".format(self.action_space.n))
+        moves = self._moves[actions]
+        core.batch_step(*(self._core_args() + [moves, self.rewards, self.dones]))
+        return self.observations, self.rewards, self.dones, {}
+
+    def get_state(self, index):
+        """
+        Return a copy of the underlying model of the environment at the given index.
+        """
+        state = self._template.clone()
+        state.field.data[:] = self.fields[index].tobytes()
+        state.deals = [tuple(int(c) for c in deal) for deal in self.deals[index]]
+        return state
@@ -9,8 +9,26 @@ from gym import spaces
 from six import StringIO
 
 from gym_puyopuyo.record import read_record
-from gym_puyopuyo.state import State
-from gym_puyopuyo.util import permute
+from gym_puyopuyo.state import State, mirror_permutation
+
+
+def _inverse_permutations(permutations, num_observations, num_colors, np_random):
+    """
+    Return the inverses of the given or randomly drawn (num_observations, num_colors) color permutations.
+
+    Random permutations come from the random module unless a NumPy np_random is given.
+    """
+    if permutations is None:
+        if np_random is not None:
+            return np.argsort(np_random.random_sample((num_observations, num_colors)), axis=1)
+        permutations = [random.sample(range(num_colors), num_colors) for _ in range(num_observations)]
+    return np.argsort(permutations, axis=1)
+
+
+def _random_flips(num_observations, num_deals, np_random):
+    if np_random is not None:
+        return np_random.random_sample((num_observations, num_deals)) < 0.5
+    return [[random.random() < 0.5 for _ in range(num_deals)] for _ in range(num_observations)]
 
 
 class PuyoPuyoEndlessEnv(gym.Env):
@@ -121,25 +139,53 @@ class PuyoPuyoEndlessEnv(gym.Env):
     @classmethod
     def permute_observation(cls, observation):
         """
-        Permute the observation in-place without affecting which action is optimal
+        Permute the observation without affecting which action is optimal
         """
-        deals, colors = observation
-        deals = np.copy(deals)
-        colors = np.copy(colors)
+        deals, colors = cls.permute_observations(tuple(np.asarray(array)[np.newaxis] for array in observation))
+        return (deals[0], colors[0])
 
-        # Flip deals other than the first one as it affects next action
-        for i in range(1, len(deals[0])):
-            if random.random() < 0.5:
-                for color in range(len(deals)):
-                    deals[color][i][0], deals[color][i][1] = deals[color][i][1], deals[color][i][0]
+    @classmethod
+    def permute_observations(cls, observations, permutations=None, flips=None, in_place=False, np_random=None):
+        """
+        Permute the colors of a batch of observations and flip their deals without affecting which action is optimal.
 
-        perm = list(range(len(colors)))
-        random.shuffle(perm)
-        permute(deals, perm)
-        permute(colors, perm)
-        return (deals, colors)
+        The observations are a (deals, field) tuple of arrays with a leading batch axis.
+        Color i of observation b becomes color permutations[b, i] and deal j is flipped where flips[b, j] is set.
+        Missing permutations and flips are drawn from the random module, or from np_random if one is given.
+        The first deal is never flipped as it affects the next action.
+        The result is written back into the observations if in_place is set.
+        """
+        deals, colors = observations
+        num_observations, num_colors, num_deals, _ = deals.shape
+        inverse = _inverse_permutations(permutations, num_observations, num_colors, np_random)
+        if flips is None:
+            flips = _random_flips(num_observations, num_deals, np_random)
+        flips = np.array(flips, dtype=np.intp)
+        flips[:, 0] = 0
+
+        batch = np.arange(num_observations)[:, np.newaxis]
+        permuted_deals = deals[
+            batch[:, :, np.newaxis, np.newaxis],
+            inverse[:, :, np.newaxis, np.newaxis],
+            np.arange(num_deals)[:, np.newaxis],
+            np.arange(2) ^ flips[:, np.newaxis, :, np.newaxis],
+        ]
+        permuted_colors = colors[batch, inverse]
+        if in_place:
+            deals[...] = permuted_deals
+            colors[...] = permuted_colors
+            return observations
+        return (permuted_deals, permuted_colors)
+
+    def mirror_observation(self, observation):
+        """
+        Mirror an observation or a batch of observations horizontally.
 
-    # TODO: Action affecting permutations (mirroring)
+        Returns the mirrored observation and the index of the mirrored counterpart of every action.
+        Chosen actions are remapped with permutation[actions] and policy targets with targets[..., permutation].
+        """
+        deals, colors = observation
+        return (np.copy(deals), colors[..., ::-1].copy()), mirror_permutation(self.state.width)
 
 
 class PuyoPuyoEndlessBoxedEnv(PuyoPuyoEndlessEnv):
@@ -173,8 +219,35 @@ class PuyoPuyoEndlessBoxedEnv(PuyoPuyoEndlessEnv):
 
     @classmethod
     def permute_observation(cls, observation):
-        colors = observation.transpose(2, 0, 1)
-        perm = list(range(len(colors)))
-        random.shuffle(perm)
-        permute(colors, perm)
-        return colors.transpose(1, 2, 0)
+        return cls.permute_observations(np.asarray(observation)[np.newaxis])[0]
+
+    @classmethod
+    def permute_observations(cls, observations, permutations=None, in_place=False, np_random=None):
+        """
+        Permute the colors of a batch of observations without affecting which action is optimal.
+
+        Color i of observation b becomes color permutations[b, i].
+        Missing permutations are drawn from the random module, or from np_random if one is given.
+        The result is written back into the observations if in_place is set.
+        """
+        num_observations, _, _, num_colors = observations.shape
+        inverse = _inverse_permutations(permutations, num_observations, num_colors, np_random)
+        # Whole color planes are gathered at once with the colors moved in front of the rows.
+        colors = observations.transpose(0, 3, 1, 2)
+        permuted = colors[np.arange(num_observations)[:, np.newaxis], inverse].transpose(0, 2, 3, 1)
+        if in_place:
+            observations[...] = permuted
+            return observations
+        return permuted
+
+    def mirror_observation(self, observation):
+        """
+        Mirror the field of an observation or a batch of observations horizontally leaving the deals in place.
+
+        Returns the mirrored observation and the index of the mirrored counterpart of every action.
+        """
+        observation = np.asarray(observation)
+        mirrored = observation.copy()
+        start = self.state.num_deals + 1
+        mirrored[..., start:, :, :] = observation[..., start:, ::-1, :]
+        return mirrored, mirror_permutation(self.state.width)
@@ -0,0 +1,272 @@
+import multiprocessing
+import traceback
+
+import numpy as np
+from gym.utils import seeding
+
+from gym_puyopuyo.env.versus import PuyoPuyoVersusEnv
+
+# Integer observation entries of each player. The arrays are stored alongside deals and field.
+SCALAR_KEYS = ("chain_number", "pending_score", "pending_garbage", "all_clear")
+
+
+def _get_context():
+    # Opponents hold unpicklable search tables so the workers are forked when the platform allows it.
+    if hasattr(multiprocessing, "get_context"):
+        if "fork" in multiprocessing.get_all_start_methods():
+            return multiprocessing.get_context("fork")
+    return multiprocessing
+
+
+class _SharedArrays(object):
+    """
+    NumPy arrays backed by shared memory that survive being sent to a worker process.
+    """
+
+    def __init__(self, context, specs):
+        self.specs = specs
+        self.buffers = {}
+        for name, (shape, dtype) in specs.items():
+            size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+            self.buffers[name] = context.RawArray("b", max(size, 1))
+        self.attach()
+
+    def attach(self):
+        self.arrays = {}
+        for name, (shape, dtype) in self.specs.items():
+            count = int(np.prod(shape))
+            self.arrays[name] = np.frombuffer(self.buffers[name], dtype=dtype, count=count).reshape(shape)
+
+    def __getstate__(self):
+        return {"specs": self.specs, "buffers": self.buffers}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.attach()
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+
+def _write_observation(shared, index, env):
+    for p, player in enumerate(env.state.players):
+        player.encode_deals(out=shared["deals"][index, p])
+        player.encode_field(out=shared["field"][index, p])
+        shared["chain_number"][index, p] = player.chain_number
+        shared["pending_score"][index, p] = player.chain_score + player.step_score
+        shared["pending_garbage"][index, p] = player.pending_garbage
+        shared["all_clear"][index, p] = player.all_clear_pending
+    shared["action_masks"][index] = env.get_action_mask()
+
+
+def _worker(pipe, parent_pipe, shared, start, stop, opponent, state_params, garbage_clue_weight):
+    """
+    Serve the commands of the parent answering each with ("ok", result) or ("error", traceback).
+
+    After an error the games may be inconsistent so every later command is answered with the same error.
+    """
+    parent_pipe.close()
+    error = None
+    try:
+        envs = [PuyoPuyoVersusEnv(opponent, state_params, garbage_clue_weight) for _ in range(start, stop)]
+    except Exception:
+        error = traceback.format_exc()
+    opponent_actions = None
+    try:
+        while True:
+            command, data = pipe.recv()
+            if command == "close":
+                break
+            if error is not None:
+                pipe.send(("error", error))
+                continue
+            try:
+                result = None
+                if command == "step":
+                    if opponent_actions is None:
+                        opponent_actions = [env.get_opponent_action() for env in envs]
+                    for index, (env, opponent_action) in enumerate(zip(envs, opponent_actions), start):
+                        reward, done = env.play(shared["actions"][index], opponent_action)
+                        if done:
+                            env.state.reset()
+                        shared["rewards"][index] = reward
+                        shared["dones"][index] = done
+                        _write_observation(shared, index, env)
+                elif command == "reset":
+                    for index, env in enumerate(envs, start):
+                        env.state.reset()
+                        _write_observation(shared, index, env)
+                elif command == "seed":
+                    result = [env.seed(seed)[0] for env, seed in zip(envs, data)]
+                elif command == "games":
+                    result = [env.state for env in envs]
+                else:
+                    raise ValueError("Unknown command {}".format(command))
+            except Exception:
+                error = traceback.format_exc()
+                pipe.send(("error", error))
+                continue
+            pipe.send(("ok", result))
+            # Search the opponents' next moves while the learner decides on its own.
+            # A failure here is reported as the answer to the next command.
+            try:
+                if command in ("step", "reset"):
+                    opponent_actions = [env.get_opponent_action() for env in envs]
+                elif command == "seed":
+                    opponent_actions = None
+            except Exception:
+                error = traceback.format_exc()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipe.close()
+
+
+class PuyoPuyoVersusVectorEnv(object):
+    """
+    A batch of versus mode environments spread over worker processes.
+
+    Every worker owns a slice of the games and writes their observations into shared memory
+    so that only short commands travel through the pipes. Finished games are reset automatically.
+    The workers search the opponents' next moves while waiting for the learner's actions.
+    """
+
+    def __init__(self, num_envs, opponent, state_params, garbage_clue_weight=0, num_workers=None):
+        self.num_envs = num_envs
+        template = PuyoPuyoVersusEnv(opponent, state_params, garbage_clue_weight)
+        self.observation_space = template.observation_space
+        self.action_space = template.action_space
+        self.reward_range = template.reward_range
+        self.num_players = len(template.state.players)
+
+        player_space = self.observation_space.spaces[0].spaces
+        batch_shape = (num_envs, self.num_players)
+        specs = {
+            "deals": (batch_shape + player_space["deals"].shape, np.int8),
+            "field": (batch_shape + player_space["field"].shape, np.int8),
+            "chain_number": (batch_shape, np.int64),
+            "pending_score": (batch_shape, np.int64),
+            "pending_garbage": (batch_shape, np.int64),
+            "all_clear": (batch_shape, np.int8),
+            "actions": ((num_envs,), np.intc),
+            "rewards": ((num_envs,), np.float64),
+            "dones": ((num_envs,), np.bool_),
+            "action_masks": ((num_envs, self.action_space.n), np.float64),
+        }
+        context = _get_context()
+        self._shared = _SharedArrays(context, specs)
+        self.observations = tuple(
+            {key: self._shared[key][:, p] for key in ("deals", "field") + SCALAR_KEYS}
+            for p in range(self.num_players)
+        )
+        self.rewards = self._shared["rewards"]
+        self.dones = self._shared["dones"]
+
+        if num_workers is None:
+            num_workers = context.cpu_count()
+        num_workers = max(1, min(num_workers, num_envs))
+        bounds = np.linspace(0, num_envs, num_workers + 1).astype(int)
+        self._slices = list(zip(bounds[:-1], bounds[1:]))
+
+        self._pipes = []
+        self._processes = []
+        for start, stop in self._slices:
+            pipe, child_pipe = context.Pipe()
+            process = context.Process(
+                target=_worker,
+                args=(child_pipe, pipe, self._shared, start, stop, opponent, state_params, garbage_clue_weight),
+            )
+            process.daemon = True
+            process.start()
+            child_pipe.close()
+            self._pipes.append(pipe)
+            self._processes.append(process)
+        self.waiting = False
+        self.closed = False
+        self.seed()
+
+    def _broadcast(self, command, data=None):
+        for pipe in self._pipes:
+            pipe.send((command, data))
+
+    def _gather(self):
+        """
+        Collect the answers of every worker and re-raise the first error among them.
+        """
+        results = [pipe.recv() for pipe in self._pipes]
+        for status, data in results:
+            if status == "error":
+                raise RuntimeError("Worker failed with:\n{}".format(data))
+        return [data for _, data in results]
+
+    def seed(self, seed=None):
+        """
+        Seed every game with its own seed derived from the given one.
+        """
+        np_random, seed = seeding.np_random(seed)
+        seeds = np_random.randint(0, 1 << 31, size=self.num_envs).tolist()
+        for pipe, (start, stop) in zip(self._pipes, self._slices):
+            pipe.send(("seed", seeds[start:stop]))
+        return sum(self._gather(), [])
+
+    def reset(self):
+        self._broadcast("reset")
+        self._gather()
+        return self.observations
+
+    def step_async(self, actions):
+        """
+        Start stepping every environment with the corresponding action.
+        """
+        if self.waiting:
+            raise RuntimeError("Already waiting for a step to finish")
+        self._shared["actions"][:] = actions
+        self._broadcast("step")
+        self.waiting = True
+
+    def step_wait(self):
+        """
+        Wait for the step started by step_async to finish.
+
+        Returns (observations, rewards, dones, info) where the arrays are reused between calls.
+        The observations of finished environments are the ones after the automatic reset.
+        """
+        if not self.waiting:
+            raise RuntimeError("No step in progress")
+        self.waiting = False
+        self._gather()
+        return self.observations, self.rewards, self.dones, {}
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def get_action_masks(self):
+        """
+        Return the (num_envs, num_actions) action masks of the current observations.
+        """
+        return self._shared["action_masks"]
+
+    def get_games(self):
+        """
+        Return copies of the underlying models of all the environments.
+        """
+        if self.waiting:
+            self.step_wait()
+        self._broadcast("games")
+        return sum(self._gather(), [])
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self.waiting = False
+            # The answers only need draining. Errors were the caller's to collect with step_wait.
+            for pipe in self._pipes:
+                pipe.recv()
+        self._broadcast("close")
+        for process in self._processes:
+            process.join()
+        for pipe in self._pipes:
+            pipe.close()
+        self.closed = True
@@ -117,15 +117,29 @@ class PuyoPuyoVersusEnv(gym.Env):
         if mode == "ansi":
             return outfile
 
-    def step(self, action):
-        self.last_actions[0] = action
+    def get_opponent_action(self):
+        """
+        Let the opponent choose its next action. The opponent sees itself as the first player.
+        """
         root = self.get_root()
         root.players = root.players[::-1]
-        opponent_action = self.opponent(root)
+        return self.opponent(root)
+
+    def play(self, action, opponent_action):
+        """
+        Advance the game by one step without encoding the observation. Returns (reward, done).
+        """
+        self.last_actions[0] = action
         self.last_actions[1] = opponent_action
         acts = self.player.actions
         reward, garbage, done = self.state.step([acts[action], acts[opponent_action]])
         reward += self.garbage_clue_weight * garbage
+        return reward, done
+
+    def step(self, action, opponent_action=None):
+        if opponent_action is None:
+            opponent_action = self.get_opponent_action()
+        reward, done = self.play(action, opponent_action)
         observation = self.state.encode()
         return observation, reward, done, {"state": self.state}
 
@@ -198,6 +212,6 @@ class PuyoPuyoVersusBoxedEnv(PuyoPuyoVersusEnv):
         super(PuyoPuyoVersusBoxedEnv, self).reset()
         return self.encode()
 
-    def step(self, action):
-        _, reward, done, info = super(PuyoPuyoVersusBoxedEnv, self).step(action)
+    def step(self, action, opponent_action=None):
+        _, reward, done, info = super(PuyoPuyoVersusBoxedEnv, self).step(action, opponent_action)
         return self.encode(), reward, done, info
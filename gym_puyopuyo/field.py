@@ -14,6 +14,8 @@ class BottomField(object):
     HEIGHT = 8
     CLEAR_THRESHOLD = 4
 
+    __slots__ = ("num_layers", "has_garbage", "offset", "num_colors", "data")
+
     def __init__(self, num_layers, has_garbage=False):
         self.num_layers = num_layers
         self.has_garbage = has_garbage
@@ -27,6 +29,15 @@ class BottomField(object):
     def reset(self):
         self.data = bytearray(8 * self.num_layers)
 
+    def clone(self):
+        clone = BottomField.__new__(BottomField)
+        clone.num_layers = self.num_layers
+        clone.has_garbage = self.has_garbage
+        clone.offset = self.offset
+        clone.num_colors = self.num_colors
+        clone.data = bytearray(self.data)
+        return clone
+
     def render(self, outfile=sys.stdout, width=None, height=None, in_place=False):
         height = height or self.HEIGHT
         width = width or self.WIDTH
@@ -74,27 +85,29 @@ class BottomField(object):
         layer = BottomField.from_list(stack, num_layers=self.num_layers)
         if layer.num_layers > self.num_layers:
             raise ValueError("Overlay has too many layers")
-        mask = bytearray(8)
-        for i, mine in enumerate(self.data):
-            mask[i % 8] |= mine
-        for i, (mine, yours) in enumerate(zip(self.data, layer.data)):
-            self.data[i] = (mine | (yours & ~mask[i % 8]))
+        core.overlay(self.data, layer.data, self.num_layers, 1)
+
+    def encode(self, width=None, height=None, out=None):
+        """
+        Encode the bottom rows of the field as a (num_layers, height, width) int8 array.
 
-    def encode(self):
-        data = core.bottom_encode(self.data, self.num_layers)
-        return np.fromstring(data, dtype=np.int8).reshape(self.num_layers, self.HEIGHT, self.WIDTH)
+        The encoding is written directly into out if given.
+        """
+        width = width or self.WIDTH
+        height = height or self.HEIGHT
+        if out is None:
+            out = np.empty((self.num_layers, height, width), dtype=np.int8)
+        core.bottom_encode_into(self.data, self.num_layers, width, height, out)
+        return out
 
-    def mirror(self):
-        core.mirror(self.data, self.num_layers)
+    def mirror(self, width=None):
+        """
+        Flip the leftmost width columns of the field horizontally.
+        """
+        core.mirror(self.data, self.num_layers, width or self.WIDTH)
 
     def shift(self, amount):
-        if amount > 0:
-            for i in range(len(self.data)):
-                self.data[i] <<= amount
-        elif amount < 0:
-            amount = -amount
-            for i in range(len(self.data)):
-                self.data[i] >>= amount
+        core.shift(self.data, self.num_layers, amount)
 
     def _valid_moves(self, width=None):
         return core.bottom_valid_moves(self.data, self.num_layers)
@@ -159,6 +172,8 @@ class TallField(object):
     HEIGHT = 16
     CLEAR_THRESHOLD = 4
 
+    __slots__ = ("num_layers", "tsu_rules", "has_garbage", "offset", "num_colors", "data")
+
     def __init__(self, num_layers, tsu_rules=False, has_garbage=False):
         if has_garbage:
             self.num_colors = num_layers - 1
@@ -173,6 +188,16 @@ class TallField(object):
     def reset(self):
         self.data = bytearray(16 * self.num_layers)
 
+    def clone(self):
+        clone = TallField.__new__(TallField)
+        clone.num_layers = self.num_layers
+        clone.tsu_rules = self.tsu_rules
+        clone.has_garbage = self.has_garbage
+        clone.offset = self.offset
+        clone.num_colors = self.num_colors
+        clone.data = bytearray(self.data)
+        return clone
+
     def render(self, outfile=sys.stdout, width=None, height=None, in_place=False):
         height = height or self.HEIGHT
         width = width or self.WIDTH
@@ -218,37 +243,33 @@ class TallField(object):
     def resolve(self):
         return core.tall_resolve(self.data, self.num_layers, self.tsu_rules, self.has_garbage)
 
-    def encode(self):
-        data = core.tall_encode(self.data, self.num_layers)
-        return np.fromstring(data, dtype=np.int8).reshape(self.num_layers, self.HEIGHT, self.WIDTH)
+    def encode(self, width=None, height=None, out=None):
+        """
+        Encode the bottom rows of the field as a (num_layers, height, width) int8 array.
+
+        The encoding is written directly into out if given.
+        """
+        width = width or self.WIDTH
+        height = height or self.HEIGHT
+        if out is None:
+            out = np.empty((self.num_layers, height, width), dtype=np.int8)
+        core.tall_encode_into(self.data, self.num_layers, width, height, out)
+        return out
 
     def overlay(self, stack):
         layer = TallField.from_list(stack, num_layers=self.num_layers)
         if layer.num_layers > self.num_layers:
             raise ValueError("Overlay has too many layers")
-        top_mask = bytearray(8)
-        bottom_mask = bytearray(8)
-        half = 8 * self.num_layers
-        for i, mine in enumerate(self.data[:half]):
-            top_mask[i % 8] |= mine
-        for i, mine in enumerate(self.data[half:]):
-            bottom_mask[i % 8] |= mine
-        for i, (mine, yours) in enumerate(zip(self.data[:half], layer.data[:half])):
-            self.data[i] = (mine | (yours & ~top_mask[i % 8]))
-        for i, (mine, yours) in enumerate(zip(self.data[half:], layer.data[half:])):
-            self.data[i + half] = (mine | (yours & ~bottom_mask[i % 8]))
-
-    def mirror(self):
-        core.mirror(self.data, 2 * self.num_layers)
+        core.overlay(self.data, layer.data, self.num_layers, 2)
+
+    def mirror(self, width=None):
+        """
+        Flip the leftmost width columns of the field horizontally.
+        """
+        core.mirror(self.data, 2 * self.num_layers, width or self.WIDTH)
 
     def shift(self, amount):
-        if amount > 0:
-            for i in range(len(self.data)):
-                self.data[i] <<= amount
-        elif amount < 0:
-            amount = -amount
-            for i in range(len(self.data)):
-                self.data[i] >>= amount
+        core.shift(self.data, 2 * self.num_layers, amount)
 
     def _valid_moves(self, width):
         return core.tall_valid_moves(self.data, self.num_layers, width, self.tsu_rules)
@@ -318,3 +339,14 @@ class TallField(object):
                 row %= 8
                 instance.data[row + 8 * puyo + 8 * num_layers * offset] |= 1 << column
         return instance
+
+
+def mirror_fields(fields, width=BottomField.WIDTH):
+    """
+    Flip a batch of fields horizontally in place like the mirror methods of the fields.
+
+    The fields are given as a C-contiguous uint64 array of their words such as the one of the batch environments.
+    Fields of either type can be mirrored.
+    """
+    core.mirror_many(fields, width)
+    return fields
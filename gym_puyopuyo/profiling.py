@@ -0,0 +1,116 @@
+import functools
+import threading
+import time
+import timeit
+from collections import defaultdict
+from contextlib import contextmanager
+
+import puyocore as core
+from gym_puyopuyo.agent import BaseTreeSearchAgent
+from gym_puyopuyo.env.endless import PuyoPuyoEndlessEnv
+from gym_puyopuyo.env.versus import PuyoPuyoVersusEnv
+from gym_puyopuyo.field import BottomField, TallField
+from gym_puyopuyo.state import State
+from gym_puyopuyo.versus import Game, VersusState
+
+if hasattr(time, "perf_counter_ns"):
+    _now = time.perf_counter_ns
+else:
+    def _now():
+        return int(timeit.default_timer() * 1e9)
+
+# Methods timed while profiling and the phases they are accounted under.
+PHASES = (
+    (PuyoPuyoEndlessEnv, "step", "env.step"),
+    (PuyoPuyoVersusEnv, "step", "env.step"),
+    (PuyoPuyoVersusEnv, "get_opponent_action", "opponent"),
+    (State, "step", "step"),
+    (VersusState, "step", "versus.step"),
+    (Game, "step", "game.step"),
+    (State, "validate_action", "validate"),
+    (State, "get_action_mask", "action_mask"),
+    (VersusState, "get_action_mask", "action_mask"),
+    (State, "play_deal", "move"),
+    (State, "add_garbage", "garbage"),
+    (BottomField, "resolve", "resolve"),
+    (TallField, "resolve", "resolve"),
+    (BottomField, "handle_gravity", "gravity"),
+    (TallField, "handle_gravity", "gravity"),
+    (BottomField, "clear_groups", "clear"),
+    (TallField, "clear_groups", "clear"),
+    (State, "encode", "encode"),
+    (VersusState, "encode", "encode"),
+    (Game, "encode", "encode"),
+    (State, "encode_deals", "encode_deals"),
+    (State, "encode_field", "encode_field"),
+    (State, "render", "render"),
+    (VersusState, "render", "render"),
+    (Game, "render", "render"),
+    (BaseTreeSearchAgent, "get_action", "search"),
+    (BaseTreeSearchAgent, "get_actions", "search"),
+)
+
+_active = None
+_running = threading.local()
+
+
+class Profile(object):
+    """
+    Call counts and nanosecond timings per phase together with the work counters of the tree searches.
+
+    Timings include the phases nested inside. A phase nested inside itself is only counted once.
+    """
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.times = defaultdict(int)
+        self.search = {}
+
+    def to_dict(self):
+        phases = {phase: {"calls": self.calls[phase], "ns": self.times[phase]} for phase in self.calls}
+        return {"phases": phases, "search": dict(self.search)}
+
+
+def _timed(function, phase, profile):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        phases = _running.__dict__.setdefault("phases", set())
+        if phase in phases:
+            return function(*args, **kwargs)
+        phases.add(phase)
+        start = _now()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.times[phase] += _now() - start
+            profile.calls[phase] += 1
+            phases.discard(phase)
+    return wrapper
+
+
+@contextmanager
+def profile():
+    """
+    Profile the stepping, encoding, rendering and searching done inside the block.
+
+    The timed methods are only swapped in for the duration of the block so profiling costs nothing otherwise.
+    Only the calling process is profiled. Yields the Profile that accumulates the results.
+    """
+    global _active
+    if _active is not None:
+        raise RuntimeError("Already profiling")
+    _active = Profile()
+    originals = []
+    for owner, name, phase in PHASES:
+        function = owner.__dict__[name]
+        originals.append((owner, name, function))
+        setattr(owner, name, _timed(function, phase, _active))
+    core.set_search_counting(True)
+    try:
+        yield _active
+    finally:
+        core.set_search_counting(False)
+        _active.search = core.get_search_counters()
+        for owner, name, function in originals:
+            setattr(owner, name, function)
+        _active = None
@@ -1,11 +1,16 @@
 from __future__ import unicode_literals
 
 import json
+import mmap
+import struct
 from collections import deque
 from random import random
 
+import numpy as np
 import six
 
+from gym_puyopuyo.state import State
+
 
 def write_record(file, initial_state, actions):
     """
@@ -52,24 +57,38 @@ def infer_deal_and_action(state, stack):
     return deal, (x, orientation)
 
 
-def read_record(file, base_state, include_last=False):
+def load_stacks(file, base_state):
+    """
+    Load the deal stacks of a JSON record padded to the full field width.
+    """
     if isinstance(file, six.string_types):
         stacks = json.loads(file)
     else:
         stacks = json.load(file)
     if not stacks:
-        return
+        return []
     if len(stacks[0]) % base_state.width != 0:
         raise ValueError("Invalid record for width {}".format(base_state.width))
     if len(stacks[0]) != base_state.width * 2:
         raise NotImplementedError("Only height 2 stacks supported")
 
+    width = base_state.width
+    padding = [None] * (base_state.field.WIDTH - width)
+    result = []
+    for stack in stacks:
+        stack = [None if p == 0 else p - 1 for p in stack]
+        result.append(stack[:width] + padding + stack[width:] + padding)
+    return result
+
+
+def read_record(file, base_state, include_last=False):
+    stacks = load_stacks(file, base_state)
+    if not stacks:
+        return
+
     state = base_state.clone()
-    padding = [None] * (state.field.WIDTH - state.width)
     delayed = deque(maxlen=state.num_deals)
     for stack in stacks:
-        stack = [None if p == 0 else p - 1 for p in stack]
-        stack = stack[:state.width] + padding + stack[state.width:] + padding
         delayed.append(infer_deal_and_action(state, stack))
         if len(delayed) == state.num_deals:
             clone = state.clone()
@@ -90,3 +109,199 @@ def read_record(file, base_state, include_last=False):
 
     if include_last:
         yield state, None, None
+
+
+# Binary records
+#
+# File header: magic, version, height, width, number of colors, number of deals, tsu rules, checkpoint interval
+# Games: number of moves, number of deals, number of checkpoints, deals (one byte each), action indices (one byte each),
+#        padding to 8 bytes, field snapshots before the first move and every checkpoint interval of moves
+# Footer: offsets of the games followed by the offset of the index, the number of games and an end marker
+BINARY_MAGIC = b"PUYOREC\x00"
+BINARY_END = b"PUYOIDX\x00"
+BINARY_VERSION = 1
+_FILE_HEADER = struct.Struct("<8sHBBBBBxI")
+_GAME_HEADER = struct.Struct("<III")
+_FOOTER = struct.Struct("<QQ8s")
+
+
+def _padding(size):
+    return -size % 8
+
+
+class BinaryRecordWriter(object):
+    """
+    Write games of the same rules into a compact binary file that can be read back with random access.
+
+    Field snapshots are stored every checkpoint_interval moves so that any move can be reached quickly.
+    An interval of zero only stores the initial field.
+    The index of the games is written when the writer is closed.
+    """
+
+    def __init__(self, file, height, width, num_colors, num_deals, tsu_rules=False, checkpoint_interval=32):
+        if isinstance(file, six.string_types):
+            file = open(file, "wb")
+        self.file = file
+        self.base_state = State(height, width, num_colors, num_deals, tsu_rules=tsu_rules)
+        self.checkpoint_interval = checkpoint_interval
+        self.offsets = []
+        self.file.write(_FILE_HEADER.pack(
+            BINARY_MAGIC, BINARY_VERSION, height, width, num_colors, num_deals, tsu_rules, checkpoint_interval
+        ))
+        self.position = _FILE_HEADER.size
+
+    def write_game(self, initial_state, actions):
+        """
+        Replay the actions from the initial state and record the deals and the fields along the way.
+
+        New deals are drawn from a copy of the random state of the initial state.
+        The game ends at the first invalid action which is still recorded.
+        """
+        state = initial_state.clone()
+        state.np_random = np.random.RandomState()
+        state.np_random.set_state(initial_state.np_random.get_state())
+        # The deal played by each move followed by the ones still visible at the end.
+        deals = []
+        indices = []
+        snapshots = [bytes(state.field.data)]
+        for i, action in enumerate(actions):
+            if not isinstance(action, int):
+                action = state.actions.index(tuple(action))
+            if self.checkpoint_interval and i and i % self.checkpoint_interval == 0:
+                snapshots.append(bytes(state.field.data))
+            indices.append(action)
+            deal = state.deals[0] if state.deals else None
+            if state.step(*state.actions[action]) < 0:
+                break
+            deals.append(deal)
+        deals.extend(state.deals)
+
+        body = bytearray(_GAME_HEADER.pack(len(indices), len(deals), len(snapshots)))
+        body.extend(a | (b << 4) for a, b in deals)
+        body.extend(indices)
+        body.extend(bytearray(_padding(self.position + len(body))))
+        for snapshot in snapshots:
+            body.extend(snapshot)
+
+        self.offsets.append(self.position)
+        self.file.write(body)
+        self.position += len(body)
+
+    def close(self):
+        index = np.array(self.offsets, dtype="<u8")
+        self.file.write(index.tobytes())
+        self.file.write(_FOOTER.pack(self.position, len(self.offsets), BINARY_END))
+        self.file.close()
+
+
+class GameRecord(object):
+    """
+    A single game of a binary record.
+    """
+
+    def __init__(self, reader, deals, actions, snapshots):
+        self.reader = reader
+        # The deals visible before move i are deals[i:i + num_deals].
+        self.deals = deals
+        self.actions = actions
+        self.snapshots = snapshots
+
+    def __len__(self):
+        return len(self.actions)
+
+    def _replay_to(self, move):
+        """
+        Return the state before the given move with all the remaining deals. Stepping it doesn't make new deals.
+        """
+        if move < 0 or move > len(self.actions):
+            raise IndexError("Move out of range")
+        state = self.reader.base_state.clone()
+        interval = self.reader.checkpoint_interval
+        checkpoint = min(move // interval, len(self.snapshots) - 1) if interval else 0
+        state.field.data[:] = self.snapshots[checkpoint].tobytes()
+        start = checkpoint * interval
+        state.num_deals = None
+        state.deals = [(int(a), int(b)) for a, b in self.deals[start:]]
+        for action in self.actions[start:move]:
+            state.step(*state.actions[action])
+        return state
+
+    def _visible(self, state):
+        clone = state.clone()
+        clone.num_deals = self.reader.base_state.num_deals
+        clone.deals = clone.deals[:clone.num_deals]
+        return clone
+
+    def get_state(self, move):
+        """
+        Return the state before the given move by replaying from the latest checkpoint.
+        """
+        return self._visible(self._replay_to(move))
+
+    def replay(self, include_last=False):
+        """
+        Yield (state, action, reward) for every move like read_record does.
+        """
+        state = self._replay_to(0)
+        for index in self.actions:
+            clone = self._visible(state)
+            action = state.actions[index]
+            reward = state.step(*action)
+            yield clone, action, reward
+        if include_last:
+            yield self._visible(state), None, None
+
+
+class BinaryRecordReader(object):
+    """
+    Random access to the games of a binary record through a memory map.
+    """
+
+    def __init__(self, file):
+        if isinstance(file, six.string_types):
+            file = open(file, "rb")
+        self.file = file
+        self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (
+            magic, version, height, width, num_colors, num_deals, tsu_rules, self.checkpoint_interval
+        ) = _FILE_HEADER.unpack_from(self.map, 0)
+        if magic != BINARY_MAGIC:
+            raise ValueError("Not a binary record")
+        if version != BINARY_VERSION:
+            raise NotImplementedError("Unsupported record version {}".format(version))
+        index_offset, num_games, end = _FOOTER.unpack_from(self.map, len(self.map) - _FOOTER.size)
+        if end != BINARY_END:
+            raise ValueError("Incomplete binary record")
+        self.base_state = State(height, width, num_colors, num_deals, tsu_rules=bool(tsu_rules))
+        self.field_size = len(self.base_state.field.data)
+        # The arrays are views of the memory map instead of copies.
+        self.offsets = np.frombuffer(self.map, dtype="<u8", count=num_games, offset=index_offset)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        offset = int(self.offsets[index])
+        num_moves, num_deals, num_snapshots = _GAME_HEADER.unpack_from(self.map, offset)
+        offset += _GAME_HEADER.size
+        packed = np.frombuffer(self.map, dtype=np.uint8, count=num_deals, offset=offset)
+        deals = np.stack((packed & 15, packed >> 4), axis=-1)
+        offset += num_deals
+        actions = np.frombuffer(self.map, dtype=np.uint8, count=num_moves, offset=offset)
+        offset += num_moves
+        offset += _padding(offset)
+        snapshots = np.frombuffer(self.map, dtype=np.uint8, count=num_snapshots * self.field_size, offset=offset)
+        return GameRecord(self, deals, actions, snapshots.reshape(num_snapshots, -1))
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def close(self):
+        self.offsets = None
+        try:
+            self.map.close()
+        except BufferError:
+            # Records still hold views of the map. It's unmapped once they're released.
+            pass
+        self.file.close()
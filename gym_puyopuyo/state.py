@@ -5,15 +5,96 @@ import sys
 import numpy as np
 from gym.utils import seeding
 
+import puyocore as core
 from gym_puyopuyo import util
 from gym_puyopuyo.field import BottomField, TallField
 
 ALLOWED_HEIGHTS = (BottomField.HEIGHT, TallField.HEIGHT, 13)
 
+_action_tables = {}
+_mirror_permutations = {}
+
+
+def _clone_random():
+    """
+    Return a freshly seeded generator for a clone.
+
+    Backing the legacy interface with PCG64 avoids most of the cost of seeding a Mersenne Twister where it's available.
+    """
+    if hasattr(np.random, "PCG64"):
+        return np.random.RandomState(np.random.PCG64())
+    return np.random.RandomState()
+
+
+def _make_action_tables(width, field_width):
+    """
+    Build the action tables shared by all states of the given width.
+
+    Returns (actions, validation actions, validation index of each action, validation bit of each action).
+    The tables are shared so the sequences are tuples and the array is read-only.
+    """
+    actions = []
+    for x in range(width):
+        actions.append((x, 1))
+        actions.append((x, 3))
+    for x in range(width - 1):
+        actions.append((x, 0))
+        actions.append((x, 2))
+
+    validation_actions = []
+    for x in range(field_width - 1):
+        validation_actions.append((x, 0))
+    for x in range(field_width):
+        validation_actions.append((x, 1))
+    for x in range(field_width - 1):
+        validation_actions.append((x, 2))
+    for x in range(field_width):
+        validation_actions.append((x, 3))
+
+    action_indices = {action: index for index, action in enumerate(validation_actions)}
+    mask_indices = np.array([action_indices[(x, orientation % 2)] for x, orientation in actions])
+    mask_indices.flags.writeable = False
+    return tuple(actions), tuple(validation_actions), action_indices, mask_indices
+
+
+def mirror_permutation(width):
+    """
+    Return the index of the mirrored counterpart of every action of a state of the given width.
+
+    Mirroring is its own inverse so the same array maps actions both ways.
+    """
+    if width not in _mirror_permutations:
+        actions = _make_action_tables(width, width)[0]
+        indices = {action: index for index, action in enumerate(actions)}
+        permutation = []
+        for x, orientation in actions:
+            if orientation % 2:
+                permutation.append(indices[(width - 1 - x, orientation)])
+            else:
+                permutation.append(indices[(width - 2 - x, (orientation + 2) % 4)])
+        permutation = np.array(permutation, dtype=np.intp)
+        permutation.flags.writeable = False
+        _mirror_permutations[width] = permutation
+    return _mirror_permutations[width]
+
 
 class State(object):
     TESTING = False
 
+    __slots__ = (
+        "field",
+        "width",
+        "height",
+        "num_deals",
+        "garbage_x",
+        "actions",
+        "_validation_actions",
+        "_action_indices",
+        "_mask_indices",
+        "_np_random",
+        "deals",
+    )
+
     def __init__(
         self,
         height,
@@ -78,8 +159,19 @@ class State(object):
         else:
             return 10 * self.width * self.height * 999 * self.max_chain  # FIXME: This overshoots a lot
 
+    @property
+    def np_random(self):
+        # Clones only seed a generator of their own once they draw a deal because seeding is costly.
+        if self._np_random is None:
+            self._np_random = _clone_random()
+        return self._np_random
+
+    @np_random.setter
+    def np_random(self, value):
+        self._np_random = value
+
     def seed(self, seed=None):
-        self.np_random, seed = seeding.np_random(seed)
+        self._np_random, seed = seeding.np_random(seed)
         return seed
 
     def reset(self):
@@ -107,23 +199,15 @@ class State(object):
         outfile.flush()
 
     def make_actions(self):
-        self.actions = []
-        for x in range(self.width):
-            self.actions.append((x, 1))
-            self.actions.append((x, 3))
-        for x in range(self.width - 1):
-            self.actions.append((x, 0))
-            self.actions.append((x, 2))
-
-        self._validation_actions = []
-        for x in range(self.field.WIDTH - 1):
-            self._validation_actions.append((x, 0))
-        for x in range(self.field.WIDTH):
-            self._validation_actions.append((x, 1))
-        for x in range(self.field.WIDTH - 1):
-            self._validation_actions.append((x, 2))
-        for x in range(self.field.WIDTH):
-            self._validation_actions.append((x, 3))
+        key = (self.width, type(self.field))
+        if key not in _action_tables:
+            _action_tables[key] = _make_action_tables(self.width, self.field.WIDTH)
+        (
+            self.actions,
+            self._validation_actions,
+            self._action_indices,
+            self._mask_indices,
+        ) = _action_tables[key]
 
     def make_deals(self):
         self.deals = []
@@ -143,28 +227,22 @@ class State(object):
             raise ValueError("This state doesn't support garbage")
         if amount < 0:
             raise ValueError("Cannot add negative amount of garbage")
-        garbage = self.field.num_colors
-        stack = []
-        while amount:
-            line = [None] * self.field.WIDTH
-            while self.garbage_x < self.width and amount:
-                line[self.garbage_x] = garbage
-                self.garbage_x += 1
-                amount -= 1
-            if self.garbage_x >= self.width:
-                self.garbage_x = 0
-            stack = line + stack
-        if len(stack) > self.field.WIDTH * self.field.HEIGHT:
-            stack = [garbage] * (self.field.WIDTH * self.field.HEIGHT)
-        self.field.overlay(stack)
-        self.field.handle_gravity()
-
-    def encode_deals(self):
-        np_deals = np.zeros((self.num_colors, self.num_deals, 2))
-        for i, deal in enumerate(self.deals):
-            np_deals[deal[0]][i][0] = 1
-            np_deals[deal[1]][i][1] = 1
-        return np_deals
+        tall = isinstance(self.field, TallField)
+        self.garbage_x = core.drop_garbage(self.field.data, self.num_layers, tall, self.width, self.garbage_x, amount)
+
+    def encode_deals(self, out=None):
+        """
+        Encode deals as a (num_colors, num_deals, 2) array. The encoding is written in place if out is given.
+        """
+        if out is None:
+            out = np.zeros((self.num_colors, self.num_deals, 2))
+        else:
+            out.fill(0)
+        # Scalar writes keep the in place path free of temporary arrays.
+        for i, (puyo_a, puyo_b) in enumerate(self.deals):
+            out[puyo_a, i, 0] = 1
+            out[puyo_b, i, 1] = 1
+        return out
 
     def encode_deals_box(self):
         """
@@ -176,16 +254,22 @@ class State(object):
             box[deal[1]][self.num_deals - 1 - i][1] = 1
         return box
 
-    def encode_field(self):
-        np_state = self.field.encode()
-        return np_state[:self.num_layers, (self.field.HEIGHT - self.height):, :self.width]
+    def encode_field(self, out=None):
+        """
+        Encode the visible part of the field. The encoding is written in place if out is given.
+        """
+        return self.field.encode(self.width, self.height, out=out)
 
-    def encode(self):
-        return (self.encode_deals(), self.encode_field())
+    def encode(self, out=None):
+        """
+        Encode the state as a (deals, field) tuple. The encoding is written in place if out is given.
+        """
+        if out is None:
+            return (self.encode_deals(), self.encode_field())
+        return (self.encode_deals(out=out[0]), self.encode_field(out=out[1]))
 
     def mirror(self):
-        self.field.mirror()
-        self.field.shift(self.width - self.field.WIDTH)
+        self.field.mirror(self.width)
 
     def get_deal_stack(self, x, orientation):
         puyo_a, puyo_b = self.deals[0]
@@ -210,24 +294,19 @@ class State(object):
         if self.num_deals is not None:
             self.make_deal()
         puyo_a, puyo_b = self.deals.pop(0)
-        index = self._validation_actions.index((x, orientation))
+        index = self._action_indices[(x, orientation)]
         self.field._make_move(index, puyo_a, puyo_b)
 
     def get_action_mask(self):
-        result = np.zeros(len(self.actions))
         bitset = self.field._valid_moves(self.width)
-        for i, (x, orientation) in enumerate(self.actions):
-            index = self._validation_actions.index((x, orientation % 2))
-            if bitset & (1 << index):
-                result[i] = 1
-        return result
+        return ((bitset >> self._mask_indices) & 1).astype(float)
 
     def validate_action(self, x, orientation):
         orientation %= 2
         if x + 1 - orientation >= self.width:
             return False
         bitset = self.field._valid_moves(self.width)
-        index = self._validation_actions.index((x, orientation))
+        index = self._action_indices[(x, orientation)]
         return bool(bitset & (1 << index))
 
     def step(self, x, orientation):
@@ -243,23 +322,25 @@ class State(object):
             assert (self.field.sane)
         return reward
 
+    def _copy_to(self, clone):
+        """
+        Copy the state into an uninitialized instance. The action tables are shared.
+        """
+        clone.field = self.field.clone()
+        clone.width = self.width
+        clone.height = self.height
+        clone.num_deals = self.num_deals
+        clone.garbage_x = self.garbage_x
+        clone.actions = self.actions
+        clone._validation_actions = self._validation_actions
+        clone._action_indices = self._action_indices
+        clone._mask_indices = self._mask_indices
+        clone._np_random = None
+        clone.deals = self.deals[:]
+
     def clone(self):
-        deals = self.deals[:]
-        if self.num_deals is None:
-            clone_deals = deals
-        else:
-            clone_deals = None
-        clone = State(
-            self.height,
-            self.width,
-            self.num_layers,
-            self.num_deals,
-            tsu_rules=self.tsu_rules,
-            has_garbage=self.has_garbage,
-            deals=clone_deals,
-        )
-        clone.field.data[:] = self.field.data
-        clone.deals = deals
+        clone = State.__new__(State)
+        self._copy_to(clone)
         return clone
 
     def get_children(self, complete=False):
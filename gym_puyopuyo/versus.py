@@ -5,11 +5,25 @@ import sys
 import numpy as np
 from gym.utils import seeding
 
+import puyocore as core
 from gym_puyopuyo import util
+from gym_puyopuyo.field import TallField
 from gym_puyopuyo.state import State
 
 
 class VersusState(State):
+    __slots__ = (
+        "step_bonus",
+        "all_clear_bonus",
+        "target_score",
+        "max_received_garbage",
+        "all_clear_pending",
+        "step_score",
+        "chain_score",
+        "chain_number",
+        "pending_garbage",
+    )
+
     def __init__(
         self,
         height,
@@ -53,25 +67,12 @@ class VersusState(State):
         self.pending_garbage = 0
 
     def clone(self):
-        deals = self.deals[:]
-        if self.num_deals is None:
-            clone_deals = deals
-        else:
-            clone_deals = None
-        clone = VersusState(
-            self.height,
-            self.width,
-            self.num_colors,
-            self.num_deals,
-            tsu_rules=self.tsu_rules,
-            deals=clone_deals,
-            step_bonus=self.step_bonus,
-            all_clear_bonus=self.all_clear_bonus,
-            target_score=self.target_score,
-            max_received_garbage=self.max_received_garbage,
-        )
-        clone.field.data[:] = self.field.data
-        clone.deals = deals
+        clone = VersusState.__new__(VersusState)
+        self._copy_to(clone)
+        clone.step_bonus = self.step_bonus
+        clone.all_clear_bonus = self.all_clear_bonus
+        clone.target_score = self.target_score
+        clone.max_received_garbage = self.max_received_garbage
         clone.all_clear_pending = self.all_clear_pending
         clone.step_score = self.step_score
         clone.chain_score = self.chain_score
@@ -107,59 +108,46 @@ class VersusState(State):
         util.print_back(len(status_text))
 
     def step(self, x, orientation):
+        move = -1
+        puyo_a = puyo_b = 0
         if not self.chain_number:
             if not self.deals:
                 return 0, True
             if not self.validate_action(x, orientation):
                 return 0, True
-
-            self.play_deal(x, orientation)
-            self.step_score += self.step_bonus
-
-        had_chain = bool(self.chain_number)
-
-        iterations = self.field.handle_gravity()
-        fell = (iterations > 1)
-
-        score = self.field.clear_groups(self.chain_number)
-        if score:
-            self.chain_score += score
-            self.chain_number += 1
-
-        released_garbage = 0
-        if had_chain and not (fell or score):
-            self.chain_number = 0
-
-            self.chain_score += self.step_score
-            self.step_score = 0
-
-            if self.all_clear_pending:
-                self.chain_score += self.all_clear_bonus
-            self.all_clear_pending = False
-
-            if self.chain_score >= 0:
-                released_garbage, self.chain_score = divmod(self.chain_score, self.target_score)
-
-            if not any(self.field.data):
-                self.all_clear_pending = True
-
-        if self.pending_garbage <= released_garbage:
-            released_garbage -= self.pending_garbage
-            self.pending_garbage = 0
-        else:
-            self.pending_garbage -= released_garbage
-            released_garbage = 0
-
-        if not self.chain_number:
-            amount = self.pending_garbage
-            if amount > self.max_received_garbage:
-                amount = self.max_received_garbage
-            self.pending_garbage -= amount
-            self.add_garbage(amount)
-            # Make garbage above the ghost line dissapear
-            if self.tsu_rules:
-                score, chain = self.field.resolve()
-                assert (not score)
+            if self.num_deals is not None:
+                self.make_deal()
+            puyo_a, puyo_b = self.deals.pop(0)
+            move = self._action_indices[(x, orientation)]
+
+        # Chain links, bonuses, garbage offsetting and the garbage drop all happen in a single core call.
+        rules = (
+            self.num_layers,
+            self.width,
+            isinstance(self.field, TallField),
+            self.tsu_rules,
+            self.step_bonus,
+            self.all_clear_bonus,
+            self.target_score,
+            self.max_received_garbage,
+        )
+        progress = (
+            self.chain_number,
+            self.chain_score,
+            self.step_score,
+            self.pending_garbage,
+            self.all_clear_pending,
+            self.garbage_x,
+        )
+        released_garbage, progress = core.versus_step(self.field.data, rules, progress, move, puyo_a, puyo_b)
+        (
+            self.chain_number,
+            self.chain_score,
+            self.step_score,
+            self.pending_garbage,
+            self.all_clear_pending,
+            self.garbage_x,
+        ) = progress
 
         if self.TESTING:
             assert (self.field.sane)
@@ -183,6 +171,8 @@ class VersusState(State):
 
 
 class Game(object):
+    __slots__ = ("_seed", "game_over", "players")
+
     def __init__(self, state_params, num_players=2, seed=None):
         _, self._seed = seeding.np_random(seed)
         self.game_over = False
@@ -260,7 +250,8 @@ class Game(object):
         return [p.encode() for p in self.players]
 
     def clone(self):
-        clone = Game(None)
+        clone = Game.__new__(Game)
+        clone._seed = self._seed
         clone.game_over = self.game_over
         clone.players = [p.clone() for p in self.players]
         return clone
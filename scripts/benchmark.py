@@ -0,0 +1,306 @@
+"""
+Benchmarks the core kernels, states, environments and agents.
+
+Results are written as JSON with operations per second, latency percentiles and environment metadata.
+Throughput is the median over batches of calls while the percentiles are over individually timed calls.
+Pass a previous output file as --baseline to print the relative change of every benchmark.
+
+    python scripts/benchmark.py --output before.json
+    python scripts/benchmark.py --baseline before.json
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import timeit
+from datetime import datetime
+
+import gym
+import numpy as np
+
+import puyocore as core
+from gym_puyopuyo.agent import AGENTS
+from gym_puyopuyo.env import ENV_NAMES, register
+from gym_puyopuyo.state import State
+
+PERCENTILES = (50, 90, 99)
+# Upper limit for the number of individually timed calls per benchmark.
+MAX_LATENCY_CALLS = 10000
+
+# (height, width, num_colors, tsu_rules) of the states used for the kernel benchmarks.
+STATES = {
+    "bottom": (8, 8, 4, False),
+    "tall": (16, 8, 5, False),
+    "tsu": (13, 6, 4, True),
+}
+
+
+def calibrate(fn, min_time):
+    """
+    Return the number of calls that takes at least min_time seconds.
+    """
+    number = 1
+    while True:
+        elapsed = timeit.timeit(fn, number=number)
+        if elapsed >= min_time:
+            return number
+        number *= 2 if elapsed < min_time / 10 else 10
+
+
+def time_calls(fn, num_calls):
+    """
+    Return the latency of each of num_calls individually timed calls. Includes reading the clock once.
+    """
+    timer = timeit.default_timer
+    latencies = []
+    for _ in range(num_calls):
+        start = timer()
+        fn()
+        latencies.append(timer() - start)
+    return latencies
+
+
+def measure(fn, samples, min_time):
+    """
+    Time fn in batches and one call at a time.
+
+    Returns (mean time per call of each batch, latencies of individual calls).
+    The individual calls are as many as the batches made up to MAX_LATENCY_CALLS.
+    """
+    number = calibrate(fn, min_time / samples)
+    batch_times = [t / number for t in timeit.repeat(fn, number=number, repeat=samples)]
+    latencies = time_calls(fn, min(number * samples, MAX_LATENCY_CALLS))
+    return batch_times, latencies
+
+
+def summarize(batch_times, latencies):
+    result = {
+        "ops_per_sec": 1.0 / np.median(batch_times),
+        "samples": len(batch_times),
+        "calls": len(latencies),
+    }
+    latencies = np.array(latencies)
+    for percentile in PERCENTILES:
+        result["p{}_us".format(percentile)] = np.percentile(latencies, percentile) * 1e6
+    return result
+
+
+def populated_state(height, width, num_colors, tsu_rules, num_moves=20, seed=0):
+    """
+    Return a state with a few random moves played so that the kernels have something to work on.
+    """
+    state = State(height, width, num_colors, 3, tsu_rules=tsu_rules, seed=seed)
+    rng = random.Random(seed)
+    for _ in range(num_moves):
+        valid = [action for action, valid in zip(state.actions, state.get_action_mask()) if valid]
+        if not valid:
+            break
+        state.step(*rng.choice(valid))
+    return state
+
+
+def kernel_benchmarks():
+    """
+    Yield (name, function) pairs for the core kernels. Mutating kernels restore the field on every call.
+    """
+    for name, (height, width, num_colors, tsu_rules) in sorted(STATES.items()):
+        state = populated_state(height, width, num_colors, tsu_rules)
+        field = state.field
+        snapshot = bytearray(field.data)
+        # Drop a pair in mid-air so that gravity and clearing have work to do.
+        falling = bytearray(snapshot)
+        core.make_move(falling, 1, 0, 0)
+        data = bytearray(falling)
+        num_layers = field.num_layers
+
+        def restore():
+            data[:] = falling
+
+        if name == "bottom":
+            def handle_gravity():
+                restore()
+                core.bottom_handle_gravity(data, num_layers)
+
+            def clear_groups():
+                restore()
+                core.bottom_clear_groups(data, num_layers, False)
+
+            def resolve():
+                restore()
+                core.bottom_resolve(data, num_layers, False)
+
+            def valid_moves():
+                core.bottom_valid_moves(snapshot, num_layers)
+        else:
+            def handle_gravity():
+                restore()
+                core.tall_handle_gravity(data, num_layers)
+
+            def clear_groups():
+                restore()
+                core.tall_clear_groups(data, num_layers, 0, tsu_rules, False)
+
+            def resolve():
+                restore()
+                core.tall_resolve(data, num_layers, tsu_rules, False)
+
+            def valid_moves():
+                core.tall_valid_moves(snapshot, num_layers, width, tsu_rules)
+
+        out = np.empty((num_layers, height, width), dtype=np.int8)
+
+        yield "kernel.{}.restore".format(name), restore
+        yield "kernel.{}.handle_gravity".format(name), handle_gravity
+        yield "kernel.{}.clear_groups".format(name), clear_groups
+        yield "kernel.{}.resolve".format(name), resolve
+        yield "kernel.{}.valid_moves".format(name), valid_moves
+        yield "kernel.{}.encode".format(name), state.encode_field
+        yield "kernel.{}.encode_into".format(name), (lambda state=state, out=out: state.encode_field(out=out))
+
+
+def state_benchmarks():
+    for name, (height, width, num_colors, tsu_rules) in sorted(STATES.items()):
+        state = populated_state(height, width, num_colors, tsu_rules)
+        rng = random.Random(0)
+
+        def step(state=state, rng=rng):
+            # Step a clone so that the field doesn't fill up.
+            state.clone().step(*rng.choice(state.actions))
+
+        yield "state.{}.clone".format(name), state.clone
+        yield "state.{}.clone_and_step".format(name), step
+        yield "state.{}.get_action_mask".format(name), state.get_action_mask
+        yield "state.{}.get_children".format(name), state.get_children
+
+
+def env_benchmarks():
+    for key, env_id in sorted(ENV_NAMES.items()):
+        env = gym.make(env_id)
+        env.seed(0)
+        env.reset()
+        action_space = env.action_space
+
+        def step(env=env, action_space=action_space):
+            _, _, done, _ = env.step(action_space.sample())
+            if done:
+                env.reset()
+
+        yield "env.{}.step".format(key), step
+
+
+def agent_benchmarks():
+    for key, agent_class in sorted(AGENTS.items()):
+        env = gym.make(ENV_NAMES[key])
+        env.seed(0)
+        env.reset()
+        for _ in range(5):
+            env.step(env.action_space.sample())
+        state = env.unwrapped.state
+        agent = agent_class()
+
+        def get_action(agent=agent, state=state):
+            # Start from an empty table so that repeated searches of the same state aren't free.
+            if agent.table is not None:
+                core.clear_transposition_table(agent.table)
+            agent.get_action(state)
+
+        yield "agent.{}.get_action".format(key), get_action
+
+
+SUITES = {
+    "kernel": kernel_benchmarks,
+    "state": state_benchmarks,
+    "env": env_benchmarks,
+    "agent": agent_benchmarks,
+}
+
+
+def metadata():
+    try:
+        revision = subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.STDOUT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "numpy": np.__version__,
+        "gym": gym.__version__,
+        "git_revision": revision,
+    }
+
+
+def run(suites, pattern, samples, min_time):
+    results = {}
+    for suite in suites:
+        for name, fn in SUITES[suite]():
+            if pattern and pattern not in name:
+                continue
+            # Agents are slow enough to be timed one call at a time.
+            if suite == "agent":
+                latencies = time_calls(fn, samples)
+                results[name] = summarize(latencies, latencies)
+            else:
+                results[name] = summarize(*measure(fn, samples, min_time))
+            print("{:<40} {:>14.1f} ops/s  p50 {:>12.2f}us  p99 {:>12.2f}us".format(
+                name, results[name]["ops_per_sec"], results[name]["p50_us"], results[name]["p99_us"]
+            ), file=sys.stderr)
+    return results
+
+
+def compare(results, baseline):
+    """
+    Print the speedup of every benchmark that was run relative to the baseline results.
+    """
+    print("{:<40} {:>14} {:>14} {:>9}".format("benchmark", "baseline", "current", "speedup"))
+    for name in sorted(results):
+        new = results[name]["ops_per_sec"]
+        if name not in baseline:
+            print("{:<40} {:>14} {:>14.1f}".format(name, "-", new))
+            continue
+        old = baseline[name]["ops_per_sec"]
+        print("{:<40} {:>14.1f} {:>14.1f} {:>8.2f}x".format(name, old, new, new / old))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES), help="Suites to run (default: all)")
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--samples", type=int, default=20, help="Number of timed batches per benchmark")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Minimum seconds spent per benchmark")
+    parser.add_argument("--output", help="Write the JSON results to this file instead of stdout")
+    parser.add_argument("--baseline", help="JSON results of a previous run to compare against")
+    args = parser.parse_args(argv)
+
+    register()
+    np.random.seed(0)
+    random.seed(0)
+    suites = args.suite or ["kernel", "state", "env", "agent"]
+    report = {
+        "metadata": metadata(),
+        "settings": {"suites": suites, "filter": args.filter, "samples": args.samples, "min_time": args.min_time},
+        "results": run(suites, args.filter, args.samples, args.min_time),
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    elif not args.baseline:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        compare(report["results"], baseline["results"])
+
+
+if __name__ == "__main__":
+    main()
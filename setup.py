@@ -17,6 +17,13 @@ core = Extension(
         'src/bitboard.c',
         'src/bottom_tree.c',
         'src/tall_tree.c',
+        'src/batch.c',
+        'src/transposition.c',
+        'src/pool.c',
+        'src/search.c',
+        'src/deadline.c',
+        'src/counters.c',
+        'src/versus.c',
     ],
     include_dirs=['src/include'],
 )
@@ -26,6 +33,9 @@ if __name__ == '__main__':
     i_dont_know_how_tox_works = [
         'src/wrapper27.c', 'src/wrapper35.c',
         'src/include/bottom.h', 'src/include/tall.h', 'src/include/bitboard.h',
+        'src/include/batch.h', 'src/include/transposition.h',
+        'src/include/pool.h', 'src/include/search.h', 'src/include/deadline.h',
+        'src/include/counters.h', 'src/include/versus.h',
     ]
     setup(
         setup_requires=['setuptools>=34.0', 'setuptools-gitver'],
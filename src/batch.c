@@ -0,0 +1,132 @@
+#include <string.h>
+
+#include "bitboard.h"
+#include "transposition.h"
+#include "deadline.h"
+#include "bottom.h"
+#include "tall.h"
+#include "batch.h"
+
+// xorshift64* generator. One independent stream per environment.
+unsigned long long batch_random(unsigned long long *rng) {
+  unsigned long long x = *rng;
+  x ^= x >> 12;
+  x ^= x << 25;
+  x ^= x >> 27;
+  *rng = x;
+  return x * 0x2545F4914F6CDD1DULL;
+}
+
+int batch_num_words(batch_env_t *env) {
+  if (env->tall) {
+    return env->num_colors * NUM_FLOORS;
+  }
+  return env->num_colors;
+}
+
+void batch_deal(batch_env_t *env, int index, unsigned char *deal) {
+  unsigned long long *rng = env->rngs + index;
+  deal[0] = (batch_random(rng) >> 32) % env->num_colors;
+  deal[1] = (batch_random(rng) >> 32) % env->num_colors;
+}
+
+void batch_reset(batch_env_t *env, int index) {
+  int num_words = batch_num_words(env);
+  memset(env->fields + index * num_words, 0, sizeof(puyos_t) * num_words);
+  unsigned char *deals = env->deals + index * env->num_deals * 2;
+  for (int i = 0; i < env->num_deals; ++i) {
+    batch_deal(env, index, deals + 2 * i);
+  }
+}
+
+static void batch_encode_field(batch_env_t *env, puyos_t *floors, char *out) {
+  if (env->tall) {
+    tall_encode_into(floors, env->num_colors, env->width, env->height, out);
+  } else {
+    bottom_encode_into(floors, env->num_colors, env->width, env->height, out);
+  }
+}
+
+void batch_encode(batch_env_t *env, int index) {
+  int deals_size = env->num_colors * env->num_deals * 2;
+  unsigned char *deals = env->deals + index * env->num_deals * 2;
+  char *deals_out = env->deals_out + index * deals_size;
+  memset(deals_out, 0, deals_size);
+  for (int i = 0; i < env->num_deals; ++i) {
+    deals_out[(deals[2 * i] * env->num_deals + i) * 2] = 1;
+    deals_out[(deals[2 * i + 1] * env->num_deals + i) * 2 + 1] = 1;
+  }
+
+  puyos_t *floors = env->fields + index * batch_num_words(env);
+  batch_encode_field(env, floors, env->fields_out + index * env->num_colors * env->height * env->width);
+}
+
+// Mirrors State.step on the given field. Returns -1 for invalid moves leaving the field untouched.
+static int batch_play(batch_env_t *env, puyos_t *floors, int move, int color_a, int color_b) {
+  bitset_t valid;
+  if (env->tall) {
+    valid = tall_valid_moves(floors, env->num_colors, env->width, env->tsu_rules);
+  } else {
+    valid = bottom_valid_moves(floors, env->num_colors);
+  }
+  if (move < 0 || move >= NUM_ACTIONS || !(valid & (1ULL << (move % (NUM_ACTIONS / 2))))) {
+    return -1;
+  }
+
+  // The fields only ever change through resets and resolved moves so only the new puyos can start a chain.
+  puyos_t placed = make_move(floors, move, color_a, color_b);
+
+  if (!env->tall) {
+    int chain = bottom_resolve_incremental(floors, env->num_colors, 0, placed);
+    return chain * chain;
+  }
+  int chain;
+  int reward = tall_resolve_incremental(floors, env->num_colors, env->tsu_rules, 0, placed, &chain);
+  puyos_t all = 0;
+  for (int i = 0; i < batch_num_words(env); ++i) {
+    all |= floors[i];
+  }
+  if (!all) {
+    reward += ALL_CLEAR_BONUS;
+  }
+  return reward;
+}
+
+// Mirrors State.step for a single environment. Returns -1 for invalid moves.
+int batch_step_single(batch_env_t *env, int index, int move) {
+  puyos_t *floors = env->fields + index * batch_num_words(env);
+  unsigned char *deals = env->deals + index * env->num_deals * 2;
+
+  int color_a = deals[0];
+  int color_b = deals[1];
+  int reward = batch_play(env, floors, move, color_a, color_b);
+  if (reward < 0) {
+    return reward;
+  }
+  memmove(deals, deals + 2, 2 * (env->num_deals - 1));
+  batch_deal(env, index, deals + 2 * (env->num_deals - 1));
+  return reward;
+}
+
+void batch_step(batch_env_t *env, const int *moves, int *rewards, char *dones) {
+  for (int i = 0; i < env->num_envs; ++i) {
+    rewards[i] = batch_step_single(env, i, moves[i]);
+    dones[i] = (rewards[i] < 0);
+    if (dones[i]) {
+      batch_reset(env, i);
+    }
+    batch_encode(env, i);
+  }
+}
+
+int batch_replay(batch_env_t *env, puyos_t *floors, const unsigned char *deals, const int *moves, int num_moves, int *rewards) {
+  int field_size = env->num_colors * env->height * env->width;
+  for (int i = 0; i < num_moves; ++i) {
+    batch_encode_field(env, floors, env->fields_out + i * field_size);
+    rewards[i] = batch_play(env, floors, moves[i], deals[2 * i], deals[2 * i + 1]);
+    if (rewards[i] < 0) {
+      return i + 1;
+    }
+  }
+  return num_moves;
+}
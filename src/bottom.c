@@ -1,7 +1,10 @@
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 
 #include "bitboard.h"
+#include "transposition.h"
+#include "deadline.h"
 #include "bottom.h"
 
 void bottom_render(puyos_t *floor, int num_colors) {
@@ -24,13 +27,15 @@ void bottom_render(puyos_t *floor, int num_colors) {
   }
 }
 
-int bottom_handle_gravity(puyos_t *floor, int num_colors) {
+// Drops the puyos one row per pass and returns the number of passes including the final one where nothing moved.
+static int bottom_settle(puyos_t *floor, int num_colors, puyos_t *moved) {
   puyos_t all;
   all = 0;
   for (int j = 0; j < num_colors; ++j) {
     all |= floor[j];
   }
 
+  *moved = 0;
   int iterations = 0;
   puyos_t temp;
   do {
@@ -42,6 +47,7 @@ int bottom_handle_gravity(puyos_t *floor, int num_colors) {
       falling = floor[i] & ~bellow;
       floor[i] = (falling << V_SHIFT) | (floor[i] & bellow);
       all |= floor[i];
+      *moved |= falling << V_SHIFT;
     }
     ++iterations;
   } while (temp != all);
@@ -49,6 +55,17 @@ int bottom_handle_gravity(puyos_t *floor, int num_colors) {
   return iterations;
 }
 
+int bottom_handle_gravity(puyos_t *floor, int num_colors) {
+  puyos_t moved;
+  return bottom_settle(floor, num_colors, &moved);
+}
+
+// Handles gravity and marks every position a puyo fell into. The mask can include positions that end up empty.
+// Returns whether anything fell.
+int bottom_handle_gravity_moved(puyos_t *floor, int num_colors, puyos_t *moved) {
+  return bottom_settle(floor, num_colors, moved) > 1;
+}
+
 puyos_t bottom_clear_groups(puyos_t *floor, int num_colors) {
   puyos_t cleared = 0;
   for (int i = 0; i < num_colors; ++i) {
@@ -70,6 +87,24 @@ puyos_t bottom_clear_groups(puyos_t *floor, int num_colors) {
   return cleared;
 }
 
+// Clears only the groups that contain at least one of the seed positions.
+puyos_t bottom_clear_groups_from(puyos_t *floor, int num_colors, puyos_t seeds) {
+  puyos_t cleared = 0;
+  for (int i = 0; i < num_colors; ++i) {
+    puyos_t layer = floor[i];
+    puyos_t seed = seeds & layer;
+    while (seed) {
+      puyos_t group = flood(seed & -seed, layer);
+      seed &= ~group;
+      if (popcount(group) >= CLEAR_THRESHOLD) {
+        floor[i] ^= group;
+        cleared |= group;
+      }
+    }
+  }
+  return cleared;
+}
+
 int bottom_resolve(puyos_t *floor, int num_layers, int has_garbage) {
   int chain = -1;
   while(1) {
@@ -88,6 +123,28 @@ int bottom_resolve(puyos_t *floor, int num_layers, int has_garbage) {
   return chain;
 }
 
+// Same as bottom_resolve for fields that had no groups to clear before the dirty puyos were placed.
+// Only groups touching dirty or fallen puyos can form so the others aren't flooded at all.
+int bottom_resolve_incremental(puyos_t *floor, int num_layers, int has_garbage, puyos_t dirty) {
+  int chain = -1;
+  while(1) {
+    ++chain;
+    puyos_t moved;
+    int fell = bottom_handle_gravity_moved(floor, num_layers, &moved);
+    if (!fell && chain > 0) {
+      break;
+    }
+    puyos_t cleared = bottom_clear_groups_from(floor, num_layers - has_garbage, dirty | moved);
+    if (!cleared) {
+      break;
+    } else if (has_garbage) {
+      floor[num_layers - 1] &= ~cross(cleared);
+    }
+    dirty = 0;
+  }
+  return chain;
+}
+
 int bottom_clear_groups_and_garbage(puyos_t *floor, int num_layers, int has_garbage) {
   puyos_t cleared = bottom_clear_groups(floor, num_layers - has_garbage);
   if (cleared && has_garbage) {
@@ -108,6 +165,18 @@ char* bottom_encode(puyos_t *floor, int num_colors) {
   return data;
 }
 
+// Writes the visible part of the field into a (num_colors, height, width) array.
+void bottom_encode_into(puyos_t *floor, int num_colors, int width, int height, char *out) {
+  for (int i = 0; i < num_colors; ++i) {
+    for (int y = HEIGHT - height; y < HEIGHT; ++y) {
+      unsigned char line = floor[i] >> (y * V_SHIFT);
+      for (int x = 0; x < width; ++x) {
+        *out++ = (line >> x) & 1;
+      }
+    }
+  }
+}
+
 bitset_t bottom_valid_moves(puyos_t *floor, int num_colors) {
   puyos_t all = 0;
   for (int i = 0; i < num_colors; ++i) {
@@ -121,7 +190,8 @@ bitset_t bottom_valid_moves(puyos_t *floor, int num_colors) {
 }
 
 // This is valid for both bottom and tall fields due to the data layout
-void make_move(puyos_t *floor, int action, int color_a, int color_b) {
+// Returns the positions of the placed puyos.
+puyos_t make_move(puyos_t *floor, int action, int color_a, int color_b) {
   int x = action;
   int orientation = 0;
   if (x >= WIDTH - 1) {
@@ -139,23 +209,61 @@ void make_move(puyos_t *floor, int action, int color_a, int color_b) {
   if (orientation == 0) {
     floor[color_a] |= 1ULL << x;
     floor[color_b] |= 1ULL << (x + 1);
+    return 3ULL << x;
   } else if (orientation == 1) {
     floor[color_a] |= 1ULL << x;
     floor[color_b] |= 1ULL << (x + V_SHIFT);
   } else if (orientation == 2) {
     floor[color_b] |= 1ULL << x;
     floor[color_a] |= 1ULL << (x + 1);
+    return 3ULL << x;
   } else {
     floor[color_b] |= 1ULL << x;
     floor[color_a] |= 1ULL << (x + V_SHIFT);
   }
+  return (1ULL << x) | (1ULL << (x + V_SHIFT));
 }
 
-void mirror(puyos_t *floor, int num_colors) {
-  for (int i = 0; i < num_colors; ++i) {
-    puyos_t puyos = floor[i];
+// Adds the puyos of the layer to the empty positions of every floor.
+void overlay(puyos_t *floors, puyos_t *layer, int num_layers, int num_floors) {
+  for (int k = 0; k < num_floors; ++k) {
+    puyos_t all = 0;
+    for (int i = 0; i < num_layers; ++i) {
+      all |= floors[i];
+    }
+    for (int i = 0; i < num_layers; ++i) {
+      floors[i] |= layer[i] & ~all;
+    }
+    floors += num_layers;
+    layer += num_layers;
+  }
+}
+
+// Puyos of every row are moved right by a positive amount and left by a negative one. Columns pushed past the edge are dropped.
+void shift(puyos_t *floors, int num_words, int amount) {
+  if (amount >= WIDTH || amount <= -WIDTH) {
+    memset(floors, 0, sizeof(puyos_t) * num_words);
+    return;
+  }
+  for (int i = 0; i < num_words; ++i) {
+    if (amount > 0) {
+      floors[i] = (floors[i] << amount) & (LEFT_COLUMN * (0xFF & (0xFF << amount)));
+    } else if (amount < 0) {
+      floors[i] = (floors[i] >> -amount) & (LEFT_COLUMN * (0xFF >> -amount));
+    }
+  }
+}
+
+// Flips fields of the given width horizontally keeping them aligned to the left edge.
+// The words of any number of layers, floors and fields can be mirrored at once.
+void mirror(puyos_t *floors, int num_words, int width) {
+  int amount = WIDTH - width;
+  puyos_t mask = LEFT_COLUMN * (0xFF >> amount);
+  for (int i = 0; i < num_words; ++i) {
+    puyos_t puyos = floors[i];
     puyos = ((puyos & RIGHT_HALF) >> (WIDTH / 2)) | ((puyos << (WIDTH / 2)) & RIGHT_HALF);
     puyos = ((puyos & RIGHT_DELTA_1) >> (WIDTH / 4)) | ((puyos << (WIDTH / 4)) & RIGHT_DELTA_1);
-    floor[i] = ((puyos & RIGHT_DELTA_2) >> 1) | ((puyos << 1) & RIGHT_DELTA_2);
+    puyos = ((puyos & RIGHT_DELTA_2) >> 1) | ((puyos << 1) & RIGHT_DELTA_2);
+    floors[i] = (puyos >> amount) & mask;
   }
 }
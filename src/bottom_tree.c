@@ -1,20 +1,36 @@
+#include <math.h>
 #include <stdlib.h>
 #include <string.h>
 
 #include <stdio.h>
 
 #include "bitboard.h"
+#include "transposition.h"
+#include "deadline.h"
+#include "counters.h"
 #include "bottom.h"
 
 #define GAMMA (0.95)
+// Relative slack keeping pruned values safely below the thresholds despite rounding.
+#define PRUNING_MARGIN (1e-9)
 #define DEATH_VALUE (-10)
 
+// Sum of the squared sizes of the groups in the field.
+// Lone puyos are counted in bulk and the rest of the groups are flooded starting from their lowest puyo.
 int bottom_group_heuristic(puyos_t *floor, int num_colors) {
     int score = 0;
     for (int i = 0; i < num_colors; ++i) {
         puyos_t layer = floor[i];
-        for (int j = 0; j < WIDTH * HEIGHT; j += 2) {
-            puyos_t group = flood(3ULL << j, layer);
+        puyos_t neighbours = (
+            ((layer & RIGHT_BLOCK) >> H_SHIFT) |
+            ((layer << H_SHIFT) & RIGHT_BLOCK) |
+            (layer << V_SHIFT) |
+            (layer >> V_SHIFT)
+        );
+        score += popcount(layer & ~neighbours);
+        layer &= neighbours;
+        while (layer) {
+            puyos_t group = flood(layer & -layer, layer);
             layer ^= group;
             int size = popcount(group);
             score += size * size;
@@ -23,6 +39,68 @@ int bottom_group_heuristic(puyos_t *floor, int num_colors) {
     return score;
 }
 
+// Orders the valid moves best first by their immediate reward plus the discounted heuristic of the resulting field.
+// This is the value the moves would get from a search of depth one. Returns the number of valid moves.
+static int bottom_rank_moves(puyos_t *floor, int num_layers, int has_garbage, bitset_t valid, int num_actions, int *colors, double factor, puyos_t *child, int *order) {
+    int num_colors = num_layers - has_garbage;
+    double keys[NUM_ACTIONS];
+    int num_moves = 0;
+    for (int i = 0; i < num_actions; ++i) {
+        if (!(valid & (1ULL << i))) {
+            continue;
+        }
+        memcpy(child, floor, sizeof(puyos_t) * num_layers);
+        puyos_t placed = make_move(child, i, colors[0], colors[1]);
+        double key = bottom_resolve_incremental(child, num_layers, has_garbage, placed);
+        key *= key;
+        key += GAMMA * factor * bottom_group_heuristic(child, num_colors);
+        // Insertion sort keeps equal keys in index order.
+        int j = num_moves++;
+        while (j > 0 && keys[j - 1] < key) {
+            keys[j] = keys[j - 1];
+            order[j] = order[j - 1];
+            --j;
+        }
+        keys[j] = key;
+        order[j] = i;
+    }
+    return num_moves;
+}
+
+// Upper bound for the value of any line of play of the given depth from the field.
+// Every link of a chain clears at least CLEAR_THRESHOLD puyos so the discounted chain rewards
+// are bounded by the square of the number of links the puyos can form.
+// Leaves are resolved so their groups are smaller than CLEAR_THRESHOLD.
+static double bottom_value_bound(puyos_t *floor, int num_colors, int depth, double factor) {
+    int num_puyos = 2 * depth;
+    for (int i = 0; i < num_colors; ++i) {
+        num_puyos += popcount(floor[i]);
+    }
+    int max_links = num_puyos / CLEAR_THRESHOLD;
+    double bound = max_links * max_links;
+    if (factor > 0) {
+        bound += factor * (CLEAR_THRESHOLD - 1) * num_puyos;
+    }
+    return bound;
+}
+
+static double bottom_tree_search_bounded(
+    puyos_t *floor,
+    int num_layers,
+    int has_garbage,
+    bitset_t action_mask,
+    int *colors,
+    int num_deals,
+    int depth,
+    double factor,
+    double alpha,
+    int beam_width,
+    puyos_t *child_buffer,
+    transposition_table_t *table,
+    unsigned long long salt,
+    deadline_t *deadline
+);
+
 double bottom_tree_search_single(
     puyos_t *floor,
     int num_layers,
@@ -32,7 +110,12 @@ double bottom_tree_search_single(
     int num_deals,
     int depth,
     double factor,
-    puyos_t *child_buffer
+    double alpha,
+    int beam_width,
+    puyos_t *child_buffer,
+    transposition_table_t *table,
+    unsigned long long salt,
+    deadline_t *deadline
 ) {
     bitset_t valid = bottom_valid_moves(floor, num_layers);
     valid |= valid << (NUM_ACTIONS / 2);
@@ -51,19 +134,37 @@ double bottom_tree_search_single(
         num_actions /= 2;
     }
 
-    for (int i = 0; i < num_actions; ++i) {
-        bitset_t move = 1ULL << i;
-        if (!(valid & move)) {
-            continue;
+    // Beam search only expands the most promising moves. The last ply is exact anyway.
+    int order[NUM_ACTIONS];
+    int num_moves = 0;
+    if (beam_width > 0 && depth > 1) {
+        num_moves = bottom_rank_moves(floor, num_layers, has_garbage, valid, num_actions, colors, factor, child, order);
+        if (num_moves > beam_width) {
+            num_moves = beam_width;
+        }
+    } else {
+        for (int i = 0; i < num_actions; ++i) {
+            if (valid & (1ULL << i)) {
+                order[num_moves++] = i;
+            }
         }
+    }
 
+    for (int k = 0; k < num_moves; ++k) {
+        int i = order[k];
         memcpy(child, floor, sizeof(puyos_t) * num_layers);
-        make_move(child, i, colors[0], colors[1]);
+        puyos_t placed = make_move(child, i, colors[0], colors[1]);
 
-        double move_score = bottom_resolve(child, num_layers, has_garbage);
+        // Searched fields are always resolved so only the new puyos can start a chain.
+        double move_score = bottom_resolve_incremental(child, num_layers, has_garbage, placed);
         move_score *= move_score;
 
-        double tree_score = bottom_tree_search(
+        // The child only matters if it beats both alpha and the best move so far.
+        double threshold = score > alpha ? score : alpha;
+        double child_alpha = (threshold - move_score) / GAMMA;
+        child_alpha -= PRUNING_MARGIN * (1 + fabs(child_alpha));
+
+        double tree_score = bottom_tree_search_bounded(
             child,
             num_layers,
             has_garbage,
@@ -72,7 +173,12 @@ double bottom_tree_search_single(
             num_deals - 1,
             depth - 1,
             factor,
-            child_buffer + num_layers
+            child_alpha,
+            beam_width,
+            child_buffer + num_layers,
+            table,
+            salt,
+            deadline
         );
 
         double child_score = move_score + GAMMA * tree_score;
@@ -83,7 +189,7 @@ double bottom_tree_search_single(
     return score;
 }
 
-double bottom_tree_search(
+static double bottom_tree_search_bounded(
     puyos_t *floor,
     int num_layers,
     int has_garbage,
@@ -92,17 +198,53 @@ double bottom_tree_search(
     int num_deals,
     int depth,
     double factor,
-    puyos_t *child_buffer
+    double alpha,
+    int beam_width,
+    puyos_t *child_buffer,
+    transposition_table_t *table,
+    unsigned long long salt,
+    deadline_t *deadline
 ) {
     int num_colors = num_layers - has_garbage;
 
-    if (depth <= 0) {
-        return factor * bottom_group_heuristic(floor, num_colors);
+    if (depth < 0) {
+        depth = 0;
+    }
+
+    COUNT_SEARCH(nodes);
+    unsigned long long key = 0;
+    double tree_score;
+    if (table) {
+        // Leaf values don't depend on the deals.
+        key = hash_node(salt, floor, num_layers, colors, depth ? num_deals : 0, depth);
+        COUNT_SEARCH(table_probes);
+        if (transposition_table_probe(table, key, &tree_score)) {
+            COUNT_SEARCH(table_hits);
+            return tree_score;
+        }
+        // A bound left by an earlier pruned search may already rule the node out.
+        if (alpha > -INFINITY) {
+            COUNT_SEARCH(table_probes);
+            if (transposition_table_probe(table, UPPER_BOUND_KEY(key), &tree_score) && tree_score <= alpha) {
+                COUNT_SEARCH(table_hits);
+                return tree_score;
+            }
+        }
     }
 
-    if (num_deals > 0) {
+    // Interior nodes give up once the deadline expires. The caller discards the result.
+    if (depth && deadline && deadline_expired(deadline)) {
+        return 0;
+    }
+
+    // Values at or below alpha may be upper bounds instead of exact values.
+    int cut = 0;
+    if (!depth) {
+        COUNT_SEARCH(leaves);
+        tree_score = factor * bottom_group_heuristic(floor, num_colors);
+    } else if (num_deals > 0) {
         // Deterministic search with the provided colors.
-        return bottom_tree_search_single(
+        tree_score = bottom_tree_search_single(
             floor,
             num_layers,
             has_garbage,
@@ -111,15 +253,34 @@ double bottom_tree_search(
             num_deals - 1,
             depth,
             factor,
-            child_buffer
+            alpha,
+            beam_width,
+            child_buffer,
+            table,
+            salt,
+            deadline
         );
+        cut = (tree_score <= alpha);
     } else {
         // Averaged search over all possible color combinations.
-        double tree_score = 0;
-        for (int c0 = 0; c0 < num_colors; ++c0) {
+        // Star1 pruning: the remaining combinations are assumed to reach the value bound
+        // and the search stops once even that can't lift the average above alpha.
+        double total_weight = num_colors * num_colors;
+        double remaining_weight = total_weight;
+        double bound = 0;
+        if (alpha > -INFINITY) {
+            bound = bottom_value_bound(floor, num_colors, depth, factor);
+        }
+        tree_score = 0;
+        for (int c0 = 0; c0 < num_colors && !cut; ++c0) {
             colors[0] = c0;
             // Symmetry reduction
             for (int c1 = c0; c1 < num_colors; ++c1) {
+                if (tree_score + remaining_weight * bound <= alpha * total_weight) {
+                    tree_score += remaining_weight * bound;
+                    cut = 1;
+                    break;
+                }
                 colors[1] = c1;
                 double single_score = bottom_tree_search_single(
                     floor,
@@ -130,17 +291,61 @@ double bottom_tree_search(
                     0,
                     depth,
                     factor,
-                    child_buffer
+                    -INFINITY,
+                    beam_width,
+                    child_buffer,
+                    table,
+                    salt,
+                    deadline
                 );
                 // Symmetry compensation
                 if (c1 == c0) {
                     tree_score += single_score;
+                    remaining_weight -= 1;
                 } else {
                     tree_score += 2 * single_score;
+                    remaining_weight -= 2;
                 }
             }
         }
-        tree_score /= num_colors * num_colors;
-        return tree_score;
+        tree_score /= total_weight;
     }
+    if (table && !(deadline && deadline->expired)) {
+        transposition_table_store(table, cut ? UPPER_BOUND_KEY(key) : key, depth, tree_score);
+    }
+    return tree_score;
+}
+
+// The value of the field is exact. Only the nodes below are pruned against their siblings.
+double bottom_tree_search(
+    puyos_t *floor,
+    int num_layers,
+    int has_garbage,
+    bitset_t action_mask,
+    int *colors,
+    int num_deals,
+    int depth,
+    double factor,
+    int beam_width,
+    puyos_t *child_buffer,
+    transposition_table_t *table,
+    unsigned long long salt,
+    deadline_t *deadline
+) {
+    return bottom_tree_search_bounded(
+        floor,
+        num_layers,
+        has_garbage,
+        action_mask,
+        colors,
+        num_deals,
+        depth,
+        factor,
+        -INFINITY,
+        beam_width,
+        child_buffer,
+        table,
+        salt,
+        deadline
+    );
 }
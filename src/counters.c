@@ -0,0 +1,15 @@
+#include <string.h>
+
+#include "counters.h"
+
+volatile int search_counting = 0;
+
+search_counters_t search_counters;
+
+// Enabling the counting starts it over from zero.
+void search_counting_enable(int enabled) {
+  if (enabled) {
+    memset(&search_counters, 0, sizeof(search_counters_t));
+  }
+  search_counting = enabled;
+}
@@ -0,0 +1,30 @@
+#define _POSIX_C_SOURCE 199309L
+
+#include <math.h>
+#include <time.h>
+
+#include "deadline.h"
+
+// Monotonic time in milliseconds.
+double deadline_now(void) {
+  struct timespec now;
+  clock_gettime(CLOCK_MONOTONIC, &now);
+  return now.tv_sec * 1e3 + now.tv_nsec * 1e-6;
+}
+
+// Starts a deadline budget milliseconds from now. A non-positive budget never expires.
+void deadline_start(deadline_t *deadline, double budget) {
+  if (budget > 0) {
+    deadline->end = deadline_now() + budget;
+  } else {
+    deadline->end = INFINITY;
+  }
+  deadline->expired = 0;
+}
+
+int deadline_expired(deadline_t *deadline) {
+  if (!deadline->expired && deadline_now() >= deadline->end) {
+    deadline->expired = 1;
+  }
+  return deadline->expired;
+}
@@ -0,0 +1,31 @@
+#ifndef GYM_PUYOPUYO_BATCH_H_GUARD
+#define GYM_PUYOPUYO_BATCH_H_GUARD
+
+typedef struct batch_env {
+  int num_envs;
+  int num_colors;
+  int num_deals;
+  int width;
+  int height;
+  int tall;
+  int tsu_rules;
+  puyos_t *fields;
+  unsigned char *deals;
+  unsigned long long *rngs;
+  char *deals_out;
+  char *fields_out;
+} batch_env_t;
+
+int batch_num_words(batch_env_t *env);
+
+void batch_reset(batch_env_t *env, int index);
+
+void batch_encode(batch_env_t *env, int index);
+
+void batch_step(batch_env_t *env, const int *moves, int *rewards, char *dones);
+
+// Replays the moves of a single game from the field encoding the field before every move into fields_out.
+// Returns the number of moves played. The replay ends at the first invalid move which gets a reward of -1.
+int batch_replay(batch_env_t *env, puyos_t *floors, const unsigned char *deals, const int *moves, int num_moves, int *rewards);
+
+#endif /* !GYM_PUYOPUYO_BATCH_H_GUARD */
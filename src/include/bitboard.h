@@ -14,6 +14,7 @@
 #define RIGHT_DELTA_1 (0xCCCCCCCCCCCCCCCCULL)
 #define RIGHT_DELTA_2 (0xAAAAAAAAAAAAAAAAULL)
 #define FULL (0xFFFFFFFFFFFFFFFFULL)
+#define LEFT_COLUMN (0x0101010101010101ULL)
 #define NUM_ACTIONS (4 * WIDTH - 2)
 
 typedef unsigned long long puyos_t;
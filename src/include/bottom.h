@@ -5,20 +5,32 @@ void bottom_render(puyos_t *floor, int num_colors);
 
 int bottom_handle_gravity(puyos_t *floor, int num_colors);
 
+int bottom_handle_gravity_moved(puyos_t *floor, int num_colors, puyos_t *moved);
+
 puyos_t bottom_clear_groups(puyos_t *floor, int num_colors);
 
+puyos_t bottom_clear_groups_from(puyos_t *floor, int num_colors, puyos_t seeds);
+
 int bottom_resolve(puyos_t *floor, int num_layers, int has_garbage);
 
+int bottom_resolve_incremental(puyos_t *floor, int num_layers, int has_garbage, puyos_t dirty);
+
 int bottom_clear_groups_and_garbage(puyos_t *floor, int num_layers, int has_garbage);
 
 char* bottom_encode(puyos_t *floor, int num_colors);
 
+void bottom_encode_into(puyos_t *floor, int num_colors, int width, int height, char *out);
+
 bitset_t bottom_valid_moves(puyos_t *floor, int num_colors);
 
-void make_move(puyos_t *floor, int action, int color_a, int color_b);
+puyos_t make_move(puyos_t *floor, int action, int color_a, int color_b);
+
+void overlay(puyos_t *floors, puyos_t *layer, int num_layers, int num_floors);
+
+void shift(puyos_t *floors, int num_words, int amount);
 
-void mirror(puyos_t *floor, int num_colors);
+void mirror(puyos_t *floors, int num_words, int width);
 
-double bottom_tree_search(puyos_t*, int, int, bitset_t, int*, int, int, double, puyos_t*);
+double bottom_tree_search(puyos_t*, int, int, bitset_t, int*, int, int, double, int, puyos_t*, transposition_table_t*, unsigned long long, deadline_t*);
 
 #endif /* !GYM_PUYOPUYO_BOTTOM_H_GUARD */
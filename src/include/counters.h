@@ -0,0 +1,25 @@
+#ifndef GYM_PUYOPUYO_COUNTERS_H_GUARD
+#define GYM_PUYOPUYO_COUNTERS_H_GUARD
+
+// Work done by the tree searches since the counting was last enabled.
+typedef struct search_counters {
+  unsigned long long nodes;
+  unsigned long long leaves;
+  unsigned long long table_probes;
+  unsigned long long table_hits;
+} search_counters_t;
+
+extern volatile int search_counting;
+
+extern search_counters_t search_counters;
+
+// Costs a single predictable branch while the counting is disabled.
+#define COUNT_SEARCH(counter) do { \
+  if (search_counting) { \
+    __sync_fetch_and_add(&search_counters.counter, 1ULL); \
+  } \
+} while (0)
+
+void search_counting_enable(int enabled);
+
+#endif /* !GYM_PUYOPUYO_COUNTERS_H_GUARD */
@@ -0,0 +1,16 @@
+#ifndef GYM_PUYOPUYO_DEADLINE_H_GUARD
+#define GYM_PUYOPUYO_DEADLINE_H_GUARD
+
+// Wall-clock limit shared by the threads of a search. Once expired it stays expired.
+typedef struct deadline {
+  double end;
+  volatile int expired;
+} deadline_t;
+
+double deadline_now(void);
+
+void deadline_start(deadline_t *deadline, double budget);
+
+int deadline_expired(deadline_t *deadline);
+
+#endif /* !GYM_PUYOPUYO_DEADLINE_H_GUARD */
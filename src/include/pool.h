@@ -0,0 +1,8 @@
+#ifndef GYM_PUYOPUYO_POOL_H_GUARD
+#define GYM_PUYOPUYO_POOL_H_GUARD
+
+typedef void (*work_fn)(void *context, int worker, int index);
+
+int parallel_for(int num_items, int num_threads, work_fn work, void *context);
+
+#endif /* !GYM_PUYOPUYO_POOL_H_GUARD */
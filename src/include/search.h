@@ -0,0 +1,50 @@
+#ifndef GYM_PUYOPUYO_SEARCH_H_GUARD
+#define GYM_PUYOPUYO_SEARCH_H_GUARD
+
+typedef struct search_config {
+  int num_layers;
+  int tall;
+  int width;
+  int tsu_rules;
+  int has_garbage;
+  bitset_t action_mask;
+  int depth;
+  double factor;
+  // Number of moves expanded per deal below the root. Zero searches every move.
+  int beam_width;
+  transposition_table_t *table;
+  // Keys the transposition table entries to the rules, factor and beam width so that searches can share a table.
+  unsigned long long salt;
+  deadline_t *deadline;
+} search_config_t;
+
+// Scratch memory of the searches. Zero initialize before the first use. Buffers only ever grow.
+typedef struct search_workspace {
+  int num_threads;
+  int colors_size;
+  int buffer_size;
+  int **worker_colors;
+  puyos_t **worker_buffers;
+  int num_roots;
+  bitset_t *valid;
+} search_workspace_t;
+
+int search_num_words(search_config_t *config);
+
+int search_workspace_reserve(search_workspace_t *workspace, search_config_t *config, int num_roots, int num_deals, int num_threads);
+
+void search_workspace_free(search_workspace_t *workspace);
+
+double search_field(search_config_t *config, puyos_t *floors, int *colors, int num_deals, puyos_t *child_buffer);
+
+int search_fields(search_config_t *config, search_workspace_t *workspace, puyos_t *fields, int num_fields, int *colors, int num_deals, int num_threads, double *scores);
+
+int search_fields_deepening(search_config_t *config, search_workspace_t *workspace, puyos_t *fields, int num_fields, int *colors, int num_deals, int num_threads, double time_budget, double *scores, double *iteration_scores);
+
+int search_roots(search_config_t *config, search_workspace_t *workspace, puyos_t *floors, int num_roots, int *colors, int num_deals, int num_threads, double *scores, int *popcounts);
+
+int search_root(search_config_t *config, search_workspace_t *workspace, puyos_t *floors, int *colors, int num_deals, int num_threads, double *scores, int *popcounts);
+
+int search_root_deepening(search_config_t *config, search_workspace_t *workspace, puyos_t *floors, int *colors, int num_deals, int num_threads, double time_budget, double *scores, int *popcounts);
+
+#endif /* !GYM_PUYOPUYO_SEARCH_H_GUARD */
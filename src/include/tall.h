@@ -11,6 +11,7 @@
 #define MAX_COLOR_BONUS (7)
 #define MAX_CHAIN_POWER (23)
 #define MAX_CLEAR_BONUS (999)
+#define ALL_CLEAR_BONUS (8500)
 
 extern const int COLOR_BONUS[];
 extern const int GROUP_BONUS[];
@@ -20,16 +21,24 @@ void tall_render(puyos_t *floors, int num_colors);
 
 int tall_handle_gravity(puyos_t *floors, int num_colors);
 
+int tall_handle_gravity_moved(puyos_t *floors, int num_colors, puyos_t *moved);
+
 int tall_clear_groups(puyos_t *bottom, puyos_t *top, int num_colors, int chain_number, int tsu_rules, puyos_t *cleared);
 
+int tall_clear_groups_from(puyos_t *top, puyos_t *bottom, int num_colors, int chain_number, int tsu_rules, puyos_t *seeds, puyos_t *cleared);
+
 int tall_resolve(puyos_t *floors, int num_colors, int tsu_rules, int has_garbage, int *chain_out);
 
+int tall_resolve_incremental(puyos_t *floors, int num_layers, int tsu_rules, int has_garbage, puyos_t dirty, int *chain_out);
+
 int tall_clear_groups_and_garbage(puyos_t *floors, int num_layers, int chain_number, int tsu_rules, int has_garbage);
 
 char* tall_encode(puyos_t *floors, int num_colors);
 
+void tall_encode_into(puyos_t *floors, int num_colors, int width, int height, char *out);
+
 bitset_t tall_valid_moves(puyos_t *floors, int num_colors, int width, int tsu_rules);
 
-double tall_tree_search(puyos_t*, int, int, int, int, bitset_t, int*, int, int, double, puyos_t*);
+double tall_tree_search(puyos_t*, int, int, int, int, bitset_t, int*, int, int, double, int, puyos_t*, transposition_table_t*, unsigned long long, deadline_t*);
 
 #endif /* !GYM_PUYOPUYO_TALL_H_GUARD */
@@ -0,0 +1,40 @@
+#ifndef GYM_PUYOPUYO_TRANSPOSITION_H_GUARD
+#define GYM_PUYOPUYO_TRANSPOSITION_H_GUARD
+
+#define BUCKET_SIZE (2)
+
+// The key is stored XORed with the data so that torn concurrent writes are detected as misses.
+typedef struct tt_entry {
+  unsigned long long check;
+  unsigned long long data;
+  unsigned int depth;
+  unsigned int generation;
+} tt_entry_t;
+
+// Upper bounds left by pruned searches live under their own keys so they never pass for exact values.
+#define UPPER_BOUND_KEY(key) ((key) ^ 0x9E3779B97F4A7C15ULL)
+
+typedef struct transposition_table {
+  tt_entry_t *entries;
+  unsigned long long mask;
+  unsigned int generation;
+} transposition_table_t;
+
+#define MAX_LOG2_TABLE_SIZE (40)
+
+// Returns NULL when out of memory. The size must be between 2 and 2**MAX_LOG2_TABLE_SIZE entries.
+transposition_table_t* transposition_table_new(int log2_size);
+
+void transposition_table_free(transposition_table_t *table);
+
+void transposition_table_clear(transposition_table_t *table);
+
+unsigned long long hash_config(int num_layers, int width, int tsu_rules, int has_garbage, bitset_t action_mask, double factor, int beam_width);
+
+unsigned long long hash_node(unsigned long long salt, puyos_t *floors, int num_words, int *colors, int num_deals, int depth);
+
+int transposition_table_probe(transposition_table_t *table, unsigned long long key, double *score);
+
+void transposition_table_store(transposition_table_t *table, unsigned long long key, int depth, double score);
+
+#endif /* !GYM_PUYOPUYO_TRANSPOSITION_H_GUARD */
@@ -0,0 +1,31 @@
+#ifndef GYM_PUYOPUYO_VERSUS_H_GUARD
+#define GYM_PUYOPUYO_VERSUS_H_GUARD
+
+// Rules and progress of a single versus mode player. The last layer of the field holds the garbage.
+typedef struct versus_state {
+  int num_layers;
+  int width;
+  int tall;
+  int tsu_rules;
+  int step_bonus;
+  int all_clear_bonus;
+  int target_score;
+  double max_received_garbage;
+
+  int chain_number;
+  int chain_score;
+  int step_score;
+  int pending_garbage;
+  int all_clear_pending;
+  int garbage_x;
+} versus_state_t;
+
+// Drops lines of garbage that continue from column garbage_x. Lines that don't fit fill the whole field.
+// Returns the column the next line continues from.
+int drop_garbage(puyos_t *floors, int num_layers, int tall, int width, int garbage_x, int amount);
+
+// Advances the player by one chain link or plays the move when no chain is in progress.
+// Returns the amount of garbage released or -1 if a chain ended without a positive target score.
+int versus_step(puyos_t *floors, versus_state_t *state, int move, int color_a, int color_b);
+
+#endif /* !GYM_PUYOPUYO_VERSUS_H_GUARD */
@@ -0,0 +1,73 @@
+#include <pthread.h>
+#include <stdlib.h>
+
+#include "pool.h"
+
+typedef struct pool_task {
+  int num_items;
+  int next_item;
+  work_fn work;
+  void *context;
+} pool_task_t;
+
+typedef struct pool_worker {
+  pool_task_t *task;
+  int index;
+} pool_worker_t;
+
+static void* pool_run(void *arg) {
+  pool_worker_t *worker = arg;
+  pool_task_t *task = worker->task;
+  while (1) {
+    int item = __sync_fetch_and_add(&task->next_item, 1);
+    if (item >= task->num_items) {
+      break;
+    }
+    task->work(task->context, worker->index, item);
+  }
+  return NULL;
+}
+
+// Calls work for every item using up to num_threads workers that pull items from a shared counter.
+// The calling thread acts as worker zero. Returns zero without doing any work when out of memory.
+int parallel_for(int num_items, int num_threads, work_fn work, void *context) {
+  if (num_threads > num_items) {
+    num_threads = num_items;
+  }
+  if (num_threads < 1) {
+    num_threads = 1;
+  }
+  if (num_threads == 1) {
+    for (int i = 0; i < num_items; ++i) {
+      work(context, 0, i);
+    }
+    return 1;
+  }
+  pool_task_t task = {num_items, 0, work, context};
+  pool_worker_t *workers = malloc(sizeof(pool_worker_t) * num_threads);
+  pthread_t *threads = malloc(sizeof(pthread_t) * num_threads);
+  int *started = calloc(num_threads, sizeof(int));
+  if (!workers || !threads || !started) {
+    free(started);
+    free(threads);
+    free(workers);
+    return 0;
+  }
+  for (int i = 0; i < num_threads; ++i) {
+    workers[i].task = &task;
+    workers[i].index = i;
+  }
+  for (int i = 1; i < num_threads; ++i) {
+    started[i] = !pthread_create(threads + i, NULL, pool_run, workers + i);
+  }
+  pool_run(workers);
+  for (int i = 1; i < num_threads; ++i) {
+    if (started[i]) {
+      pthread_join(threads[i], NULL);
+    }
+  }
+  free(started);
+  free(threads);
+  free(workers);
+  return 1;
+}
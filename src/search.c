@@ -0,0 +1,318 @@
+#include <math.h>
+#include <stdlib.h>
+#include <string.h>
+
+#include "bitboard.h"
+#include "transposition.h"
+#include "deadline.h"
+#include "bottom.h"
+#include "tall.h"
+#include "pool.h"
+#include "search.h"
+
+#define GAMMA (0.95)
+
+int search_num_words(search_config_t *config) {
+  if (config->tall) {
+    return config->num_layers * NUM_FLOORS;
+  }
+  return config->num_layers;
+}
+
+double search_field(search_config_t *config, puyos_t *floors, int *colors, int num_deals, puyos_t *child_buffer) {
+  if (config->tall) {
+    return tall_tree_search(
+      floors,
+      config->num_layers,
+      config->width,
+      config->tsu_rules,
+      config->has_garbage,
+      config->action_mask,
+      colors,
+      num_deals,
+      config->depth,
+      config->factor,
+      config->beam_width,
+      child_buffer,
+      config->table,
+      config->salt,
+      config->deadline
+    );
+  }
+  return bottom_tree_search(
+    floors,
+    config->num_layers,
+    config->has_garbage,
+    config->action_mask,
+    colors,
+    num_deals,
+    config->depth,
+    config->factor,
+    config->beam_width,
+    child_buffer,
+    config->table,
+    config->salt,
+    config->deadline
+  );
+}
+
+static void search_workspace_free_workers(search_workspace_t *workspace) {
+  for (int i = 0; i < workspace->num_threads; ++i) {
+    free(workspace->worker_colors[i]);
+    free(workspace->worker_buffers[i]);
+  }
+  free(workspace->worker_colors);
+  free(workspace->worker_buffers);
+  workspace->worker_colors = NULL;
+  workspace->worker_buffers = NULL;
+  workspace->num_threads = 0;
+  workspace->colors_size = 0;
+  workspace->buffer_size = 0;
+}
+
+// Makes room for searching num_roots fields with the configured depth. Returns zero when out of memory.
+// Searches must only be started on workspaces reserved for them.
+int search_workspace_reserve(search_workspace_t *workspace, search_config_t *config, int num_roots, int num_deals, int num_threads) {
+  if (num_threads < 1) {
+    num_threads = 1;
+  }
+  if (num_roots < 1) {
+    num_roots = 1;
+  }
+  // Chance nodes write the colors they draw past the known deals.
+  int colors_size = 2 * num_deals;
+  if (colors_size < 2 * config->depth + 2) {
+    colors_size = 2 * config->depth + 2;
+  }
+  int buffer_size = search_num_words(config) * (config->depth + 2);
+
+  if (num_threads > workspace->num_threads || colors_size > workspace->colors_size || buffer_size > workspace->buffer_size) {
+    if (num_threads < workspace->num_threads) {
+      num_threads = workspace->num_threads;
+    }
+    if (colors_size < workspace->colors_size) {
+      colors_size = workspace->colors_size;
+    }
+    if (buffer_size < workspace->buffer_size) {
+      buffer_size = workspace->buffer_size;
+    }
+    search_workspace_free_workers(workspace);
+    workspace->worker_colors = calloc(num_threads, sizeof(int*));
+    workspace->worker_buffers = calloc(num_threads, sizeof(puyos_t*));
+    if (!workspace->worker_colors || !workspace->worker_buffers) {
+      search_workspace_free_workers(workspace);
+      return 0;
+    }
+    workspace->num_threads = num_threads;
+    for (int i = 0; i < num_threads; ++i) {
+      workspace->worker_colors[i] = malloc(sizeof(int) * colors_size);
+      workspace->worker_buffers[i] = malloc(sizeof(puyos_t) * buffer_size);
+      if (!workspace->worker_colors[i] || !workspace->worker_buffers[i]) {
+        search_workspace_free_workers(workspace);
+        return 0;
+      }
+    }
+    workspace->colors_size = colors_size;
+    workspace->buffer_size = buffer_size;
+  }
+
+  if (num_roots > workspace->num_roots) {
+    bitset_t *valid = realloc(workspace->valid, sizeof(bitset_t) * num_roots);
+    if (!valid) {
+      return 0;
+    }
+    workspace->valid = valid;
+    workspace->num_roots = num_roots;
+  }
+  return 1;
+}
+
+void search_workspace_free(search_workspace_t *workspace) {
+  search_workspace_free_workers(workspace);
+  free(workspace->valid);
+  workspace->valid = NULL;
+  workspace->num_roots = 0;
+}
+
+typedef struct search_job {
+  search_config_t *config;
+  search_workspace_t *workspace;
+  puyos_t *fields;
+  int *colors;
+  int num_deals;
+  double *scores;
+} search_job_t;
+
+static void search_work(void *context, int worker, int index) {
+  search_job_t *job = context;
+  int *colors = job->workspace->worker_colors[worker];
+  // The search overwrites colors in chance nodes so each field starts from a fresh copy.
+  memcpy(colors, job->colors, sizeof(int) * 2 * job->num_deals);
+  job->scores[index] = search_field(
+    job->config,
+    job->fields + index * search_num_words(job->config),
+    colors,
+    job->num_deals,
+    job->workspace->worker_buffers[worker]
+  );
+}
+
+// Searches every field with the same colors spreading the work over threads. Returns zero when out of memory.
+int search_fields(search_config_t *config, search_workspace_t *workspace, puyos_t *fields, int num_fields, int *colors, int num_deals, int num_threads, double *scores) {
+  search_job_t job = {
+    config,
+    workspace,
+    fields,
+    colors,
+    num_deals,
+    scores,
+  };
+  return parallel_for(num_fields, num_threads, search_work, &job);
+}
+
+// Deepens the searches of the fields one ply at a time until the time budget runs out.
+// The leaves never check the deadline so the first iteration always completes.
+// Returns the depth of the last completed iteration whose scores are kept or -1 when out of memory.
+int search_fields_deepening(search_config_t *config, search_workspace_t *workspace, puyos_t *fields, int num_fields, int *colors, int num_deals, int num_threads, double time_budget, double *scores, double *iteration_scores) {
+  deadline_t deadline;
+  deadline_start(&deadline, time_budget);
+  search_config_t iteration = *config;
+  iteration.deadline = &deadline;
+
+  int depth_reached = 0;
+  for (int depth = 0; depth <= config->depth; ++depth) {
+    iteration.depth = depth;
+    if (!search_fields(&iteration, workspace, fields, num_fields, colors, num_deals, num_threads, iteration_scores)) {
+      return -1;
+    }
+    if (deadline.expired) {
+      break;
+    }
+    memcpy(scores, iteration_scores, sizeof(double) * num_fields);
+    depth_reached = depth;
+    if (deadline_expired(&deadline)) {
+      break;
+    }
+  }
+  return depth_reached;
+}
+
+typedef struct root_job {
+  search_config_t *config;
+  search_workspace_t *workspace;
+  puyos_t *floors;
+  int *colors;
+  int num_deals;
+  double *scores;
+  int *popcounts;
+} root_job_t;
+
+// Mirrors State.step on a copy of a root and searches the resulting child.
+static void root_work(void *context, int worker, int item) {
+  root_job_t *job = context;
+  search_config_t *config = job->config;
+  int num_words = search_num_words(config);
+  int root = item / NUM_ACTIONS;
+  int action = item % NUM_ACTIONS;
+  if (!(job->workspace->valid[root] & (1ULL << action))) {
+    job->scores[item] = -INFINITY;
+    job->popcounts[item] = -1;
+    return;
+  }
+  int *colors = job->workspace->worker_colors[worker];
+  puyos_t *child = job->workspace->worker_buffers[worker];
+  memcpy(colors, job->colors + root * 2 * job->num_deals, sizeof(int) * 2 * job->num_deals);
+  memcpy(child, job->floors + root * num_words, sizeof(puyos_t) * num_words);
+  make_move(child, action, colors[0], colors[1]);
+
+  double move_score;
+  if (config->tall) {
+    int chain;
+    move_score = tall_resolve(child, config->num_layers, config->tsu_rules, config->has_garbage, &chain);
+  } else {
+    move_score = bottom_resolve(child, config->num_layers, config->has_garbage);
+    move_score *= move_score;
+  }
+  int popcount_ = 0;
+  for (int i = 0; i < num_words; ++i) {
+    popcount_ += popcount(child[i]);
+  }
+  if (config->tall && !popcount_) {
+    move_score += ALL_CLEAR_BONUS;
+  }
+  job->popcounts[item] = popcount_;
+
+  search_config_t child_config = *config;
+  child_config.depth--;
+  double tree_score = search_field(&child_config, child, colors + 2, job->num_deals - 1, child + num_words);
+  job->scores[item] = move_score + GAMMA * tree_score;
+}
+
+// Scores every action of every root playing the first deal of its colors.
+// The roots are consecutive fields and each has 2 * num_deals colors.
+// The scores and popcounts are (num_roots, NUM_ACTIONS) arrays with every (root, action) pair searched in parallel.
+// Invalid actions score -INFINITY and have a popcount of -1. Returns zero when out of memory.
+int search_roots(search_config_t *config, search_workspace_t *workspace, puyos_t *floors, int num_roots, int *colors, int num_deals, int num_threads, double *scores, int *popcounts) {
+  int num_words = search_num_words(config);
+  bitset_t *valid = workspace->valid;
+  for (int i = 0; i < num_roots; ++i) {
+    puyos_t *root = floors + i * num_words;
+    if (config->tall) {
+      valid[i] = tall_valid_moves(root, config->num_layers, config->width, config->tsu_rules);
+    } else {
+      valid[i] = bottom_valid_moves(root, config->num_layers);
+    }
+    valid[i] |= valid[i] << (NUM_ACTIONS / 2);
+    valid[i] &= config->action_mask;
+    if (num_deals < 1) {
+      valid[i] = 0;
+    }
+  }
+
+  root_job_t job = {
+    config,
+    workspace,
+    floors,
+    colors,
+    num_deals,
+    scores,
+    popcounts,
+  };
+  return parallel_for(num_roots * NUM_ACTIONS, num_threads, root_work, &job);
+}
+
+// Scores every action of the root playing the first deal in the colors.
+// Invalid actions score -INFINITY and have a popcount of -1. Returns zero when out of memory.
+int search_root(search_config_t *config, search_workspace_t *workspace, puyos_t *floors, int *colors, int num_deals, int num_threads, double *scores, int *popcounts) {
+  return search_roots(config, workspace, floors, 1, colors, num_deals, num_threads, scores, popcounts);
+}
+
+// Searches the root with increasing depths up to the configured one until the time budget in milliseconds runs out.
+// The scores and popcounts are those of the deepest completed iteration whose depth is returned.
+// The first iteration only evaluates leaves and always completes. Returns -1 when out of memory.
+int search_root_deepening(search_config_t *config, search_workspace_t *workspace, puyos_t *floors, int *colors, int num_deals, int num_threads, double time_budget, double *scores, int *popcounts) {
+  deadline_t deadline;
+  deadline_start(&deadline, time_budget);
+  search_config_t iteration = *config;
+  iteration.deadline = &deadline;
+
+  double iteration_scores[NUM_ACTIONS];
+  int iteration_popcounts[NUM_ACTIONS];
+  int depth_reached = 0;
+  for (int depth = 1; depth <= config->depth || !depth_reached; ++depth) {
+    iteration.depth = depth;
+    if (!search_root(&iteration, workspace, floors, colors, num_deals, num_threads, iteration_scores, iteration_popcounts)) {
+      return -1;
+    }
+    if (deadline.expired) {
+      break;
+    }
+    memcpy(scores, iteration_scores, sizeof(double) * NUM_ACTIONS);
+    memcpy(popcounts, iteration_popcounts, sizeof(int) * NUM_ACTIONS);
+    depth_reached = depth;
+    if (deadline_expired(&deadline)) {
+      break;
+    }
+  }
+  return depth_reached;
+}
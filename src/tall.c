@@ -2,6 +2,8 @@
 #include <stdlib.h>
 
 #include "bitboard.h"
+#include "transposition.h"
+#include "deadline.h"
 #include "bottom.h"
 #include "tall.h"
 
@@ -34,6 +36,8 @@ void tall_render(puyos_t *floors, int num_colors) {
   }
 }
 
+// Drops the puyos one row per pass and returns the number of passes including the final one where nothing moved.
+// The searches and the resolves only need to know whether anything fell and use tall_handle_gravity_moved instead.
 int tall_handle_gravity(puyos_t *floors, int num_colors) {
     puyos_t *top = floors;
     puyos_t *bottom = floors + num_colors;
@@ -73,6 +77,116 @@ int tall_handle_gravity(puyos_t *floors, int num_colors) {
     return iterations;
 }
 
+// Shifts the puyos of both floors up by the given number of rows. Rows above the field are lost.
+static void shift_up_2(puyos_t *puyos, int rows) {
+    int shift = rows * V_SHIFT;
+    if (shift >= WIDTH * HEIGHT) {
+        puyos[0] = puyos[1] >> (shift - WIDTH * HEIGHT);
+        puyos[1] = 0;
+    } else {
+        puyos[0] = (puyos[0] >> shift) | (puyos[1] << (WIDTH * HEIGHT - shift));
+        puyos[1] >>= shift;
+    }
+}
+
+// Shifts the puyos of both floors down by the given number of rows. Rows below the field are lost.
+static void shift_down_2(puyos_t *puyos, int rows) {
+    int shift = rows * V_SHIFT;
+    if (shift >= WIDTH * HEIGHT) {
+        puyos[1] = puyos[0] << (shift - WIDTH * HEIGHT);
+        puyos[0] = 0;
+    } else {
+        puyos[1] = (puyos[1] << shift) | (puyos[0] >> (WIDTH * HEIGHT - shift));
+        puyos[0] <<= shift;
+    }
+}
+
+// Handles gravity and marks the positions of the puyos that fell. Returns whether anything fell.
+// Every puyo falls by the number of empty positions below it. The columns are compacted in parallel
+// with the bit compression of Hacker's Delight (section 7-4) turned to run down the columns.
+// Each of the rounds moves the puyos by a power of two rows so a field settles in a fixed number of steps.
+int tall_handle_gravity_moved(puyos_t *floors, int num_colors, puyos_t *moved) {
+    puyos_t *top = floors;
+    puyos_t *bottom = floors + num_colors;
+    puyos_t all[2] = {0, 0};
+    for (int i = 0; i < num_colors; ++i) {
+        all[0] |= top[i];
+        all[1] |= bottom[i];
+    }
+
+    // Positions with an empty position at or below them.
+    puyos_t hollow[2] = {~all[0], ~all[1]};
+    for (int rows = 1; rows < NUM_FLOORS * HEIGHT; rows <<= 1) {
+        puyos_t temp[2] = {hollow[0], hollow[1]};
+        shift_up_2(temp, rows);
+        hollow[0] |= temp[0];
+        hollow[1] |= temp[1];
+    }
+    if (!((all[0] & hollow[0]) | (all[1] & hollow[1]))) {
+        moved[0] = 0;
+        moved[1] = 0;
+        return 0;
+    }
+
+    // Marks the positions directly above empty ones.
+    puyos_t empty_below[2] = {~all[0], ~all[1]};
+    shift_up_2(empty_below, 1);
+    for (int rows = 1; rows < NUM_FLOORS * HEIGHT; rows <<= 1) {
+        // Parity of the empty positions below each position.
+        puyos_t parity[2] = {empty_below[0], empty_below[1]};
+        for (int k = 1; k < NUM_FLOORS * HEIGHT; k <<= 1) {
+            puyos_t temp[2] = {parity[0], parity[1]};
+            shift_up_2(temp, k);
+            parity[0] ^= temp[0];
+            parity[1] ^= temp[1];
+        }
+        empty_below[0] &= ~parity[0];
+        empty_below[1] &= ~parity[1];
+
+        puyos_t falling[2] = {all[0] & parity[0], all[1] & parity[1]};
+        if (!(falling[0] | falling[1])) {
+            continue;
+        }
+        all[0] ^= falling[0];
+        all[1] ^= falling[1];
+        shift_down_2(falling, rows);
+        all[0] |= falling[0];
+        all[1] |= falling[1];
+        for (int i = 0; i < num_colors; ++i) {
+            puyos_t temp[2] = {top[i] & parity[0], bottom[i] & parity[1]};
+            top[i] ^= temp[0];
+            bottom[i] ^= temp[1];
+            shift_down_2(temp, rows);
+            top[i] |= temp[0];
+            bottom[i] |= temp[1];
+        }
+    }
+
+    // The puyos resting on solid ground didn't move and the rest of the puyos landed above them.
+    moved[0] = all[0] & hollow[0];
+    moved[1] = all[1] & hollow[1];
+    return 1;
+}
+
+static int tall_clear_score(int num_cleared, int group_bonus, bitset_t color_flags, int chain_number) {
+    int color_bonus = popcount(color_flags);
+    if (color_bonus > MAX_COLOR_BONUS) {
+        color_bonus = MAX_COLOR_BONUS;
+    }
+    color_bonus = COLOR_BONUS[color_bonus];
+    if (chain_number > MAX_CHAIN_POWER) {
+        chain_number = MAX_CHAIN_POWER;
+    }
+    int chain_power = CHAIN_POWERS[chain_number];
+    int clear_bonus = chain_power + color_bonus + group_bonus;
+    if (clear_bonus < 1) {
+        clear_bonus = 1;
+    } else if (clear_bonus > MAX_CLEAR_BONUS) {
+        clear_bonus = MAX_CLEAR_BONUS;
+    }
+    return (10 * num_cleared) * clear_bonus;
+}
+
 int tall_clear_groups(puyos_t *top, puyos_t *bottom, int num_colors, int chain_number, int tsu_rules, puyos_t *cleared) {
     int num_cleared = 0;
     int group_bonus = 0;
@@ -138,22 +252,46 @@ int tall_clear_groups(puyos_t *top, puyos_t *bottom, int num_colors, int chain_n
             }
         }
     }
-    int color_bonus = popcount(color_flags);
-    if (color_bonus > MAX_COLOR_BONUS) {
-        color_bonus = MAX_COLOR_BONUS;
-    }
-    color_bonus = COLOR_BONUS[color_bonus];
-    if (chain_number > MAX_CHAIN_POWER) {
-        chain_number = MAX_CHAIN_POWER;
-    }
-    int chain_power = CHAIN_POWERS[chain_number];
-    int clear_bonus = chain_power + color_bonus + group_bonus;
-    if (clear_bonus < 1) {
-        clear_bonus = 1;
-    } else if (clear_bonus > MAX_CLEAR_BONUS) {
-        clear_bonus = MAX_CLEAR_BONUS;
+    return tall_clear_score(num_cleared, group_bonus, color_flags, chain_number);
+}
+
+// Clears only the groups that contain at least one of the seed positions and scores them like tall_clear_groups.
+int tall_clear_groups_from(puyos_t *top, puyos_t *bottom, int num_colors, int chain_number, int tsu_rules, puyos_t *seeds, puyos_t *cleared) {
+    int num_cleared = 0;
+    int group_bonus = 0;
+    bitset_t color_flags = 0;
+    cleared[0] = 0;
+    cleared[1] = 0;
+    puyos_t life_block = tsu_rules ? LIFE_BLOCK : FULL;
+    for (int i = 0; i < num_colors; ++i) {
+        puyos_t layer[2] = {top[i] & life_block, bottom[i]};
+        puyos_t seed[2] = {seeds[0] & layer[0], seeds[1] & layer[1]};
+        while (seed[0] || seed[1]) {
+            puyos_t group[2] = {seed[0] & -seed[0], 0};
+            if (!group[0]) {
+                group[1] = seed[1] & -seed[1];
+            }
+            flood_2(group, layer);
+            seed[0] &= ~group[0];
+            seed[1] &= ~group[1];
+            int group_size = popcount_2(group);
+            if (group_size >= CLEAR_THRESHOLD) {
+                top[i] ^= group[0];
+                bottom[i] ^= group[1];
+                num_cleared += group_size;
+
+                group_size -= CLEAR_THRESHOLD;
+                if (group_size > MAX_GROUP_BONUS) {
+                    group_size = MAX_GROUP_BONUS;
+                }
+                group_bonus += GROUP_BONUS[group_size];
+                color_flags |= 1ULL << i;
+                cleared[0] |= group[0];
+                cleared[1] |= group[1];
+            }
+        }
     }
-    return (10 * num_cleared) * clear_bonus;
+    return tall_clear_score(num_cleared, group_bonus, color_flags, chain_number);
 }
 
 void tall_kill_puyos(puyos_t *floors, int num_colors) {
@@ -167,8 +305,9 @@ int tall_resolve(puyos_t *floors, int num_layers, int tsu_rules, int has_garbage
     int total_score = 0;
     while(1) {
         ++chain;
-        int iterations = tall_handle_gravity(floors, num_layers);
-        if (iterations == 1 && chain > 0) {
+        puyos_t moved[2];
+        int fell = tall_handle_gravity_moved(floors, num_layers, moved);
+        if (!fell && chain > 0) {
             break;
         }
         if (tsu_rules) {
@@ -193,6 +332,45 @@ int tall_resolve(puyos_t *floors, int num_layers, int tsu_rules, int has_garbage
     return total_score;
 }
 
+// Same as tall_resolve for fields that had no groups to clear before the dirty puyos were placed on the top floor.
+// Only groups touching dirty or fallen puyos can form so the others aren't flooded at all.
+int tall_resolve_incremental(puyos_t *floors, int num_layers, int tsu_rules, int has_garbage, puyos_t dirty, int *chain_out) {
+    int chain = -1;
+    int total_score = 0;
+    puyos_t seeds[2] = {dirty, 0};
+    while(1) {
+        ++chain;
+        puyos_t moved[2];
+        int fell = tall_handle_gravity_moved(floors, num_layers, moved);
+        if (!fell && chain > 0) {
+            break;
+        }
+        if (tsu_rules) {
+            tall_kill_puyos(floors, num_layers);
+        }
+        seeds[0] |= moved[0];
+        seeds[1] |= moved[1];
+        puyos_t cleared[2];
+        int score = tall_clear_groups_from(floors, floors + num_layers, num_layers - has_garbage, chain, tsu_rules, seeds, cleared);
+        if (!score) {
+            break;
+        } else if (has_garbage) {
+            cross_2(cleared);
+            if (tsu_rules) {
+                floors[num_layers - 1] &= ~(cleared[0] & LIFE_BLOCK);
+            } else {
+                floors[num_layers - 1] &= ~cleared[0];
+            }
+            floors[2 * num_layers - 1] &= ~cleared[1];
+        }
+        total_score += score;
+        seeds[0] = 0;
+        seeds[1] = 0;
+    }
+    *chain_out = chain;
+    return total_score;
+}
+
 int tall_clear_groups_and_garbage(puyos_t *floors, int num_layers, int chain_number, int tsu_rules, int has_garbage) {
     puyos_t cleared[2];
     int score = tall_clear_groups(floors, floors + num_layers, num_layers - has_garbage, chain_number, tsu_rules, cleared);
@@ -224,6 +402,18 @@ char* tall_encode(puyos_t *floors, int num_colors) {
   return data;
 }
 
+// Writes the visible part of the field into a (num_colors, height, width) array.
+void tall_encode_into(puyos_t *floors, int num_colors, int width, int height, char *out) {
+  for (int i = 0; i < num_colors; ++i) {
+    for (int y = NUM_FLOORS * HEIGHT - height; y < NUM_FLOORS * HEIGHT; ++y) {
+      unsigned char line = floors[i + (y / HEIGHT) * num_colors] >> ((y % HEIGHT) * V_SHIFT);
+      for (int x = 0; x < width; ++x) {
+        *out++ = (line >> x) & 1;
+      }
+    }
+  }
+}
+
 bitset_t tall_valid_moves(puyos_t *floors, int num_colors, int width, int tsu_rules) {
   if (!tsu_rules) {
     return bottom_valid_moves(floors, num_colors);
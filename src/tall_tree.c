@@ -1,23 +1,46 @@
+#include <math.h>
 #include <stdlib.h>
 #include <string.h>
 
 #include <stdio.h>
 
 #include "bitboard.h"
+#include "transposition.h"
+#include "deadline.h"
+#include "counters.h"
 #include "bottom.h"
 #include "tall.h"
 
 #define GAMMA (0.95)
+// Relative slack keeping pruned values safely below the thresholds despite rounding.
+#define PRUNING_MARGIN (1e-9)
 #define DEATH_VALUE (-10000)
 
+// Sum of the squared sizes of the groups in the field.
+// Lone puyos are counted in bulk and the rest of the groups are flooded starting from their lowest puyo.
 int tall_group_heuristic(puyos_t *top, puyos_t *bottom, int num_colors) {
     int score = 0;
     for (int i = 0; i < num_colors; ++i) {
         puyos_t layer[2] = {top[i], bottom[i]};
+        puyos_t neighbours[2];
         for (int k = 0; k < NUM_FLOORS; ++k) {
-            for (int j = 0; j < WIDTH * HEIGHT; j += 2) {
+            neighbours[k] = (
+                ((layer[k] & RIGHT_BLOCK) >> H_SHIFT) |
+                ((layer[k] << H_SHIFT) & RIGHT_BLOCK) |
+                (layer[k] << V_SHIFT) |
+                (layer[k] >> V_SHIFT)
+            );
+        }
+        neighbours[0] |= (layer[1] & TOP) << TOP_TO_BOTTOM;
+        neighbours[1] |= (layer[0] & BOTTOM) >> TOP_TO_BOTTOM;
+        for (int k = 0; k < NUM_FLOORS; ++k) {
+            score += popcount(layer[k] & ~neighbours[k]);
+            layer[k] &= neighbours[k];
+        }
+        for (int k = 0; k < NUM_FLOORS; ++k) {
+            while (layer[k]) {
                 puyos_t group[2] = {0, 0};
-                group[k] = 3ULL << j;
+                group[k] = layer[k] & -layer[k];
                 flood_2(group, layer);
                 layer[0] ^= group[0];
                 layer[1] ^= group[1];
@@ -29,6 +52,94 @@ int tall_group_heuristic(puyos_t *top, puyos_t *bottom, int num_colors) {
     return score;
 }
 
+// Orders the valid moves best first by their immediate reward plus the discounted heuristic of the resulting field.
+// This is the value the moves would get from a search of depth one. Returns the number of valid moves.
+static int tall_rank_moves(puyos_t *floors, int num_layers, int tsu_rules, int has_garbage, bitset_t valid, int num_actions, int *colors, double factor, puyos_t *child, int *order) {
+    int num_colors = num_layers - has_garbage;
+    double keys[NUM_ACTIONS];
+    int num_moves = 0;
+    for (int i = 0; i < num_actions; ++i) {
+        if (!(valid & (1ULL << i))) {
+            continue;
+        }
+        memcpy(child, floors, sizeof(puyos_t) * num_layers * NUM_FLOORS);
+        puyos_t placed = make_move(child, i, colors[0], colors[1]);
+        int chain;
+        double key = tall_resolve_incremental(child, num_layers, tsu_rules, has_garbage, placed, &chain);
+        key += GAMMA * factor * tall_group_heuristic(child, child + num_layers, num_colors);
+        // Insertion sort keeps equal keys in index order.
+        int j = num_moves++;
+        while (j > 0 && keys[j - 1] < key) {
+            keys[j] = keys[j - 1];
+            order[j] = order[j - 1];
+            --j;
+        }
+        keys[j] = key;
+        order[j] = i;
+    }
+    return num_moves;
+}
+
+// Upper bound for the value of any line of play of the given depth from the field.
+// Every link of a chain clears at least CLEAR_THRESHOLD puyos which bounds the number of links and the clear bonus.
+// Leaves are resolved so their groups are smaller than CLEAR_THRESHOLD
+// unless they are joined through the rows above the life block under tsu rules.
+static double tall_value_bound(puyos_t *floors, int num_layers, int num_colors, int tsu_rules, int depth, double factor) {
+    int num_puyos = 2 * depth;
+    int num_ghosts = 2 * depth;
+    for (int i = 0; i < num_colors; ++i) {
+        num_puyos += popcount(floors[i]) + popcount(floors[i + num_layers]);
+        num_ghosts += popcount(floors[i] & ~LIFE_BLOCK);
+    }
+    double bound = 0;
+    int max_links = num_puyos / CLEAR_THRESHOLD;
+    if (max_links) {
+        int chain_power = CHAIN_POWERS[max_links - 1 > MAX_CHAIN_POWER ? MAX_CHAIN_POWER : max_links - 1];
+        int color_bonus = 0;
+        for (int i = 0; i <= num_colors && i <= MAX_COLOR_BONUS; ++i) {
+            if (COLOR_BONUS[i] > color_bonus) {
+                color_bonus = COLOR_BONUS[i];
+            }
+        }
+        int clear_bonus = chain_power + color_bonus + GROUP_BONUS[MAX_GROUP_BONUS] * max_links;
+        if (clear_bonus > MAX_CLEAR_BONUS) {
+            clear_bonus = MAX_CLEAR_BONUS;
+        }
+        bound += 10.0 * num_puyos * clear_bonus;
+    }
+    if (factor > 0) {
+        int max_group = CLEAR_THRESHOLD - 1;
+        if (tsu_rules) {
+            // Each ghost puyo can connect to one group below it.
+            max_group += CLEAR_THRESHOLD * num_ghosts;
+            if (max_group > num_puyos) {
+                max_group = num_puyos;
+            }
+        }
+        bound += factor * max_group * num_puyos;
+    }
+    return bound;
+}
+
+static double tall_tree_search_bounded(
+    puyos_t *floors,
+    int num_layers,
+    int width,
+    int tsu_rules,
+    int has_garbage,
+    bitset_t action_mask,
+    int *colors,
+    int num_deals,
+    int depth,
+    double factor,
+    double alpha,
+    int beam_width,
+    puyos_t *child_buffer,
+    transposition_table_t *table,
+    unsigned long long salt,
+    deadline_t *deadline
+);
+
 double tall_tree_search_single(
     puyos_t *floors,
     int num_layers,
@@ -40,7 +151,12 @@ double tall_tree_search_single(
     int num_deals,
     int depth,
     double factor,
-    puyos_t *child_buffer
+    double alpha,
+    int beam_width,
+    puyos_t *child_buffer,
+    transposition_table_t *table,
+    unsigned long long salt,
+    deadline_t *deadline
 ) {
     bitset_t valid = tall_valid_moves(floors, num_layers, width, tsu_rules);
     valid |= valid << (NUM_ACTIONS / 2);
@@ -59,19 +175,37 @@ double tall_tree_search_single(
         num_actions /= 2;
     }
 
-    for (int i = 0; i < num_actions; ++i) {
-        bitset_t move = 1ULL << i;
-        if (!(valid & move)) {
-            continue;
+    // Beam search only expands the most promising moves. The last ply is exact anyway.
+    int order[NUM_ACTIONS];
+    int num_moves = 0;
+    if (beam_width > 0 && depth > 1) {
+        num_moves = tall_rank_moves(floors, num_layers, tsu_rules, has_garbage, valid, num_actions, colors, factor, child, order);
+        if (num_moves > beam_width) {
+            num_moves = beam_width;
         }
+    } else {
+        for (int i = 0; i < num_actions; ++i) {
+            if (valid & (1ULL << i)) {
+                order[num_moves++] = i;
+            }
+        }
+    }
 
+    for (int k = 0; k < num_moves; ++k) {
+        int i = order[k];
         memcpy(child, floors, sizeof(puyos_t) * num_layers * NUM_FLOORS);
-        make_move(child, i, colors[0], colors[1]);
+        puyos_t placed = make_move(child, i, colors[0], colors[1]);
 
+        // Searched fields are always resolved so only the new puyos can start a chain.
         int dummy;
-        double move_score = tall_resolve(child, num_layers, tsu_rules, has_garbage, &dummy);
+        double move_score = tall_resolve_incremental(child, num_layers, tsu_rules, has_garbage, placed, &dummy);
 
-        double tree_score = tall_tree_search(
+        // The child only matters if it beats both alpha and the best move so far.
+        double threshold = score > alpha ? score : alpha;
+        double child_alpha = (threshold - move_score) / GAMMA;
+        child_alpha -= PRUNING_MARGIN * (1 + fabs(child_alpha));
+
+        double tree_score = tall_tree_search_bounded(
             child,
             num_layers,
             width,
@@ -82,7 +216,12 @@ double tall_tree_search_single(
             num_deals - 1,
             depth - 1,
             factor,
-            child_buffer + num_layers * NUM_FLOORS
+            child_alpha,
+            beam_width,
+            child_buffer + num_layers * NUM_FLOORS,
+            table,
+            salt,
+            deadline
         );
 
         double child_score = move_score + GAMMA * tree_score;
@@ -93,7 +232,7 @@ double tall_tree_search_single(
     return score;
 }
 
-double tall_tree_search(
+static double tall_tree_search_bounded(
     puyos_t *floors,
     int num_layers,
     int width,
@@ -104,17 +243,53 @@ double tall_tree_search(
     int num_deals,
     int depth,
     double factor,
-    puyos_t *child_buffer
+    double alpha,
+    int beam_width,
+    puyos_t *child_buffer,
+    transposition_table_t *table,
+    unsigned long long salt,
+    deadline_t *deadline
 ) {
     int num_colors = num_layers - has_garbage;
 
-    if (depth <= 0) {
-        return factor * tall_group_heuristic(floors, floors + num_layers, num_colors);
+    if (depth < 0) {
+        depth = 0;
     }
 
-    if (num_deals > 0) {
+    COUNT_SEARCH(nodes);
+    unsigned long long key = 0;
+    double tree_score;
+    if (table) {
+        // Leaf values don't depend on the deals.
+        key = hash_node(salt, floors, num_layers * NUM_FLOORS, colors, depth ? num_deals : 0, depth);
+        COUNT_SEARCH(table_probes);
+        if (transposition_table_probe(table, key, &tree_score)) {
+            COUNT_SEARCH(table_hits);
+            return tree_score;
+        }
+        // A bound left by an earlier pruned search may already rule the node out.
+        if (alpha > -INFINITY) {
+            COUNT_SEARCH(table_probes);
+            if (transposition_table_probe(table, UPPER_BOUND_KEY(key), &tree_score) && tree_score <= alpha) {
+                COUNT_SEARCH(table_hits);
+                return tree_score;
+            }
+        }
+    }
+
+    // Interior nodes give up once the deadline expires. The caller discards the result.
+    if (depth && deadline && deadline_expired(deadline)) {
+        return 0;
+    }
+
+    // Values at or below alpha may be upper bounds instead of exact values.
+    int cut = 0;
+    if (!depth) {
+        COUNT_SEARCH(leaves);
+        tree_score = factor * tall_group_heuristic(floors, floors + num_layers, num_colors);
+    } else if (num_deals > 0) {
         // Deterministic search with the provided colors.
-        return tall_tree_search_single(
+        tree_score = tall_tree_search_single(
             floors,
             num_layers,
             width,
@@ -125,15 +300,34 @@ double tall_tree_search(
             num_deals - 1,
             depth,
             factor,
-            child_buffer
+            alpha,
+            beam_width,
+            child_buffer,
+            table,
+            salt,
+            deadline
         );
+        cut = (tree_score <= alpha);
     } else {
         // Averaged search over all possible color combinations.
-        double tree_score = 0;
-        for (int c0 = 0; c0 < num_colors; ++c0) {
+        // Star1 pruning: the remaining combinations are assumed to reach the value bound
+        // and the search stops once even that can't lift the average above alpha.
+        double total_weight = num_colors * num_colors;
+        double remaining_weight = total_weight;
+        double bound = 0;
+        if (alpha > -INFINITY) {
+            bound = tall_value_bound(floors, num_layers, num_colors, tsu_rules, depth, factor);
+        }
+        tree_score = 0;
+        for (int c0 = 0; c0 < num_colors && !cut; ++c0) {
             colors[0] = c0;
             // Symmetry reduction
             for (int c1 = c0; c1 < num_colors; ++c1) {
+                if (tree_score + remaining_weight * bound <= alpha * total_weight) {
+                    tree_score += remaining_weight * bound;
+                    cut = 1;
+                    break;
+                }
                 colors[1] = c1;
                 double single_score = tall_tree_search_single(
                     floors,
@@ -146,17 +340,65 @@ double tall_tree_search(
                     0,
                     depth,
                     factor,
-                    child_buffer
+                    -INFINITY,
+                    beam_width,
+                    child_buffer,
+                    table,
+                    salt,
+                    deadline
                 );
                 // Symmetry compensation
                 if (c1 == c0) {
                     tree_score += single_score;
+                    remaining_weight -= 1;
                 } else {
                     tree_score += 2 * single_score;
+                    remaining_weight -= 2;
                 }
             }
         }
-        tree_score /= num_colors * num_colors;
-        return tree_score;
+        tree_score /= total_weight;
+    }
+    if (table && !(deadline && deadline->expired)) {
+        transposition_table_store(table, cut ? UPPER_BOUND_KEY(key) : key, depth, tree_score);
     }
+    return tree_score;
+}
+
+// The value of the field is exact. Only the nodes below are pruned against their siblings.
+double tall_tree_search(
+    puyos_t *floors,
+    int num_layers,
+    int width,
+    int tsu_rules,
+    int has_garbage,
+    bitset_t action_mask,
+    int *colors,
+    int num_deals,
+    int depth,
+    double factor,
+    int beam_width,
+    puyos_t *child_buffer,
+    transposition_table_t *table,
+    unsigned long long salt,
+    deadline_t *deadline
+) {
+    return tall_tree_search_bounded(
+        floors,
+        num_layers,
+        width,
+        tsu_rules,
+        has_garbage,
+        action_mask,
+        colors,
+        num_deals,
+        depth,
+        factor,
+        -INFINITY,
+        beam_width,
+        child_buffer,
+        table,
+        salt,
+        deadline
+    );
 }
@@ -0,0 +1,111 @@
+#include <stdlib.h>
+#include <string.h>
+
+#include "bitboard.h"
+#include "transposition.h"
+
+transposition_table_t* transposition_table_new(int log2_size) {
+  if (log2_size < 1 || log2_size > MAX_LOG2_TABLE_SIZE) {
+    return NULL;
+  }
+  transposition_table_t *table = malloc(sizeof(transposition_table_t));
+  if (!table) {
+    return NULL;
+  }
+  table->mask = (1ULL << log2_size) - 1;
+  table->entries = malloc(sizeof(tt_entry_t) * (table->mask + 1));
+  if (!table->entries) {
+    free(table);
+    return NULL;
+  }
+  transposition_table_clear(table);
+  return table;
+}
+
+void transposition_table_free(transposition_table_t *table) {
+  free(table->entries);
+  free(table);
+}
+
+void transposition_table_clear(transposition_table_t *table) {
+  memset(table->entries, 0, sizeof(tt_entry_t) * (table->mask + 1));
+  table->generation = 1;
+}
+
+static unsigned long long mix(unsigned long long h) {
+  h ^= h >> 33;
+  h *= 0xFF51AFD7ED558CCDULL;
+  h ^= h >> 33;
+  h *= 0xC4CEB9FE1A85EC53ULL;
+  h ^= h >> 33;
+  return h;
+}
+
+static unsigned long long double_bits(double value) {
+  unsigned long long bits;
+  memcpy(&bits, &value, sizeof(bits));
+  return bits;
+}
+
+unsigned long long hash_config(int num_layers, int width, int tsu_rules, int has_garbage, bitset_t action_mask, double factor, int beam_width) {
+  unsigned long long h = mix(num_layers | (width << 8) | (tsu_rules << 16) | (has_garbage << 17));
+  h = mix(h ^ action_mask);
+  h = mix(h ^ (unsigned int)beam_width);
+  return mix(h ^ double_bits(factor));
+}
+
+// Positions are keyed on the configuration salt, the field, remaining depth and the known deals.
+unsigned long long hash_node(unsigned long long salt, puyos_t *floors, int num_words, int *colors, int num_deals, int depth) {
+  unsigned long long h = mix(salt ^ (unsigned int)depth);
+  for (int i = 0; i < num_words; ++i) {
+    h = mix(h ^ floors[i]);
+  }
+  if (num_deals < 0) {
+    num_deals = 0;
+  }
+  h = mix(h ^ num_deals);
+  for (int i = 0; i < 2 * num_deals; ++i) {
+    h = mix(h ^ colors[i]);
+  }
+  return h;
+}
+
+int transposition_table_probe(transposition_table_t *table, unsigned long long key, double *score) {
+  tt_entry_t *bucket = table->entries + (key & table->mask & ~(BUCKET_SIZE - 1ULL));
+  for (int i = 0; i < BUCKET_SIZE; ++i) {
+    unsigned long long data = bucket[i].data;
+    if ((bucket[i].check ^ data) == key) {
+      memcpy(score, &data, sizeof(double));
+      return 1;
+    }
+  }
+  return 0;
+}
+
+// Replaces an entry from an older search first and the shallowest entry otherwise.
+void transposition_table_store(transposition_table_t *table, unsigned long long key, int depth, double score) {
+  tt_entry_t *bucket = table->entries + (key & table->mask & ~(BUCKET_SIZE - 1ULL));
+  tt_entry_t *victim = bucket;
+  for (int i = 0; i < BUCKET_SIZE; ++i) {
+    tt_entry_t *entry = bucket + i;
+    if ((entry->check ^ entry->data) == key) {
+      victim = entry;
+      break;
+    }
+    if (entry->generation != table->generation) {
+      if (victim->generation == table->generation || entry->depth < victim->depth) {
+        victim = entry;
+      }
+    } else if (victim->generation == table->generation && entry->depth < victim->depth) {
+      victim = entry;
+    }
+  }
+  if (victim->generation == table->generation && (unsigned int)depth < victim->depth) {
+    return;
+  }
+  unsigned long long data = double_bits(score);
+  victim->check = key ^ data;
+  victim->data = data;
+  victim->depth = depth;
+  victim->generation = table->generation;
+}
@@ -0,0 +1,141 @@
+#include "bitboard.h"
+#include "transposition.h"
+#include "deadline.h"
+#include "bottom.h"
+#include "tall.h"
+#include "versus.h"
+
+int drop_garbage(puyos_t *floors, int num_layers, int tall, int width, int garbage_x, int amount) {
+  if (amount <= 0) {
+    return garbage_x;
+  }
+  int num_floors = tall ? NUM_FLOORS : 1;
+  int num_rows = num_floors * HEIGHT;
+  puyos_t garbage[NUM_FLOORS] = {0, 0};
+
+  // Line k holds the puyos garbage_x + amount fills in columns k * width to (k + 1) * width - 1.
+  int end = garbage_x + amount;
+  int num_lines = (end - 1) / width + 1;
+  if (num_lines > num_rows) {
+    for (int k = 0; k < num_floors; ++k) {
+      garbage[k] = FULL;
+    }
+  } else {
+    puyos_t line = (1ULL << width) - 1;
+    for (int k = 0; k < num_lines; ++k) {
+      puyos_t mask = line;
+      if (k == 0) {
+        mask &= line << garbage_x;
+      }
+      if (k == num_lines - 1 && end % width) {
+        mask &= line >> (width - end % width);
+      }
+      // The first line ends up at the bottom of the stack.
+      int row = num_lines - 1 - k;
+      garbage[row / HEIGHT] |= mask << (V_SHIFT * (row % HEIGHT));
+    }
+  }
+
+  // The garbage only fills empty positions before falling down.
+  for (int k = 0; k < num_floors; ++k) {
+    puyos_t *floor = floors + k * num_layers;
+    puyos_t all = 0;
+    for (int i = 0; i < num_layers; ++i) {
+      all |= floor[i];
+    }
+    floor[num_layers - 1] |= garbage[k] & ~all;
+  }
+  if (tall) {
+    puyos_t moved[2];
+    tall_handle_gravity_moved(floors, num_layers, moved);
+  } else {
+    puyos_t moved;
+    bottom_handle_gravity_moved(floors, num_layers, &moved);
+  }
+  return end % width;
+}
+
+static int versus_field_empty(puyos_t *floors, versus_state_t *state) {
+  int num_words = state->tall ? NUM_FLOORS * state->num_layers : state->num_layers;
+  for (int i = 0; i < num_words; ++i) {
+    if (floors[i]) {
+      return 0;
+    }
+  }
+  return 1;
+}
+
+int versus_step(puyos_t *floors, versus_state_t *state, int move, int color_a, int color_b) {
+  if (!state->chain_number) {
+    make_move(floors, move, color_a, color_b);
+    state->step_score += state->step_bonus;
+  }
+
+  int had_chain = !!state->chain_number;
+  puyos_t moved[2];
+  int fell;
+  int score;
+  if (state->tall) {
+    fell = tall_handle_gravity_moved(floors, state->num_layers, moved);
+    score = tall_clear_groups_and_garbage(floors, state->num_layers, state->chain_number, state->tsu_rules, 1);
+  } else {
+    fell = bottom_handle_gravity_moved(floors, state->num_layers, moved);
+    score = 0;
+    if (bottom_clear_groups_and_garbage(floors, state->num_layers, 1)) {
+      score = (state->chain_number + 1) * (state->chain_number + 1);
+    }
+  }
+  if (score) {
+    state->chain_score += score;
+    state->chain_number++;
+  }
+
+  int released_garbage = 0;
+  if (had_chain && !(fell || score)) {
+    state->chain_number = 0;
+
+    state->chain_score += state->step_score;
+    state->step_score = 0;
+
+    if (state->all_clear_pending) {
+      state->chain_score += state->all_clear_bonus;
+    }
+    state->all_clear_pending = 0;
+
+    if (state->chain_score >= 0) {
+      if (state->target_score <= 0) {
+        return -1;
+      }
+      released_garbage = state->chain_score / state->target_score;
+      state->chain_score %= state->target_score;
+    }
+
+    if (versus_field_empty(floors, state)) {
+      state->all_clear_pending = 1;
+    }
+  }
+
+  // Garbage offsetting
+  if (state->pending_garbage <= released_garbage) {
+    released_garbage -= state->pending_garbage;
+    state->pending_garbage = 0;
+  } else {
+    state->pending_garbage -= released_garbage;
+    released_garbage = 0;
+  }
+
+  if (!state->chain_number) {
+    int amount = state->pending_garbage;
+    if (amount > state->max_received_garbage) {
+      amount = (int) state->max_received_garbage;
+    }
+    state->pending_garbage -= amount;
+    state->garbage_x = drop_garbage(floors, state->num_layers, state->tall, state->width, state->garbage_x, amount);
+    // Garbage above the ghost line disappears.
+    if (state->tsu_rules) {
+      int chain;
+      tall_resolve(floors, state->num_layers, state->tsu_rules, 1, &chain);
+    }
+  }
+  return released_garbage;
+}
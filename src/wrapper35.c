@@ -1,8 +1,126 @@
+#define PY_SSIZE_T_CLEAN
 #include <Python.h>
+#include <structmember.h>
 
 #include "bitboard.h"
+#include "transposition.h"
+#include "deadline.h"
 #include "bottom.h"
 #include "tall.h"
+#include "batch.h"
+#include "search.h"
+#include "counters.h"
+#include "versus.h"
+
+#define TABLE_CAPSULE_NAME "puyocore.TranspositionTable"
+
+static void
+table_destructor(PyObject *capsule)
+{
+  transposition_table_free((transposition_table_t*)PyCapsule_GetPointer(capsule, TABLE_CAPSULE_NAME));
+}
+
+// Accepts None for no table.
+static int
+table_from_object(PyObject *object, transposition_table_t **table)
+{
+  if (object == NULL || object == Py_None) {
+    *table = NULL;
+    return 1;
+  }
+  *table = (transposition_table_t*)PyCapsule_GetPointer(object, TABLE_CAPSULE_NAME);
+  return *table != NULL;
+}
+
+static PyObject *
+py_transposition_table(PyObject *self, PyObject *args)
+{
+  int log2_size;
+
+  if (!PyArg_ParseTuple(args, "i", &log2_size))
+  {
+    return NULL;
+  }
+  if (log2_size < 1 || log2_size > MAX_LOG2_TABLE_SIZE) {
+    PyErr_Format(PyExc_ValueError, "Table size must be between 2**1 and 2**%d entries", MAX_LOG2_TABLE_SIZE);
+    return NULL;
+  }
+  transposition_table_t *table = transposition_table_new(log2_size);
+  if (!table) {
+    PyErr_SetString(PyExc_MemoryError, "Unable to allocate transposition table");
+    return NULL;
+  }
+  PyObject *capsule = PyCapsule_New(table, TABLE_CAPSULE_NAME, table_destructor);
+  if (!capsule) {
+    transposition_table_free(table);
+  }
+  return capsule;
+}
+
+static PyObject *
+py_age_transposition_table(PyObject *self, PyObject *args)
+{
+  PyObject *table_object;
+  transposition_table_t *table;
+
+  if (!PyArg_ParseTuple(args, "O", &table_object) || !table_from_object(table_object, &table))
+  {
+    return NULL;
+  }
+  if (table) {
+    table->generation++;
+  }
+
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+py_clear_transposition_table(PyObject *self, PyObject *args)
+{
+  PyObject *table_object;
+  transposition_table_t *table;
+
+  if (!PyArg_ParseTuple(args, "O", &table_object) || !table_from_object(table_object, &table))
+  {
+    return NULL;
+  }
+  if (table) {
+    transposition_table_clear(table);
+  }
+
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+py_set_search_counting(PyObject *self, PyObject *args)
+{
+  int enabled;
+
+  if (!PyArg_ParseTuple(args, "p", &enabled))
+  {
+    return NULL;
+  }
+  search_counting_enable(!!enabled);
+
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+py_get_search_counters(PyObject *self, PyObject *args)
+{
+  if (!PyArg_ParseTuple(args, ""))
+  {
+    return NULL;
+  }
+
+  return Py_BuildValue(
+    "{s:K,s:K,s:K,s:K}",
+    "nodes", search_counters.nodes,
+    "leaves", search_counters.leaves,
+    "table_probes", search_counters.table_probes,
+    "table_hits", search_counters.table_hits
+  );
+}
 
 static PyObject *
 py_bottom_render(PyObject *self, PyObject *args)
@@ -66,6 +184,23 @@ py_bottom_resolve(PyObject *self, PyObject *args)
   return Py_BuildValue("i", chain);
 }
 
+static PyObject *
+py_bottom_resolve_incremental(PyObject *self, PyObject *args)
+{
+  int num_layers;
+  int has_garbage;
+  unsigned long long dirty;
+  const PyByteArrayObject *data;
+
+  if (!PyArg_ParseTuple(args, "YipK", &data, &num_layers, &has_garbage, &dirty))
+  {
+    return NULL;
+  }
+  int chain = bottom_resolve_incremental((puyos_t*)data->ob_start, num_layers, has_garbage, dirty);
+
+  return Py_BuildValue("i", chain);
+}
+
 static PyObject *
 py_bottom_encode(PyObject *self, PyObject *args)
 {
@@ -78,11 +213,48 @@ py_bottom_encode(PyObject *self, PyObject *args)
   }
   char *encoded = bottom_encode((puyos_t*)data->ob_start, num_colors);
 
-  PyObject *result = Py_BuildValue("y#", encoded, num_colors * WIDTH * HEIGHT);
+  PyObject *result = Py_BuildValue("y#", encoded, (Py_ssize_t)num_colors * WIDTH * HEIGHT);
   free(encoded);
   return result;
 }
 
+static int
+check_encode_args(int num_layers, int width, int height, int max_height, Py_buffer *out)
+{
+  if (num_layers < 0 || width < 1 || width > WIDTH || height < 1 || height > max_height) {
+    PyErr_SetString(PyExc_ValueError, "Invalid dimensions for encoding");
+    return 0;
+  }
+  if (out->len != num_layers * width * height) {
+    PyErr_Format(PyExc_ValueError, "Expected a buffer of %d bytes, got %zd", num_layers * width * height, out->len);
+    return 0;
+  }
+  return 1;
+}
+
+static PyObject *
+py_bottom_encode_into(PyObject *self, PyObject *args)
+{
+  int num_layers;
+  int width;
+  int height;
+  const PyByteArrayObject *data;
+  Py_buffer out;
+
+  if (!PyArg_ParseTuple(args, "Yiiiw*", &data, &num_layers, &width, &height, &out))
+  {
+    return NULL;
+  }
+  if (!check_encode_args(num_layers, width, height, HEIGHT, &out)) {
+    PyBuffer_Release(&out);
+    return NULL;
+  }
+  bottom_encode_into((puyos_t*)data->ob_start, num_layers, width, height, (char*)out.buf);
+  PyBuffer_Release(&out);
+
+  Py_RETURN_NONE;
+}
+
 static PyObject *
 py_bottom_valid_moves(PyObject *self, PyObject *args)
 {
@@ -98,6 +270,57 @@ py_bottom_valid_moves(PyObject *self, PyObject *args)
   return Py_BuildValue("K", valid);
 }
 
+// Parses the colors into a buffer of *size ints that grows as needed. Returns the number of deals or -1 on error.
+static int
+parse_colors_into(PyObject *colors_list, int min_size, int **colors, int *size)
+{
+  if (!PyList_Check(colors_list)) {
+    PyErr_SetString(PyExc_TypeError, "Colors must be a list");
+    return -1;
+  }
+  int len_colors = PyList_Size(colors_list);
+  if (len_colors % 2) {
+    PyErr_SetString(PyExc_ValueError, "Colors must come in pairs");
+    return -1;
+  }
+  int needed = len_colors > min_size ? len_colors : min_size;
+  if (needed > *size || !*colors) {
+    int *grown = realloc(*colors, sizeof(int) * (needed ? needed : 1));
+    if (!grown) {
+      PyErr_NoMemory();
+      return -1;
+    }
+    *colors = grown;
+    *size = needed;
+  }
+  for (int i = 0; i < len_colors; ++i) {
+    long color = PyLong_AsLong(PyList_GET_ITEM(colors_list, i));
+    if (color < 0) {
+      if (!PyErr_Occurred()) {
+        PyErr_SetString(PyExc_ValueError, "Colors must be non-negative");
+      }
+      return -1;
+    }
+    (*colors)[i] = color;
+  }
+  return len_colors / 2;
+}
+
+// Returns the number of deals or -1 on error. The caller owns *colors_out.
+static int
+parse_colors(PyObject *colors_list, int min_size, int **colors_out)
+{
+  int *colors = NULL;
+  int size = 0;
+  int num_deals = parse_colors_into(colors_list, min_size, &colors, &size);
+  if (num_deals < 0) {
+    free(colors);
+    return -1;
+  }
+  *colors_out = colors;
+  return num_deals;
+}
+
 static PyObject *
 py_bottom_tree_search(PyObject *self, PyObject *args)
 {
@@ -108,42 +331,143 @@ py_bottom_tree_search(PyObject *self, PyObject *args)
   PyObject *colors_list;
   int depth;
   double factor;
+  PyObject *table_object = NULL;
+  transposition_table_t *table;
 
-  if (!PyArg_ParseTuple(args, "YipKOid", &data, &num_layers, &has_garbage, &action_mask, &colors_list, &depth, &factor))
+  if (!PyArg_ParseTuple(args, "YipKOid|O", &data, &num_layers, &has_garbage, &action_mask, &colors_list, &depth, &factor, &table_object))
   {
     return NULL;
   }
+  if (!table_from_object(table_object, &table)) {
+    return NULL;
+  }
 
-  int len_colors = PyList_Size(colors_list);
-  if (len_colors % 2) {
+  int *colors;
+  int num_deals = parse_colors(colors_list, 2 * depth, &colors);
+  if (num_deals < 0) {
     return NULL;
   }
-  int *colors = malloc(sizeof(int) * len_colors);
-  if (2 * depth > len_colors) {
-    colors = malloc(sizeof(int) * 2 * depth);
-  } else {
-    colors = malloc(sizeof(int) * len_colors);
+  puyos_t *child_buffer = malloc(sizeof(puyos_t) * num_layers * (depth > 0 ? depth : 1));
+  if (!child_buffer) {
+    free(colors);
+    return PyErr_NoMemory();
   }
-  for (int i = 0; i < len_colors; ++i) {
-    PyObject *item = PyList_GetItem(colors_list, i);
-    if (!item) {
-      return NULL;
-    }
-    int color = PyLong_AsLong(item);
-    if (color < 0) {
+
+  unsigned long long salt = hash_config(num_layers, WIDTH, 0, has_garbage, action_mask, factor, 0);
+  double score;
+  Py_BEGIN_ALLOW_THREADS
+  score = bottom_tree_search((puyos_t*)data->ob_start, num_layers, has_garbage, action_mask, colors, num_deals, depth, factor, 0, child_buffer, table, salt, NULL);
+  Py_END_ALLOW_THREADS
+
+  free(colors);
+  free(child_buffer);
+
+  return Py_BuildValue("d", score);
+}
+
+static PyObject *
+search_many(search_config_t *config, PyObject *fields_list, PyObject *colors_list, int num_threads)
+{
+  if (!PyList_Check(fields_list)) {
+    PyErr_SetString(PyExc_TypeError, "Fields must be a list");
+    return NULL;
+  }
+  int num_fields = PyList_Size(fields_list);
+  int num_words = search_num_words(config);
+  for (int i = 0; i < num_fields; ++i) {
+    PyObject *data = PyList_GET_ITEM(fields_list, i);
+    if (!PyByteArray_Check(data) || PyByteArray_GET_SIZE(data) != (Py_ssize_t)(sizeof(puyos_t) * num_words)) {
+      PyErr_SetString(PyExc_ValueError, "Fields must be bytearrays matching the number of layers");
       return NULL;
     }
-    colors[i] = color;
   }
 
-  puyos_t *child_buffer = malloc(sizeof(puyos_t) * num_layers * depth);
+  int *colors;
+  int num_deals = parse_colors(colors_list, 0, &colors);
+  if (num_deals < 0) {
+    return NULL;
+  }
+
+  search_workspace_t workspace = {0};
+  puyos_t *fields = malloc(sizeof(puyos_t) * num_words * (num_fields ? num_fields : 1));
+  double *scores = malloc(sizeof(double) * (num_fields ? num_fields : 1));
+  if (!fields || !scores || !search_workspace_reserve(&workspace, config, 0, num_deals, num_threads)) {
+    free(colors);
+    free(fields);
+    free(scores);
+    search_workspace_free(&workspace);
+    return PyErr_NoMemory();
+  }
+  for (int i = 0; i < num_fields; ++i) {
+    memcpy(fields + i * num_words, PyByteArray_AS_STRING(PyList_GET_ITEM(fields_list, i)), sizeof(puyos_t) * num_words);
+  }
 
-  double score = bottom_tree_search((puyos_t*)data->ob_start, num_layers, has_garbage, action_mask, colors, len_colors / 2, depth, factor, child_buffer);
+  int ok;
+  Py_BEGIN_ALLOW_THREADS
+  ok = search_fields(config, &workspace, fields, num_fields, colors, num_deals, num_threads, scores);
+  Py_END_ALLOW_THREADS
+  search_workspace_free(&workspace);
 
+  PyObject *result = ok ? PyList_New(num_fields) : PyErr_NoMemory();
+  for (int i = 0; result && i < num_fields; ++i) {
+    PyList_SET_ITEM(result, i, PyFloat_FromDouble(scores[i]));
+  }
   free(colors);
-  free(child_buffer);
+  free(fields);
+  free(scores);
+  return result;
+}
 
-  return Py_BuildValue("d", score);
+static PyObject *
+py_bottom_tree_search_many(PyObject *self, PyObject *args)
+{
+  search_config_t config = {0};
+  PyObject *fields_list;
+  PyObject *colors_list;
+  PyObject *table_object = NULL;
+  int num_threads = 1;
+
+  if (!PyArg_ParseTuple(
+    args, "OipKOid|Oii",
+    &fields_list, &config.num_layers, &config.has_garbage, &config.action_mask, &colors_list,
+    &config.depth, &config.factor, &table_object, &num_threads, &config.beam_width
+  ))
+  {
+    return NULL;
+  }
+  if (!table_from_object(table_object, &config.table)) {
+    return NULL;
+  }
+  config.width = WIDTH;
+  config.salt = hash_config(config.num_layers, WIDTH, 0, config.has_garbage, config.action_mask, config.factor, config.beam_width);
+  return search_many(&config, fields_list, colors_list, num_threads);
+}
+
+static PyObject *
+py_tall_tree_search_many(PyObject *self, PyObject *args)
+{
+  search_config_t config = {0};
+  PyObject *fields_list;
+  PyObject *colors_list;
+  PyObject *table_object = NULL;
+  int num_threads = 1;
+
+  if (!PyArg_ParseTuple(
+    args, "OiippKOid|Oii",
+    &fields_list, &config.num_layers, &config.width, &config.tsu_rules, &config.has_garbage, &config.action_mask,
+    &colors_list, &config.depth, &config.factor, &table_object, &num_threads, &config.beam_width
+  ))
+  {
+    return NULL;
+  }
+  if (!table_from_object(table_object, &config.table)) {
+    return NULL;
+  }
+  config.tall = 1;
+  config.salt = hash_config(
+    config.num_layers, config.width, config.tsu_rules, config.has_garbage, config.action_mask, config.factor, config.beam_width
+  );
+  return search_many(&config, fields_list, colors_list, num_threads);
 }
 
 static PyObject *
@@ -212,6 +536,25 @@ py_tall_resolve(PyObject *self, PyObject *args)
   return Py_BuildValue("ii", score, chain);
 }
 
+static PyObject *
+py_tall_resolve_incremental(PyObject *self, PyObject *args)
+{
+  int num_layers;
+  int tsu_rules;
+  int has_garbage;
+  unsigned long long dirty;
+  const PyByteArrayObject *data;
+
+  if (!PyArg_ParseTuple(args, "YippK", &data, &num_layers, &tsu_rules, &has_garbage, &dirty))
+  {
+    return NULL;
+  }
+  int chain;
+  int score = tall_resolve_incremental((puyos_t*)data->ob_start, num_layers, tsu_rules, has_garbage, dirty, &chain);
+
+  return Py_BuildValue("ii", score, chain);
+}
+
 static PyObject *
 py_tall_encode(PyObject *self, PyObject *args)
 {
@@ -224,11 +567,34 @@ py_tall_encode(PyObject *self, PyObject *args)
   }
   char *encoded = tall_encode((puyos_t*)data->ob_start, num_colors);
 
-  PyObject *result = Py_BuildValue("y#", encoded, num_colors * NUM_FLOORS * WIDTH * HEIGHT);
+  PyObject *result = Py_BuildValue("y#", encoded, (Py_ssize_t)num_colors * NUM_FLOORS * WIDTH * HEIGHT);
   free(encoded);
   return result;
 }
 
+static PyObject *
+py_tall_encode_into(PyObject *self, PyObject *args)
+{
+  int num_layers;
+  int width;
+  int height;
+  const PyByteArrayObject *data;
+  Py_buffer out;
+
+  if (!PyArg_ParseTuple(args, "Yiiiw*", &data, &num_layers, &width, &height, &out))
+  {
+    return NULL;
+  }
+  if (!check_encode_args(num_layers, width, height, NUM_FLOORS * HEIGHT, &out)) {
+    PyBuffer_Release(&out);
+    return NULL;
+  }
+  tall_encode_into((puyos_t*)data->ob_start, num_layers, width, height, (char*)out.buf);
+  PyBuffer_Release(&out);
+
+  Py_RETURN_NONE;
+}
+
 static PyObject *
 py_tall_valid_moves(PyObject *self, PyObject *args)
 {
@@ -258,37 +624,33 @@ py_tall_tree_search(PyObject *self, PyObject *args)
   PyObject *colors_list;
   int depth;
   double factor;
+  PyObject *table_object = NULL;
+  transposition_table_t *table;
 
-  if (!PyArg_ParseTuple(args, "YiippKOid", &data, &num_layers, &width, &tsu_rules, &has_garbage, &action_mask, &colors_list, &depth, &factor))
+  if (!PyArg_ParseTuple(args, "YiippKOid|O", &data, &num_layers, &width, &tsu_rules, &has_garbage, &action_mask, &colors_list, &depth, &factor, &table_object))
   {
     return NULL;
   }
-
-  int len_colors = PyList_Size(colors_list);
-  if (len_colors % 2) {
+  if (!table_from_object(table_object, &table)) {
     return NULL;
   }
+
   int *colors;
-  if (2 * depth > len_colors) {
-    colors = malloc(sizeof(int) * 2 * depth);
-  } else {
-    colors = malloc(sizeof(int) * len_colors);
+  int num_deals = parse_colors(colors_list, 2 * depth, &colors);
+  if (num_deals < 0) {
+    return NULL;
   }
-  for (int i = 0; i < len_colors; ++i) {
-    PyObject *item = PyList_GetItem(colors_list, i);
-    if (!item) {
-      return NULL;
-    }
-    int color = PyLong_AsLong(item);
-    if (color < 0) {
-      return NULL;
-    }
-    colors[i] = color;
+  puyos_t *child_buffer = malloc(sizeof(puyos_t) * num_layers * NUM_FLOORS * (depth > 0 ? depth : 1));
+  if (!child_buffer) {
+    free(colors);
+    return PyErr_NoMemory();
   }
 
-  puyos_t *child_buffer = malloc(sizeof(puyos_t) * num_layers * NUM_FLOORS * depth);
-
-  double score = tall_tree_search((puyos_t*)data->ob_start, num_layers, width, tsu_rules, has_garbage, action_mask, colors, len_colors / 2, depth, factor, child_buffer);
+  unsigned long long salt = hash_config(num_layers, width, tsu_rules, has_garbage, action_mask, factor, 0);
+  double score;
+  Py_BEGIN_ALLOW_THREADS
+  score = tall_tree_search((puyos_t*)data->ob_start, num_layers, width, tsu_rules, has_garbage, action_mask, colors, num_deals, depth, factor, 0, child_buffer, table, salt, NULL);
+  Py_END_ALLOW_THREADS
 
   free(colors);
   free(child_buffer);
@@ -296,53 +658,877 @@ py_tall_tree_search(PyObject *self, PyObject *args)
   return Py_BuildValue("d", score);
 }
 
+// Builds the (scores, popcounts, depth) result of root searches with None scores for invalid actions.
 static PyObject *
-py_make_move(PyObject *self, PyObject *args)
+root_results(double *scores, int *popcounts, int depth)
 {
-  int action, color_a, color_b;
-  const PyByteArrayObject *data;
+  PyObject *score_list = PyList_New(NUM_ACTIONS);
+  PyObject *popcount_list = PyList_New(NUM_ACTIONS);
+  if (!score_list || !popcount_list) {
+    Py_XDECREF(score_list);
+    Py_XDECREF(popcount_list);
+    return NULL;
+  }
+  for (int i = 0; i < NUM_ACTIONS; ++i) {
+    if (popcounts[i] < 0) {
+      Py_INCREF(Py_None);
+      PyList_SET_ITEM(score_list, i, Py_None);
+    } else {
+      PyList_SET_ITEM(score_list, i, PyFloat_FromDouble(scores[i]));
+    }
+    PyList_SET_ITEM(popcount_list, i, PyLong_FromLong(popcounts[i]));
+  }
+  return Py_BuildValue("NNi", score_list, popcount_list, depth);
+}
 
-  if (!PyArg_ParseTuple(args, "Yiii", &data, &action, &color_a, &color_b))
-  {
+static PyObject *
+search_root_common(search_config_t *config, PyByteArrayObject *data, PyObject *colors_list, int num_threads, double time_budget)
+{
+  int num_words = search_num_words(config);
+  if (PyByteArray_GET_SIZE(data) != (Py_ssize_t)(sizeof(puyos_t) * num_words)) {
+    PyErr_SetString(PyExc_ValueError, "Field size doesn't match the number of layers");
+    return NULL;
+  }
+  int *colors;
+  int num_deals = parse_colors(colors_list, 0, &colors);
+  if (num_deals < 0) {
     return NULL;
   }
-  make_move((puyos_t*)data->ob_start, action, color_a, color_b);
+  search_workspace_t workspace = {0};
+  puyos_t *floors = malloc(sizeof(puyos_t) * num_words);
+  if (!floors || !search_workspace_reserve(&workspace, config, 1, num_deals, num_threads)) {
+    free(colors);
+    free(floors);
+    search_workspace_free(&workspace);
+    return PyErr_NoMemory();
+  }
+  memcpy(floors, PyByteArray_AS_STRING(data), sizeof(puyos_t) * num_words);
+  double scores[NUM_ACTIONS];
+  int popcounts[NUM_ACTIONS];
+  int depth = config->depth;
 
-  Py_RETURN_NONE;
+  int ok;
+  Py_BEGIN_ALLOW_THREADS
+  if (time_budget > 0) {
+    depth = search_root_deepening(config, &workspace, floors, colors, num_deals, num_threads, time_budget, scores, popcounts);
+    ok = depth >= 0;
+  } else {
+    ok = search_root(config, &workspace, floors, colors, num_deals, num_threads, scores, popcounts);
+  }
+  Py_END_ALLOW_THREADS
+
+  search_workspace_free(&workspace);
+  free(colors);
+  free(floors);
+
+  if (!ok) {
+    return PyErr_NoMemory();
+  }
+  return root_results(scores, popcounts, depth);
 }
 
 static PyObject *
-py_mirror(PyObject *self, PyObject *args)
+py_bottom_root_search(PyObject *self, PyObject *args)
 {
-  int num_colors;
-  const PyByteArrayObject *data;
+  search_config_t config = {0};
+  PyByteArrayObject *data;
+  PyObject *colors_list;
+  PyObject *table_object = NULL;
+  int num_threads = 1;
+  double time_budget = 0;
 
-  if (!PyArg_ParseTuple(args, "Yi", &data, &num_colors))
+  if (!PyArg_ParseTuple(
+    args, "YipKOid|Oid",
+    &data, &config.num_layers, &config.has_garbage, &config.action_mask, &colors_list,
+    &config.depth, &config.factor, &table_object, &num_threads, &time_budget
+  ))
   {
     return NULL;
   }
-  mirror((puyos_t*)data->ob_start, num_colors);
+  if (!table_from_object(table_object, &config.table)) {
+    return NULL;
+  }
+  config.width = WIDTH;
+  config.salt = hash_config(config.num_layers, WIDTH, 0, config.has_garbage, config.action_mask, config.factor, config.beam_width);
+  return search_root_common(&config, data, colors_list, num_threads, time_budget);
+}
 
-  Py_RETURN_NONE;
+static PyObject *
+py_tall_root_search(PyObject *self, PyObject *args)
+{
+  search_config_t config = {0};
+  PyByteArrayObject *data;
+  PyObject *colors_list;
+  PyObject *table_object = NULL;
+  int num_threads = 1;
+  double time_budget = 0;
+
+  if (!PyArg_ParseTuple(
+    args, "YiippKOid|Oid",
+    &data, &config.num_layers, &config.width, &config.tsu_rules, &config.has_garbage, &config.action_mask,
+    &colors_list, &config.depth, &config.factor, &table_object, &num_threads, &time_budget
+  ))
+  {
+    return NULL;
+  }
+  if (!table_from_object(table_object, &config.table)) {
+    return NULL;
+  }
+  config.tall = 1;
+  config.salt = hash_config(
+    config.num_layers, config.width, config.tsu_rules, config.has_garbage, config.action_mask, config.factor, config.beam_width
+  );
+  return search_root_common(&config, data, colors_list, num_threads, time_budget);
 }
 
-static PyMethodDef PuyoMethods[] = {
-  {"bottom_render", py_bottom_render, METH_VARARGS, "Debug print for bottom state inspection."},
-  {"bottom_handle_gravity", py_bottom_handle_gravity, METH_VARARGS, "Handle puyo gravity for a bottom state."},
-  {"bottom_clear_groups", py_bottom_clear_groups, METH_VARARGS, "Clear groups for a bottom state."},
-  {"bottom_resolve", py_bottom_resolve, METH_VARARGS, "Fully resolve a bottom state and return the chain length."},
-  {"bottom_encode", py_bottom_encode, METH_VARARGS, "Encodes a bottom state as an array of chars."},
-  {"bottom_valid_moves", py_bottom_valid_moves, METH_VARARGS, "Returns a bitset of valid moves on a bottom state."},
-  {"bottom_tree_search", py_bottom_tree_search, METH_VARARGS, "Does a tree search with the given colors."},
-  {"tall_render", py_tall_render, METH_VARARGS, "Debug print for tall state inspection."},
+typedef struct {
+  PyObject_HEAD
+  search_config_t config;
+  int num_threads;
+  PyObject *table_object;
+  puyos_t *floors;
+  int *colors;
+  int colors_size;
+  puyos_t *fields;
+  double *scores;
+  int fields_size;
+  int busy;
+  search_workspace_t workspace;
+} SearcherObject;
+
+static void
+Searcher_dealloc(SearcherObject *self)
+{
+  search_workspace_free(&self->workspace);
+  free(self->floors);
+  free(self->colors);
+  free(self->fields);
+  free(self->scores);
+  Py_XDECREF(self->table_object);
+  Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+static int
+Searcher_init(SearcherObject *self, PyObject *args, PyObject *kwds)
+{
+  static char *kwlist[] = {
+    "num_layers", "width", "tall", "tsu_rules", "has_garbage", "action_mask", "depth", "factor", "table", "num_threads",
+    "beam_width", NULL
+  };
+  search_config_t config = {0};
+  PyObject *table_object = NULL;
+  int num_threads = 1;
+
+  if (!PyArg_ParseTupleAndKeywords(
+    args, kwds, "iipppKid|Oii", kwlist,
+    &config.num_layers, &config.width, &config.tall, &config.tsu_rules, &config.has_garbage, &config.action_mask,
+    &config.depth, &config.factor, &table_object, &num_threads, &config.beam_width
+  ))
+  {
+    return -1;
+  }
+  if (!table_from_object(table_object, &config.table)) {
+    return -1;
+  }
+  if (self->busy) {
+    PyErr_SetString(PyExc_RuntimeError, "Searcher is busy");
+    return -1;
+  }
+  if (config.num_layers < 1 || config.depth < 0 || config.beam_width < 0) {
+    PyErr_SetString(PyExc_ValueError, "Need at least one layer, a non-negative depth and a non-negative beam width");
+    return -1;
+  }
+  if (!config.tall) {
+    config.width = WIDTH;
+    config.tsu_rules = 0;
+  }
+  if (num_threads < 1) {
+    num_threads = 1;
+  }
+
+  // The buffers are only swapped in once every allocation succeeds so that a failed init leaves the old config usable.
+  search_workspace_t workspace = {0};
+  puyos_t *floors = malloc(sizeof(puyos_t) * search_num_words(&config));
+  if (!floors || !search_workspace_reserve(&workspace, &config, 1, 0, num_threads)) {
+    free(floors);
+    search_workspace_free(&workspace);
+    PyErr_NoMemory();
+    return -1;
+  }
+  search_workspace_free(&self->workspace);
+  self->workspace = workspace;
+  free(self->floors);
+  self->floors = floors;
+  // The size of the fields depends on the rules.
+  free(self->fields);
+  self->fields = NULL;
+  self->fields_size = 0;
+  if (table_object == Py_None) {
+    table_object = NULL;
+  }
+  Py_XINCREF(table_object);
+  Py_XDECREF(self->table_object);
+  self->table_object = table_object;
+  config.salt = hash_config(
+    config.num_layers, config.width, config.tsu_rules, config.has_garbage, config.action_mask, config.factor, config.beam_width
+  );
+  self->config = config;
+  self->num_threads = num_threads;
+  return 0;
+}
+
+static PyObject *
+Searcher_search(SearcherObject *self, PyObject *args)
+{
+  PyByteArrayObject *data;
+  PyObject *colors_list;
+  double time_budget = 0;
+
+  if (!PyArg_ParseTuple(args, "YO|d", &data, &colors_list, &time_budget))
+  {
+    return NULL;
+  }
+  if (!self->floors) {
+    PyErr_SetString(PyExc_RuntimeError, "Searcher is not initialized");
+    return NULL;
+  }
+  if (self->busy) {
+    PyErr_SetString(PyExc_RuntimeError, "Searcher is busy");
+    return NULL;
+  }
+  search_config_t *config = &self->config;
+  int num_words = search_num_words(config);
+  if (PyByteArray_GET_SIZE(data) != (Py_ssize_t)(sizeof(puyos_t) * num_words)) {
+    PyErr_SetString(PyExc_ValueError, "Field size doesn't match the number of layers");
+    return NULL;
+  }
+  int num_deals = parse_colors_into(colors_list, 0, &self->colors, &self->colors_size);
+  if (num_deals < 0) {
+    return NULL;
+  }
+  // Only grows the first time a search sees this many deals.
+  if (!search_workspace_reserve(&self->workspace, config, 1, num_deals, self->num_threads)) {
+    return PyErr_NoMemory();
+  }
+  memcpy(self->floors, PyByteArray_AS_STRING(data), sizeof(puyos_t) * num_words);
+  double scores[NUM_ACTIONS];
+  int popcounts[NUM_ACTIONS];
+  int depth = config->depth;
+
+  int ok;
+  self->busy = 1;
+  Py_BEGIN_ALLOW_THREADS
+  if (time_budget > 0) {
+    depth = search_root_deepening(config, &self->workspace, self->floors, self->colors, num_deals, self->num_threads, time_budget, scores, popcounts);
+    ok = depth >= 0;
+  } else {
+    ok = search_root(config, &self->workspace, self->floors, self->colors, num_deals, self->num_threads, scores, popcounts);
+  }
+  Py_END_ALLOW_THREADS
+  self->busy = 0;
+
+  if (!ok) {
+    return PyErr_NoMemory();
+  }
+  return root_results(scores, popcounts, depth);
+}
+
+static PyObject *
+Searcher_search_fields(SearcherObject *self, PyObject *args)
+{
+  PyObject *fields_list;
+  PyObject *colors_list;
+  double time_budget = 0;
+
+  if (!PyArg_ParseTuple(args, "OO|d", &fields_list, &colors_list, &time_budget))
+  {
+    return NULL;
+  }
+  if (!self->floors) {
+    PyErr_SetString(PyExc_RuntimeError, "Searcher is not initialized");
+    return NULL;
+  }
+  if (self->busy) {
+    PyErr_SetString(PyExc_RuntimeError, "Searcher is busy");
+    return NULL;
+  }
+  if (!PyList_Check(fields_list)) {
+    PyErr_SetString(PyExc_TypeError, "Fields must be a list");
+    return NULL;
+  }
+  search_config_t *config = &self->config;
+  int num_words = search_num_words(config);
+  int num_fields = PyList_GET_SIZE(fields_list);
+  for (int i = 0; i < num_fields; ++i) {
+    PyObject *data = PyList_GET_ITEM(fields_list, i);
+    if (!PyByteArray_Check(data) || PyByteArray_GET_SIZE(data) != (Py_ssize_t)(sizeof(puyos_t) * num_words)) {
+      PyErr_SetString(PyExc_ValueError, "Fields must be bytearrays matching the number of layers");
+      return NULL;
+    }
+  }
+  int num_deals = parse_colors_into(colors_list, 0, &self->colors, &self->colors_size);
+  if (num_deals < 0) {
+    return NULL;
+  }
+  if (num_fields > self->fields_size) {
+    // Nothing is kept from the old buffers so both are replaced together or not at all.
+    puyos_t *fields = malloc(sizeof(puyos_t) * num_words * num_fields);
+    // The second half holds the scores of an unfinished iteration when deepening.
+    double *scores = malloc(sizeof(double) * 2 * num_fields);
+    if (!fields || !scores) {
+      free(fields);
+      free(scores);
+      return PyErr_NoMemory();
+    }
+    free(self->fields);
+    free(self->scores);
+    self->fields = fields;
+    self->scores = scores;
+    self->fields_size = num_fields;
+  }
+  if (!search_workspace_reserve(&self->workspace, config, 1, num_deals, self->num_threads)) {
+    return PyErr_NoMemory();
+  }
+  for (int i = 0; i < num_fields; ++i) {
+    memcpy(self->fields + i * num_words, PyByteArray_AS_STRING(PyList_GET_ITEM(fields_list, i)), sizeof(puyos_t) * num_words);
+  }
+  // The fields are the children of a root so they are searched one ply shallower.
+  search_config_t child_config = *config;
+  if (child_config.depth > 0) {
+    child_config.depth--;
+  }
+  int depth = config->depth;
+
+  int ok;
+  self->busy = 1;
+  Py_BEGIN_ALLOW_THREADS
+  if (time_budget > 0 && num_fields) {
+    int depth_reached = search_fields_deepening(
+      &child_config, &self->workspace, self->fields, num_fields, self->colors, num_deals, self->num_threads, time_budget,
+      self->scores, self->scores + num_fields
+    );
+    ok = depth_reached >= 0;
+    depth += depth_reached - child_config.depth;
+  } else {
+    ok = search_fields(&child_config, &self->workspace, self->fields, num_fields, self->colors, num_deals, self->num_threads, self->scores);
+  }
+  Py_END_ALLOW_THREADS
+  self->busy = 0;
+
+  if (!ok) {
+    return PyErr_NoMemory();
+  }
+
+  PyObject *score_list = PyList_New(num_fields);
+  if (!score_list) {
+    return NULL;
+  }
+  for (int i = 0; i < num_fields; ++i) {
+    PyList_SET_ITEM(score_list, i, PyFloat_FromDouble(self->scores[i]));
+  }
+  return Py_BuildValue("Ni", score_list, depth);
+}
+
+static PyMethodDef Searcher_methods[] = {
+  {"search", (PyCFunction)Searcher_search, METH_VARARGS, "Scores every action from the root like the root searches. Returns (scores, popcounts, depth)."},
+  {"search_fields", (PyCFunction)Searcher_search_fields, METH_VARARGS, "Scores a list of fields as the children of a root with the colors of the deals after the first. Deepens iteratively within an optional time budget in milliseconds. Returns (scores, depth)."},
+  {NULL, NULL, 0, NULL}
+};
+
+static PyMemberDef Searcher_members[] = {
+  {"depth", T_INT, offsetof(SearcherObject, config.depth), READONLY, "Maximum depth of the searches."},
+  {"num_threads", T_INT, offsetof(SearcherObject, num_threads), READONLY, "Number of threads searching the children of the root."},
+  {"beam_width", T_INT, offsetof(SearcherObject, config.beam_width), READONLY, "Number of moves expanded per deal below the root or zero for all."},
+  {"table", T_OBJECT, offsetof(SearcherObject, table_object), READONLY, "Transposition table shared by the searches or None."},
+  {NULL, 0, 0, 0, NULL}
+};
+
+static PyTypeObject SearcherType = {
+  PyVarObject_HEAD_INIT(NULL, 0)
+  .tp_name = "puyocore.Searcher",
+  .tp_basicsize = sizeof(SearcherObject),
+  .tp_dealloc = (destructor)Searcher_dealloc,
+  .tp_flags = Py_TPFLAGS_DEFAULT,
+  .tp_doc = "Root searches of a fixed configuration reusing the same scratch memory between calls.",
+  .tp_methods = Searcher_methods,
+  .tp_members = Searcher_members,
+  .tp_init = (initproc)Searcher_init,
+  .tp_new = PyType_GenericNew,
+};
+
+static PyObject *
+py_make_move(PyObject *self, PyObject *args)
+{
+  int action, color_a, color_b;
+  const PyByteArrayObject *data;
+
+  if (!PyArg_ParseTuple(args, "Yiii", &data, &action, &color_a, &color_b))
+  {
+    return NULL;
+  }
+  puyos_t placed = make_move((puyos_t*)data->ob_start, action, color_a, color_b);
+
+  return PyLong_FromUnsignedLongLong(placed);
+}
+
+static PyObject *
+py_mirror(PyObject *self, PyObject *args)
+{
+  int num_words;
+  int width = WIDTH;
+  const PyByteArrayObject *data;
+
+  if (!PyArg_ParseTuple(args, "Yi|i", &data, &num_words, &width))
+  {
+    return NULL;
+  }
+  if (num_words < 0 || PyByteArray_GET_SIZE(data) < num_words * (Py_ssize_t)sizeof(puyos_t)) {
+    PyErr_SetString(PyExc_ValueError, "Field too small for the number of words");
+    return NULL;
+  }
+  if (width < 1 || width > WIDTH) {
+    PyErr_SetString(PyExc_ValueError, "Width out of range");
+    return NULL;
+  }
+  mirror((puyos_t*)data->ob_start, num_words, width);
+
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+py_mirror_many(PyObject *self, PyObject *args)
+{
+  int width;
+  Py_buffer fields;
+
+  if (!PyArg_ParseTuple(args, "w*i", &fields, &width))
+  {
+    return NULL;
+  }
+  if (fields.len % sizeof(puyos_t)) {
+    PyErr_SetString(PyExc_ValueError, "Fields must consist of whole words");
+    PyBuffer_Release(&fields);
+    return NULL;
+  }
+  if (width < 1 || width > WIDTH) {
+    PyErr_SetString(PyExc_ValueError, "Width out of range");
+    PyBuffer_Release(&fields);
+    return NULL;
+  }
+  mirror((puyos_t*)fields.buf, fields.len / sizeof(puyos_t), width);
+  PyBuffer_Release(&fields);
+
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+py_shift(PyObject *self, PyObject *args)
+{
+  int num_words;
+  int amount;
+  const PyByteArrayObject *data;
+
+  if (!PyArg_ParseTuple(args, "Yii", &data, &num_words, &amount))
+  {
+    return NULL;
+  }
+  if (num_words < 0 || PyByteArray_GET_SIZE(data) < num_words * (Py_ssize_t)sizeof(puyos_t)) {
+    PyErr_SetString(PyExc_ValueError, "Field too small for the number of words");
+    return NULL;
+  }
+  shift((puyos_t*)data->ob_start, num_words, amount);
+
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+py_overlay(PyObject *self, PyObject *args)
+{
+  int num_layers;
+  int num_floors;
+  const PyByteArrayObject *data;
+  const PyByteArrayObject *layer;
+
+  if (!PyArg_ParseTuple(args, "YYii", &data, &layer, &num_layers, &num_floors))
+  {
+    return NULL;
+  }
+  Py_ssize_t size = num_layers * num_floors * sizeof(puyos_t);
+  if (PyByteArray_GET_SIZE(data) < size || PyByteArray_GET_SIZE(layer) < size) {
+    PyErr_SetString(PyExc_ValueError, "Field too small for the number of layers");
+    return NULL;
+  }
+  overlay((puyos_t*)data->ob_start, (puyos_t*)layer->ob_start, num_layers, num_floors);
+
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+py_drop_garbage(PyObject *self, PyObject *args)
+{
+  int num_layers;
+  int tall;
+  int width;
+  int garbage_x;
+  int amount;
+  const PyByteArrayObject *data;
+
+  if (!PyArg_ParseTuple(args, "Yipiii", &data, &num_layers, &tall, &width, &garbage_x, &amount))
+  {
+    return NULL;
+  }
+  Py_ssize_t size = num_layers * (tall ? NUM_FLOORS : 1) * sizeof(puyos_t);
+  if (num_layers < 1 || PyByteArray_GET_SIZE(data) < size) {
+    PyErr_SetString(PyExc_ValueError, "Field too small for the number of layers");
+    return NULL;
+  }
+  if (width < 1 || width > WIDTH || garbage_x < 0 || garbage_x >= width) {
+    PyErr_SetString(PyExc_ValueError, "Garbage columns out of range");
+    return NULL;
+  }
+  garbage_x = drop_garbage((puyos_t*)data->ob_start, num_layers, tall, width, garbage_x, amount);
+
+  return Py_BuildValue("i", garbage_x);
+}
+
+static void
+release_buffers(Py_buffer *buffers, int num_buffers)
+{
+  for (int i = 0; i < num_buffers; ++i) {
+    PyBuffer_Release(buffers + i);
+  }
+}
+
+static int
+check_buffer_size(Py_buffer *buffer, Py_ssize_t size, const char *name)
+{
+  if (buffer->len != size) {
+    PyErr_Format(PyExc_ValueError, "Expected %zd bytes for %s, got %zd", size, name, buffer->len);
+    return 0;
+  }
+  return 1;
+}
+
+// Buffers: fields, deals, rngs, deals_out, fields_out
+static int
+init_batch_env(batch_env_t *env, Py_buffer *buffers)
+{
+  env->num_envs = buffers[2].len / sizeof(unsigned long long);
+  if (env->num_colors <= 0 || env->num_deals <= 0) {
+    PyErr_SetString(PyExc_ValueError, "Need at least one color and one deal");
+    return 0;
+  }
+  if (
+    !check_buffer_size(buffers, env->num_envs * batch_num_words(env) * sizeof(puyos_t), "fields") ||
+    !check_buffer_size(buffers + 1, env->num_envs * env->num_deals * 2, "deals") ||
+    !check_buffer_size(buffers + 3, env->num_envs * env->num_colors * env->num_deals * 2, "deal observations") ||
+    !check_buffer_size(buffers + 4, env->num_envs * env->num_colors * env->height * env->width, "field observations")
+  ) {
+    return 0;
+  }
+  env->fields = (puyos_t*)buffers[0].buf;
+  env->deals = (unsigned char*)buffers[1].buf;
+  env->rngs = (unsigned long long*)buffers[2].buf;
+  env->deals_out = (char*)buffers[3].buf;
+  env->fields_out = (char*)buffers[4].buf;
+  return 1;
+}
+
+static PyObject *
+py_batch_reset(PyObject *self, PyObject *args)
+{
+  batch_env_t env;
+  Py_buffer buffers[5];
+
+  if (!PyArg_ParseTuple(
+    args, "w*w*w*w*w*iiiipp",
+    buffers, buffers + 1, buffers + 2, buffers + 3, buffers + 4,
+    &env.num_colors, &env.num_deals, &env.width, &env.height, &env.tall, &env.tsu_rules
+  ))
+  {
+    return NULL;
+  }
+  if (!init_batch_env(&env, buffers)) {
+    release_buffers(buffers, 5);
+    return NULL;
+  }
+  for (int i = 0; i < env.num_envs; ++i) {
+    batch_reset(&env, i);
+    batch_encode(&env, i);
+  }
+  release_buffers(buffers, 5);
+
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+py_batch_step(PyObject *self, PyObject *args)
+{
+  batch_env_t env;
+  Py_buffer buffers[8];
+
+  if (!PyArg_ParseTuple(
+    args, "w*w*w*w*w*iiiippw*w*w*",
+    buffers, buffers + 1, buffers + 2, buffers + 3, buffers + 4,
+    &env.num_colors, &env.num_deals, &env.width, &env.height, &env.tall, &env.tsu_rules,
+    buffers + 5, buffers + 6, buffers + 7
+  ))
+  {
+    return NULL;
+  }
+  if (
+    !init_batch_env(&env, buffers) ||
+    !check_buffer_size(buffers + 5, env.num_envs * sizeof(int), "moves") ||
+    !check_buffer_size(buffers + 6, env.num_envs * sizeof(int), "rewards") ||
+    !check_buffer_size(buffers + 7, env.num_envs, "dones")
+  ) {
+    release_buffers(buffers, 8);
+    return NULL;
+  }
+  batch_step(&env, (int*)buffers[5].buf, (int*)buffers[6].buf, (char*)buffers[7].buf);
+  release_buffers(buffers, 8);
+
+  Py_RETURN_NONE;
+}
+
+// Buffers: fields, colors, scores, popcounts
+static PyObject *
+search_roots_common(search_config_t *config, Py_buffer *buffers, int num_threads)
+{
+  int num_words = search_num_words(config);
+  int num_colors = config->num_layers - !!config->has_garbage;
+  Py_ssize_t num_roots = buffers[2].len / (sizeof(double) * NUM_ACTIONS);
+  int num_deals = num_roots ? buffers[1].len / (sizeof(int) * 2 * num_roots) : 0;
+  if (
+    !check_buffer_size(buffers, num_roots * num_words * sizeof(puyos_t), "fields") ||
+    !check_buffer_size(buffers + 1, num_roots * num_deals * 2 * sizeof(int), "colors") ||
+    !check_buffer_size(buffers + 2, num_roots * NUM_ACTIONS * sizeof(double), "scores") ||
+    !check_buffer_size(buffers + 3, num_roots * NUM_ACTIONS * sizeof(int), "popcounts")
+  ) {
+    release_buffers(buffers, 4);
+    return NULL;
+  }
+  const int *colors = (const int*)buffers[1].buf;
+  for (Py_ssize_t i = 0; i < num_roots * num_deals * 2; ++i) {
+    if (colors[i] < 0 || colors[i] >= num_colors) {
+      PyErr_SetString(PyExc_ValueError, "Colors must be between zero and the number of colors");
+      release_buffers(buffers, 4);
+      return NULL;
+    }
+  }
+
+  search_workspace_t workspace = {0};
+  if (!search_workspace_reserve(&workspace, config, num_roots, num_deals, num_threads)) {
+    search_workspace_free(&workspace);
+    release_buffers(buffers, 4);
+    return PyErr_NoMemory();
+  }
+
+  int ok;
+  Py_BEGIN_ALLOW_THREADS
+  ok = search_roots(config, &workspace, (puyos_t*)buffers[0].buf, num_roots, (int*)colors, num_deals, num_threads, (double*)buffers[2].buf, (int*)buffers[3].buf);
+  Py_END_ALLOW_THREADS
+
+  search_workspace_free(&workspace);
+  release_buffers(buffers, 4);
+  if (!ok) {
+    return PyErr_NoMemory();
+  }
+  Py_RETURN_NONE;
+}
+
+static PyObject *
+py_bottom_root_search_batch(PyObject *self, PyObject *args)
+{
+  search_config_t config = {0};
+  Py_buffer buffers[4];
+  PyObject *table_object = NULL;
+  int num_threads = 1;
+
+  if (!PyArg_ParseTuple(
+    args, "y*ipKy*idw*w*|Oii",
+    buffers, &config.num_layers, &config.has_garbage, &config.action_mask, buffers + 1,
+    &config.depth, &config.factor, buffers + 2, buffers + 3, &table_object, &num_threads, &config.beam_width
+  ))
+  {
+    return NULL;
+  }
+  if (!table_from_object(table_object, &config.table)) {
+    release_buffers(buffers, 4);
+    return NULL;
+  }
+  config.width = WIDTH;
+  config.salt = hash_config(config.num_layers, WIDTH, 0, config.has_garbage, config.action_mask, config.factor, config.beam_width);
+  return search_roots_common(&config, buffers, num_threads);
+}
+
+static PyObject *
+py_tall_root_search_batch(PyObject *self, PyObject *args)
+{
+  search_config_t config = {0};
+  Py_buffer buffers[4];
+  PyObject *table_object = NULL;
+  int num_threads = 1;
+
+  if (!PyArg_ParseTuple(
+    args, "y*iippKy*idw*w*|Oii",
+    buffers, &config.num_layers, &config.width, &config.tsu_rules, &config.has_garbage, &config.action_mask,
+    buffers + 1, &config.depth, &config.factor, buffers + 2, buffers + 3, &table_object, &num_threads, &config.beam_width
+  ))
+  {
+    return NULL;
+  }
+  if (!table_from_object(table_object, &config.table)) {
+    release_buffers(buffers, 4);
+    return NULL;
+  }
+  config.tall = 1;
+  config.salt = hash_config(
+    config.num_layers, config.width, config.tsu_rules, config.has_garbage, config.action_mask, config.factor, config.beam_width
+  );
+  return search_roots_common(&config, buffers, num_threads);
+}
+
+static PyObject *
+py_replay_game(PyObject *self, PyObject *args)
+{
+  batch_env_t env = {0};
+  Py_buffer buffers[5];
+
+  if (!PyArg_ParseTuple(
+    args, "w*iiippy*y*w*w*",
+    buffers, &env.num_colors, &env.width, &env.height, &env.tall, &env.tsu_rules,
+    buffers + 1, buffers + 2, buffers + 3, buffers + 4
+  ))
+  {
+    return NULL;
+  }
+  int num_moves = buffers[2].len / sizeof(int);
+  if (
+    !check_buffer_size(buffers, batch_num_words(&env) * sizeof(puyos_t), "field") ||
+    !check_buffer_size(buffers + 1, num_moves * 2, "deals") ||
+    !check_buffer_size(buffers + 2, num_moves * sizeof(int), "moves") ||
+    !check_buffer_size(buffers + 3, num_moves * env.num_colors * env.height * env.width, "field observations") ||
+    !check_buffer_size(buffers + 4, num_moves * sizeof(int), "rewards")
+  ) {
+    release_buffers(buffers, 5);
+    return NULL;
+  }
+  const unsigned char *deals = (const unsigned char*)buffers[1].buf;
+  for (int i = 0; i < num_moves * 2; ++i) {
+    if (deals[i] >= env.num_colors) {
+      PyErr_SetString(PyExc_ValueError, "Colors must be between zero and the number of colors");
+      release_buffers(buffers, 5);
+      return NULL;
+    }
+  }
+  env.fields_out = (char*)buffers[3].buf;
+
+  int num_played;
+  Py_BEGIN_ALLOW_THREADS
+  num_played = batch_replay(&env, (puyos_t*)buffers[0].buf, deals, (const int*)buffers[2].buf, num_moves, (int*)buffers[4].buf);
+  Py_END_ALLOW_THREADS
+
+  release_buffers(buffers, 5);
+  return Py_BuildValue("i", num_played);
+}
+
+static PyObject *
+py_versus_step(PyObject *self, PyObject *args)
+{
+  versus_state_t state;
+  const PyByteArrayObject *data;
+  int move, color_a, color_b;
+
+  if (!PyArg_ParseTuple(
+    args, "Y(iippiiid)(iiiipi)iii",
+    &data,
+    &state.num_layers, &state.width, &state.tall, &state.tsu_rules,
+    &state.step_bonus, &state.all_clear_bonus, &state.target_score, &state.max_received_garbage,
+    &state.chain_number, &state.chain_score, &state.step_score,
+    &state.pending_garbage, &state.all_clear_pending, &state.garbage_x,
+    &move, &color_a, &color_b
+  ))
+  {
+    return NULL;
+  }
+  if (state.num_layers < 2) {
+    PyErr_SetString(PyExc_ValueError, "Need at least one color and the garbage layer");
+    return NULL;
+  }
+  int num_words = state.tall ? NUM_FLOORS * state.num_layers : state.num_layers;
+  if (PyByteArray_GET_SIZE(data) < num_words * (Py_ssize_t)sizeof(puyos_t)) {
+    PyErr_SetString(PyExc_ValueError, "Field too small for the number of layers");
+    return NULL;
+  }
+  if (state.width < 1 || state.width > WIDTH) {
+    PyErr_SetString(PyExc_ValueError, "Width out of range");
+    return NULL;
+  }
+  if (!state.chain_number) {
+    if (move < 0 || move >= NUM_ACTIONS) {
+      PyErr_SetString(PyExc_ValueError, "Move out of range");
+      return NULL;
+    }
+    if (color_a < 0 || color_a >= state.num_layers || color_b < 0 || color_b >= state.num_layers) {
+      PyErr_SetString(PyExc_ValueError, "Colors must be between zero and the number of layers");
+      return NULL;
+    }
+  }
+  int released_garbage = versus_step((puyos_t*)data->ob_start, &state, move, color_a, color_b);
+  if (released_garbage < 0) {
+    PyErr_SetString(PyExc_ZeroDivisionError, "Target score must be positive");
+    return NULL;
+  }
+
+  return Py_BuildValue(
+    "i(iiiiNi)",
+    released_garbage,
+    state.chain_number, state.chain_score, state.step_score,
+    state.pending_garbage, PyBool_FromLong(state.all_clear_pending), state.garbage_x
+  );
+}
+
+static PyMethodDef PuyoMethods[] = {
+  {"bottom_render", py_bottom_render, METH_VARARGS, "Debug print for bottom state inspection."},
+  {"bottom_handle_gravity", py_bottom_handle_gravity, METH_VARARGS, "Handle puyo gravity for a bottom state."},
+  {"bottom_clear_groups", py_bottom_clear_groups, METH_VARARGS, "Clear groups for a bottom state."},
+  {"bottom_resolve", py_bottom_resolve, METH_VARARGS, "Fully resolve a bottom state and return the chain length."},
+  {"bottom_resolve_incremental", py_bottom_resolve_incremental, METH_VARARGS, "Resolve a bottom state where only the dirty puyos can start a chain."},
+  {"bottom_encode", py_bottom_encode, METH_VARARGS, "Encodes a bottom state as an array of chars."},
+  {"bottom_encode_into", py_bottom_encode_into, METH_VARARGS, "Encodes the visible part of a bottom state into a writable buffer."},
+  {"bottom_valid_moves", py_bottom_valid_moves, METH_VARARGS, "Returns a bitset of valid moves on a bottom state."},
+  {"bottom_tree_search", py_bottom_tree_search, METH_VARARGS, "Does a tree search with the given colors and an optional transposition table."},
+  {"bottom_tree_search_many", py_bottom_tree_search_many, METH_VARARGS, "Does tree searches on a list of fields in parallel."},
+  {"tall_render", py_tall_render, METH_VARARGS, "Debug print for tall state inspection."},
   {"tall_handle_gravity", py_tall_handle_gravity, METH_VARARGS, "Handle puyo gravity for a tall state."},
   {"tall_clear_groups", py_tall_clear_groups, METH_VARARGS, "Clear groups for a tall state."},
   {"tall_resolve", py_tall_resolve, METH_VARARGS, "Fully resolve a tall state and return the score and the chain length."},
+  {"tall_resolve_incremental", py_tall_resolve_incremental, METH_VARARGS, "Resolve a tall state where only the dirty puyos can start a chain."},
   {"tall_encode", py_tall_encode, METH_VARARGS, "Encodes a tall state as an array of chars."},
+  {"tall_encode_into", py_tall_encode_into, METH_VARARGS, "Encodes the visible part of a tall state into a writable buffer."},
   {"tall_valid_moves", py_tall_valid_moves, METH_VARARGS, "Returns a bitset of valid moves on a tall state."},
-  {"tall_tree_search", py_tall_tree_search, METH_VARARGS, "Does a tree search with the given colors."},
-  {"make_move", py_make_move, METH_VARARGS, "Overlays two puyos of the given colors on top of the field."},
-  {"mirror", py_mirror, METH_VARARGS, "Flip the field horizontally."},
+  {"tall_tree_search", py_tall_tree_search, METH_VARARGS, "Does a tree search with the given colors and an optional transposition table."},
+  {"tall_tree_search_many", py_tall_tree_search_many, METH_VARARGS, "Does tree searches on a list of fields in parallel."},
+  {"bottom_root_search", py_bottom_root_search, METH_VARARGS, "Scores every action from the root of a bottom state."},
+  {"tall_root_search", py_tall_root_search, METH_VARARGS, "Scores every action from the root of a tall state."},
+  {"bottom_root_search_batch", py_bottom_root_search_batch, METH_VARARGS, "Scores every action from many roots of bottom states in parallel."},
+  {"tall_root_search_batch", py_tall_root_search_batch, METH_VARARGS, "Scores every action from many roots of tall states in parallel."},
+  {"make_move", py_make_move, METH_VARARGS, "Overlays two puyos of the given colors on top of the field and returns their positions."},
+  {"mirror", py_mirror, METH_VARARGS, "Flips a field of the given width horizontally keeping it aligned to the left edge."},
+  {"mirror_many", py_mirror_many, METH_VARARGS, "Flips every field in a contiguous buffer of words horizontally."},
+  {"shift", py_shift, METH_VARARGS, "Moves the puyos of a field right by a positive amount of columns and left by a negative one."},
+  {"overlay", py_overlay, METH_VARARGS, "Adds the puyos of a layer to the empty positions of a field."},
+  {"drop_garbage", py_drop_garbage, METH_VARARGS, "Drops lines of garbage on a field and returns the column the next line continues from."},
+  {"transposition_table", py_transposition_table, METH_VARARGS, "Allocates a transposition table with 2**n entries for tree searches."},
+  {"age_transposition_table", py_age_transposition_table, METH_VARARGS, "Marks the entries of a transposition table as old."},
+  {"clear_transposition_table", py_clear_transposition_table, METH_VARARGS, "Removes all entries from a transposition table."},
+  {"set_search_counting", py_set_search_counting, METH_VARARGS, "Enables or disables counting the work of the tree searches. Enabling resets the counters."},
+  {"get_search_counters", py_get_search_counters, METH_VARARGS, "Returns the nodes, leaves, transposition table probes and hits counted so far."},
+  {"batch_reset", py_batch_reset, METH_VARARGS, "Resets a batch of endless states and encodes their observations."},
+  {"batch_step", py_batch_step, METH_VARARGS, "Steps a batch of endless states resetting the ones that end."},
+  {"replay_game", py_replay_game, METH_VARARGS, "Replays the moves of a game encoding the field before every move and returns the number of moves played."},
+  {"versus_step", py_versus_step, METH_VARARGS, "Advances a versus mode player by one step and returns the garbage released and the new progress."},
   {NULL, NULL, 0, NULL}
 };
 
@@ -362,6 +1548,20 @@ PyInit_puyocore(void)
   if (m == NULL) {
     return NULL;
   }
+  if (PyModule_AddIntConstant(m, "NUM_ACTIONS", NUM_ACTIONS)) {
+    Py_DECREF(m);
+    return NULL;
+  }
+  if (PyType_Ready(&SearcherType) < 0) {
+    Py_DECREF(m);
+    return NULL;
+  }
+  Py_INCREF(&SearcherType);
+  if (PyModule_AddObject(m, "Searcher", (PyObject*)&SearcherType)) {
+    Py_DECREF(&SearcherType);
+    Py_DECREF(m);
+    return NULL;
+  }
 
   return m;
 }
@@ -1,8 +1,25 @@
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+
 import pytest
 from gym import make
 
-from gym_puyopuyo.agent import AGENTS
+import puyocore as core
+from gym_puyopuyo.agent import (
+    AGENTS,
+    _action_mask,
+    _children_scores,
+    batch_root_scores,
+    make_searcher,
+    root_scores,
+    tree_search_actions,
+)
 from gym_puyopuyo.env import ENV_NAMES
+from gym_puyopuyo.field import BottomField, TallField
 
 
 @pytest.mark.parametrize("name", AGENTS.keys())
@@ -19,3 +36,393 @@ def test_agent(name):
         env.render()
         if done:
             break
+
+
+@pytest.mark.parametrize("name", AGENTS.keys())
+def test_transposition_table(name):
+    env = make(ENV_NAMES[name])
+    agent = AGENTS[name]()
+    agent.depth = min(agent.depth, 3)
+    table = core.transposition_table(10)
+
+    env.reset()
+    state = env.unwrapped.state
+    for i in range(3):
+        core.age_transposition_table(table)
+        indices = tree_search_actions(state, agent.depth, agent.factor, agent.occupation_threshold, table)
+        assert (indices == tree_search_actions(state, agent.depth, agent.factor, agent.occupation_threshold))
+        _, _, done, info = env.step(indices[0])
+        state = info["state"]
+        if done:
+            break
+
+
+def test_transposition_table_size():
+    for log2_size in (-1, 0, 41):
+        with pytest.raises(ValueError):
+            core.transposition_table(log2_size)
+    core.transposition_table(1)
+
+    # Limit the address space of a separate process so that the allocation fails regardless of overcommit.
+    pytest.importorskip("resource")
+    code = (
+        "import resource\n"
+        "import puyocore\n"
+        "resource.setrlimit(resource.RLIMIT_AS, (1 << 31, 1 << 31))\n"
+        "try:\n"
+        "    puyocore.transposition_table(34)\n"
+        "except MemoryError:\n"
+        "    raise SystemExit(0)\n"
+        "raise SystemExit(1)\n"
+    )
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(core.__file__)))
+    assert (subprocess.call([sys.executable, "-c", code], env=env) == 0)
+
+
+@pytest.mark.parametrize("name", AGENTS.keys())
+def test_parallel_search(name):
+    env = make(ENV_NAMES[name])
+    env.reset()
+    for _ in range(5):
+        env.step(env.action_space.sample())
+    state = env.unwrapped.state
+    children = [child for child, _ in state.get_children()]
+    colors = list(state.deals[1][:]) * 2
+    if isinstance(state.field, TallField):
+        args = [state.num_layers, state.width, state.tsu_rules, state.has_garbage, (1 << 30) - 1, colors, 2, 1.0]
+        search_fun = core.tall_tree_search
+        search_many = core.tall_tree_search_many
+    else:
+        args = [state.num_layers, state.has_garbage, (1 << 30) - 1, colors, 2, 1.0]
+        search_fun = core.bottom_tree_search
+        search_many = core.bottom_tree_search_many
+    expected = [search_fun(child.field.data, *args) for child in children]
+    fields = [child.field.data for child in children]
+    assert (search_many(fields, *args) == expected)
+    assert (search_many(fields, *(args + [None, 4])) == expected)
+    assert (search_many(fields, *(args + [core.transposition_table(8), 3])) == expected)
+
+
+@pytest.mark.parametrize("name", AGENTS.keys())
+def test_root_search(name):
+    env = make(ENV_NAMES[name])
+    env.reset()
+    for _ in range(4):
+        env.step(env.action_space.sample())
+    state = env.unwrapped.state
+    colors = [color for deal in state.deals for color in deal]
+    action_mask = (1 << 30) - 1
+    if isinstance(state.field, TallField):
+        rules = [state.num_layers, state.width, state.tsu_rules, state.has_garbage, action_mask]
+        search_root = core.tall_root_search
+        search_many = core.tall_tree_search_many
+    else:
+        rules = [state.num_layers, state.has_garbage, action_mask]
+        search_root = core.bottom_root_search
+        search_many = core.bottom_tree_search_many
+    root_scores, root_popcounts, depth = search_root(state.field.data, *(rules + [colors, 2, 1.0]))
+    assert (depth == 2)
+    scores, popcounts = _children_scores(state, lambda fields: search_many(fields, *(rules + [colors[2:], 1, 1.0])))
+    for action, score, popcount in zip(state.actions, scores, popcounts):
+        index = state._action_indices[action]
+        assert (root_scores[index] == score)
+        assert (root_popcounts[index] == (-1 if popcount is None else popcount))
+
+
+@pytest.mark.parametrize("name", ["vs-small", "vs-tsu"])
+def test_versus_search(name):
+    env = make(ENV_NAMES[name])
+    env.seed(0)
+    env.reset()
+    for _ in range(4):
+        env.step(env.action_space.sample())
+    state = env.unwrapped.state.players[0]
+    colors = [color for deal in state.deals for color in deal]
+    if isinstance(state.field, TallField):
+        rules = [state.num_layers, state.width, state.tsu_rules, state.has_garbage, _action_mask(state)]
+        search_many = core.tall_tree_search_many
+    else:
+        rules = [state.num_layers, state.has_garbage, _action_mask(state)]
+        search_many = core.bottom_tree_search_many
+    expected = _children_scores(state, lambda fields: search_many(fields, *(rules + [colors[2:], 1, 1.0])))
+
+    searcher = make_searcher(state, 2, 1.0, core.transposition_table(10))
+    for _ in range(2):
+        scores, popcounts, depth = root_scores(state, 2, 1.0, searcher=searcher)
+        assert (depth == 2)
+        assert ((scores, popcounts) == expected)
+    assert (searcher.search_fields([], colors[2:]) == ([], 2))
+    with pytest.raises(ValueError):
+        searcher.search_fields([bytearray(8)], colors[2:])
+
+
+@pytest.mark.parametrize("name", AGENTS.keys())
+def test_batch_root_search(name):
+    env = make(ENV_NAMES[name])
+    states = []
+    for i in range(6):
+        env.seed(i)
+        env.reset()
+        for _ in range(3 + i):
+            env.step(env.action_space.sample())
+        states.append(env.unwrapped.state.clone())
+    expected = [root_scores(state, 2, 1.0)[:2] for state in states]
+    for table, num_threads in [(None, 1), (core.transposition_table(10), 3)]:
+        scores, popcounts = batch_root_scores(states, 2, 1.0, table, num_threads)
+        assert (scores.shape == popcounts.shape == (len(states), len(states[0].actions)))
+        for row_scores, row_popcounts, (state_scores, state_popcounts) in zip(scores, popcounts, expected):
+            assert (list(row_scores) == state_scores)
+            assert (list(row_popcounts) == [-1 if p is None else p for p in state_popcounts])
+    agent = AGENTS[name]()
+    agent.depth = 1
+    actions = agent.get_actions(states)
+    assert (len(actions) == len(states))
+    for state, action in zip(states, actions):
+        assert (state.validate_action(*state.actions[action]))
+
+
+@pytest.mark.parametrize("name", AGENTS.keys())
+def test_searcher(name):
+    env = make(ENV_NAMES[name])
+    env.seed(0)
+    env.reset()
+    agent = AGENTS[name]()
+    searcher = make_searcher(env.unwrapped.state, 2, agent.factor, core.transposition_table(10), num_threads=2)
+    assert (searcher.depth == 2)
+    for _ in range(4):
+        state = env.unwrapped.state
+        assert (root_scores(state, 2, agent.factor, searcher=searcher) == root_scores(state, 2, agent.factor))
+        # Fewer deals than the depth make the search draw the rest.
+        short = state.clone()
+        short.deals = short.deals[:1]
+        assert (root_scores(short, 2, agent.factor, searcher=searcher) == root_scores(short, 2, agent.factor))
+        env.step(env.action_space.sample())
+    with pytest.raises(ValueError):
+        searcher.search(bytearray(8), [])
+    with pytest.raises(ValueError):
+        searcher.search(state.field.data, [0])
+
+    agent.get_action(state)
+    searcher = agent.searcher
+    agent.get_action(state)
+    assert (agent.searcher is searcher)
+    agent.depth = 1
+    agent.get_action(state)
+    assert (agent.searcher is not searcher)
+
+
+@pytest.mark.parametrize("name", AGENTS.keys())
+def test_shared_table(name):
+    env = make(ENV_NAMES[name])
+    env.seed(2)
+    env.reset()
+    states = []
+    for _ in range(3):
+        env.step(env.action_space.sample())
+        states.append(env.unwrapped.state.clone())
+    factors = [0.5, 8.0]
+    expected = {factor: [root_scores(state, 2, factor) for state in states] for factor in factors}
+
+    # Searches configured differently share the table concurrently without mixing up their entries.
+    table = core.transposition_table(12)
+    results = {}
+
+    def search(factor):
+        searcher = make_searcher(states[0], 2, factor, table)
+        results[factor] = [root_scores(state, 2, factor, searcher=searcher) for state in states for _ in range(3)]
+
+    threads = [threading.Thread(target=search, args=(factor,)) for factor in factors]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for factor in factors:
+        assert (results[factor] == [scores for scores in expected[factor] for _ in range(3)])
+
+
+@pytest.mark.parametrize("name", AGENTS.keys())
+def test_beam_search(name):
+    env = make(ENV_NAMES[name])
+    env.seed(1)
+    env.reset()
+    for _ in range(3):
+        env.step(env.action_space.sample())
+    state = env.unwrapped.state
+    agent = AGENTS[name]()
+    num_actions = len(state.actions)
+
+    # A beam at least as wide as the number of moves is exact.
+    expected = root_scores(state, 3, agent.factor)
+    assert (root_scores(state, 3, agent.factor, beam_width=num_actions) == expected)
+    scores, _ = batch_root_scores([state], 3, agent.factor, beam_width=num_actions)
+    assert (list(scores[0]) == expected[0])
+
+    # A narrow beam only explores some of the lines so it never overestimates a move.
+    searcher = make_searcher(state, 3, agent.factor, None, beam_width=1)
+    assert (searcher.beam_width == 1)
+    narrow = root_scores(state, 3, agent.factor, searcher=searcher)
+    for score, exact in zip(narrow[0], expected[0]):
+        if exact is None:
+            assert (score is None)
+        else:
+            assert (score <= exact + 1e-9)
+
+    agent.get_action(state)
+    searcher = agent.searcher
+    agent.beam_width = 2
+    agent.get_action(state)
+    assert (agent.searcher is not searcher)
+    assert (agent.searcher.beam_width == 2)
+
+
+@pytest.mark.parametrize("name", AGENTS.keys())
+def test_iterative_deepening(name):
+    env = make(ENV_NAMES[name])
+    env.reset()
+    for _ in range(4):
+        env.step(env.action_space.sample())
+    state = env.unwrapped.state
+    agent = AGENTS[name]()
+
+    # A generous budget completes every iteration and matches the fixed depth search.
+    expected = root_scores(state, 2, agent.factor)
+    assert (root_scores(state, 2, agent.factor, time_budget=1e6) == expected)
+
+    # A tiny budget still completes the first iteration.
+    scores, popcounts, depth = root_scores(state, 6, agent.factor, agent.get_table(), time_budget=1e-3)
+    assert (1 <= depth < 6)
+    assert (scores == root_scores(state, depth, agent.factor)[0])
+
+    agent.time_budget = 10
+    agent.get_action(state)
+    assert (1 <= agent.last_depth <= agent.max_depth)
+
+
+@pytest.mark.parametrize("name", ["vs-small", "vs-tsu"])
+def test_versus_iterative_deepening(name):
+    env = make(ENV_NAMES[name])
+    env.seed(0)
+    env.reset()
+    for _ in range(4):
+        env.step(env.action_space.sample())
+    state = env.unwrapped.state.players[0]
+    agent = AGENTS[name.split("-")[1]]()
+
+    scores, popcounts, depth = root_scores(state, 6, agent.factor, time_budget=1e-3)
+    assert (1 <= depth < 6)
+    assert ((scores, popcounts) == root_scores(state, depth, agent.factor)[:2])
+
+    # A fixed search at max_depth would take far longer than this.
+    agent.time_budget = 50
+    start = time.time()
+    agent.get_action(state)
+    assert (time.time() - start < 2)
+    assert (1 <= agent.last_depth <= agent.max_depth)
+
+
+def _reference_search(field, num_layers, action_mask, colors, num_deals, depth, factor, nodes):
+    """
+    Exhaustive expectimax mirroring bottom_tree_search without any pruning.
+
+    Counts the searched nodes in the first item of nodes.
+    """
+    nodes[0] += 1
+    depth = max(depth, 0)
+    if not depth:
+        return core.bottom_tree_search(field, num_layers, False, action_mask, [], 0, factor)
+    if num_deals > 0:
+        return _reference_single(field, num_layers, action_mask, colors, num_deals - 1, depth, factor, nodes)
+    num_colors = num_layers
+    score = 0
+    for c0 in range(num_colors):
+        for c1 in range(c0, num_colors):
+            single_score = _reference_single(field, num_layers, action_mask, [c0, c1], 0, depth, factor, nodes)
+            score += single_score if c0 == c1 else 2 * single_score
+    return score / (num_colors * num_colors)
+
+
+def _reference_single(field, num_layers, action_mask, colors, num_deals, depth, factor, nodes):
+    valid = core.bottom_valid_moves(field, num_layers)
+    valid = (valid | (valid << 15)) & action_mask
+    score = -10
+    num_actions = 15 if colors[0] == colors[1] else 30
+    for i in range(num_actions):
+        if not valid & (1 << i):
+            continue
+        child = bytearray(field)
+        core.make_move(child, i, colors[0], colors[1])
+        move_score = core.bottom_resolve(child, num_layers, False) ** 2
+        tree_score = _reference_search(
+            child, num_layers, action_mask, colors[2:], num_deals - 1, depth - 1, factor, nodes
+        )
+        score = max(score, move_score + 0.95 * tree_score)
+    return score
+
+
+def test_pruned_search_matches_reference():
+    env = make(ENV_NAMES["small"])
+    env.seed(0)
+    env.reset()
+    agent = AGENTS["small"]()
+    table = core.transposition_table(16)
+    reference_nodes = [0]
+    pruned_nodes = 0
+    for _ in range(3):
+        state = env.unwrapped.state
+        action_mask = _action_mask(state)
+        colors = list(state.deals[0])
+        expected = _reference_search(
+            state.field.data, state.num_layers, action_mask, colors, 1, 3, agent.factor, reference_nodes
+        )
+        args = [state.field.data, state.num_layers, False, action_mask, colors, 3, agent.factor]
+        core.set_search_counting(True)
+        try:
+            assert (core.bottom_tree_search(*args) == expected)
+        finally:
+            core.set_search_counting(False)
+        pruned_nodes += core.get_search_counters()["nodes"]
+        # The upper bounds that pruned nodes leave in the table must not pass for exact values.
+        for _ in range(2):
+            assert (core.bottom_tree_search(*(args + [table])) == expected)
+        env.step(env.action_space.sample())
+    assert (pruned_nodes < reference_nodes[0])
+
+
+def _reference_heuristic(field):
+    stack = field.to_list()
+    seen = set()
+    score = 0
+    for start, puyo in enumerate(stack):
+        if puyo is None or start in seen:
+            continue
+        seen.add(start)
+        group = [start]
+        for index in group:
+            y, x = divmod(index, field.WIDTH)
+            for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+                if 0 <= x + dx < field.WIDTH and 0 <= y + dy < field.HEIGHT:
+                    neighbour = index + dx + dy * field.WIDTH
+                    if stack[neighbour] == puyo and neighbour not in seen:
+                        seen.add(neighbour)
+                        group.append(neighbour)
+        score += len(group) ** 2
+    return score
+
+
+@pytest.mark.parametrize("field_class", [BottomField, TallField])
+def test_group_heuristic(field_class):
+    rng = random.Random(0)
+    for _ in range(50):
+        num_layers = rng.randint(1, 5)
+        density = rng.random()
+        stack = [
+            rng.randrange(num_layers) if rng.random() < density else None
+            for _ in range(field_class.WIDTH * field_class.HEIGHT)
+        ]
+        field = field_class.from_list(stack, num_layers=num_layers)
+        # Leaves of the search are scored by the heuristic alone.
+        if field_class is TallField:
+            score = core.tall_tree_search(field.data, num_layers, field.WIDTH, False, False, 0, [], 0, 1.0)
+        else:
+            score = core.bottom_tree_search(field.data, num_layers, False, 0, [], 0, 1.0)
+        assert (score == _reference_heuristic(field))
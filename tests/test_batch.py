@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from gym_puyopuyo.env.batch import PuyoPuyoEndlessBatchEnv
+
+
+@pytest.mark.parametrize("params", [
+    {"height": 8, "width": 3, "num_colors": 3, "num_deals": 3},
+    {"height": 8, "width": 8, "num_colors": 4, "num_deals": 3},
+    {"height": 13, "width": 6, "num_colors": 4, "num_deals": 3, "tsu_rules": True},
+    {"height": 16, "width": 8, "num_colors": 5, "num_deals": 3},
+])
+def test_batch_matches_state(params):
+    env = PuyoPuyoEndlessBatchEnv(7, **params)
+    env.seed(1234)
+    observations = env.reset()
+    for _ in range(60):
+        states = [env.get_state(i) for i in range(env.num_envs)]
+        for i, state in enumerate(states):
+            deals, field = state.encode()
+            assert (deals == observations[0][i]).all()
+            assert (field == observations[1][i]).all()
+            assert env.observation_space.contains((observations[0][i], observations[1][i]))
+        actions = env.np_random.randint(0, env.action_space.n, size=env.num_envs)
+        observations, rewards, dones, _ = env.step(actions)
+        for i, (state, action) in enumerate(zip(states, actions)):
+            reward = state.step(*state.actions[action])
+            assert (rewards[i] == reward)
+            assert (dones[i] == (reward < 0))
+            if dones[i]:
+                assert (not env.fields[i].any())
+            else:
+                assert (env.get_state(i).field.data == state.field.data)
+                assert (env.get_state(i).deals[:-1] == state.deals[:-1])
+
+
+def test_batch_reset():
+    env = PuyoPuyoEndlessBatchEnv(5, 8, 3, 3, 3)
+    deals, fields = env.reset()
+    assert (deals.shape == (5, 3, 3, 2))
+    assert (fields.shape == (5, 3, 8, 3))
+    assert (not fields.any())
+    assert (deals.sum(axis=(1, 3)) == 2).all()
+    with pytest.raises(ValueError):
+        env.step(np.zeros(4, dtype=int))
+    with pytest.raises(ValueError):
+        env.step(np.zeros(5, dtype=int) + env.action_space.n)
+    with pytest.raises(ValueError):
+        env.step(np.zeros(5, dtype=int) - 1)
+    with pytest.raises(ValueError):
+        env.step(np.zeros(5))
+    env.step([0] * 5)
@@ -29,7 +29,7 @@ def test_gravity():
     field = BottomField.from_list(stack)
     field.render()
     print()
-    field.handle_gravity()
+    iterations = field.handle_gravity()
     field.render()
     stack = field.to_list()
     assert (stack == [
@@ -42,6 +42,9 @@ def test_gravity():
         R, _, _, _, _, _, _, _,
         G, R, _, _, _, _, _, _,
     ])
+    # One pass per row fallen plus the final pass where nothing moves.
+    assert (iterations == 8)
+    assert (field.handle_gravity() == 1)
 
 
 def test_clear_groups():
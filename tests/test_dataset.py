@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+
+import io
+import random
+
+import numpy as np
+import pytest
+
+from gym_puyopuyo.dataset import RecordDataset
+from gym_puyopuyo.record import BinaryRecordWriter, read_record, write_record
+from gym_puyopuyo.state import State
+
+
+def expected_samples(record):
+    deals, fields, actions, rewards = [], [], [], []
+    for state, action, reward in record:
+        deals.append(state.encode_deals())
+        fields.append(state.encode_field())
+        actions.append(state.actions.index(action))
+        rewards.append(reward)
+    return np.array(deals), np.array(fields), np.array(actions), np.array(rewards)
+
+
+def concatenate(batches):
+    samples = [(deals, fields, actions, rewards) for (deals, fields), actions, rewards in batches]
+    return [np.concatenate(arrays) for arrays in zip(*samples)]
+
+
+@pytest.mark.parametrize("height", [8, 13, 16])
+def test_binary_dataset(height, tmpdir):
+    path = str(tmpdir.join("games.bin"))
+    tsu_rules = (height == 13)
+    writer = BinaryRecordWriter(path, height, 6, 4, 3, tsu_rules=tsu_rules, checkpoint_interval=4)
+    for seed in range(5):
+        state = State(height, 6, 4, 3, tsu_rules=tsu_rules, seed=seed)
+        rng = random.Random(seed)
+        state.step(*state.actions[0])
+        writer.write_game(state, [rng.randrange(len(state.actions)) for _ in range(10 + 7 * seed)])
+    writer.close()
+
+    dataset = RecordDataset([path], batch_size=7, prefetch=2)
+    expected = [expected_samples(record.replay()) for record in dataset.sources[0]]
+    expected = [np.concatenate(arrays) for arrays in zip(*expected)]
+    batches = list(dataset)
+    assert (all(len(actions) == 7 for _, actions, _ in batches[:-1]))
+    for result, array in zip(concatenate(batches), expected):
+        assert (result == array).all()
+
+    # Shuffling and dropping the last batch keeps the samples in sync.
+    dataset = RecordDataset([path], batch_size=7, shuffle=True, drop_last=True, seed=0)
+    batches = list(dataset)
+    assert (len(batches) == len(expected[2]) // 7)
+    deals, fields, actions, rewards = concatenate(batches)
+    for i in range(len(actions)):
+        matches = (expected[1] == fields[i]).all(axis=(1, 2, 3)) & (expected[0] == deals[i]).all(axis=(1, 2, 3))
+        assert (matches.any())
+        assert (actions[i] in expected[2][matches])
+    dataset.close()
+
+
+def test_json_dataset(tmpdir):
+    base_state = State(13, 6, 4, 3, tsu_rules=True)
+    paths = []
+    for seed in range(3):
+        state = State(13, 6, 4, 3, tsu_rules=True, seed=seed)
+        rng = random.Random(seed)
+        actions = []
+        for _ in range(15):
+            valid = [action for action, valid in zip(state.actions, state.get_action_mask()) if valid]
+            actions.append(rng.choice(valid))
+            state.step(*actions[-1])
+        path = str(tmpdir.join("game{}.json".format(seed)))
+        with io.open(path, "w") as f:
+            write_record(f, State(13, 6, 4, 3, tsu_rules=True, seed=seed), actions)
+        paths.append(path)
+
+    random.seed(0)
+    batches = list(RecordDataset(paths, batch_size=8, base_state=base_state))
+    random.seed(0)
+    expected = []
+    for path in paths:
+        with io.open(path) as f:
+            expected.append(expected_samples(read_record(f, base_state)))
+    expected = [np.concatenate(arrays) for arrays in zip(*expected)]
+    deals, fields, actions, rewards = concatenate(batches)
+    assert (len(actions) == 45)
+    assert (fields == expected[1]).all()
+    assert (actions == expected[2]).all()
+    assert (rewards == expected[3]).all()
+    # Only the deals at the end of the records are unknown.
+    for offset in range(0, 45, 15):
+        assert (deals[offset:offset + 13] == expected[0][offset:offset + 13]).all()
+
+
+def test_early_exit(tmpdir):
+    path = str(tmpdir.join("games.bin"))
+    writer = BinaryRecordWriter(path, 8, 6, 4, 3)
+    for seed in range(20):
+        state = State(8, 6, 4, 3, seed=seed)
+        writer.write_game(state, [0, 1, 2, 3] * 5)
+    writer.close()
+    dataset = RecordDataset([path], batch_size=2, prefetch=1)
+    for _ in dataset:
+        break
+    assert (len(list(dataset)) > 1)
+    dataset.close()
@@ -1,3 +1,5 @@
+import random
+
 import numpy as np
 import pytest
 from gym.envs.registration import make
@@ -155,6 +157,125 @@ def test_read_record():
         info["state"].render()
 
 
+@pytest.mark.parametrize(
+    "name",
+    [ENV_NAMES["small"], ENV_NAMES["tsu"], ENV_NAMES["boxed-small"], ENV_NAMES["boxed-tsu"]],
+)
+def test_permute_observations(name):
+    env = make(name)
+    env.seed(0)
+    env.reset()
+    observations = []
+    for _ in range(6):
+        observation, _, _, _ = env.step(env.action_space.sample())
+        observations.append(observation)
+    unwrapped = env.unwrapped
+    num_colors = unwrapped.state.num_colors
+    num_deals = unwrapped.state.num_deals
+    rng = np.random.RandomState(0)
+    permutations = np.array([rng.permutation(num_colors) for _ in observations])
+    flips = rng.random_sample((len(observations), num_deals)) < 0.5
+
+    boxed = not isinstance(observation, tuple)
+    expected = []
+    for observation, permutation, flip in zip(observations, permutations, flips):
+        if boxed:
+            permuted = np.zeros_like(observation)
+            permuted[..., permutation] = observation
+        else:
+            deals, colors = observation
+            permuted = (np.zeros_like(deals), np.zeros_like(colors))
+            permuted[0][permutation] = deals
+            permuted[1][permutation] = colors
+            for i in range(1, num_deals):
+                if flip[i]:
+                    permuted[0][:, i] = permuted[0][:, i, ::-1]
+        expected.append(permuted)
+
+    if boxed:
+        batch = np.stack(observations)
+        result = unwrapped.permute_observations(batch, permutations)
+        assert (result == np.stack(expected)).all()
+        assert (unwrapped.permute_observations(batch, permutations, in_place=True) is batch)
+        assert (batch == result).all()
+    else:
+        batch = tuple(np.stack(arrays) for arrays in zip(*observations))
+        result = unwrapped.permute_observations(batch, permutations, flips)
+        for array, expected_array in zip(result, zip(*expected)):
+            assert (array == np.stack(expected_array)).all()
+        assert (unwrapped.permute_observations(batch, permutations, flips, in_place=True) is batch)
+        for array, result_array in zip(batch, result):
+            assert (array == result_array).all()
+
+    # Random permutations only reorder the colors.
+    permuted = unwrapped.permute_observation(observation)
+    assert env.observation_space.contains(permuted)
+    for array, permuted_array in zip(_arrays(observation), _arrays(permuted)):
+        if boxed:
+            array, permuted_array = array.T, permuted_array.T
+        counts = array.reshape(num_colors, -1).sum(axis=1)
+        permuted_counts = permuted_array.reshape(num_colors, -1).sum(axis=1)
+        assert (np.sort(counts) == np.sort(permuted_counts)).all()
+
+    # The draws come from the random module unless a NumPy generator is given.
+    random.seed(1)
+    first = unwrapped.permute_observations(batch)
+    random.seed(1)
+    second = unwrapped.permute_observations(batch)
+    for array, other in zip(_arrays(first), _arrays(second)):
+        assert (array == other).all()
+    first = unwrapped.permute_observations(batch, np_random=np.random.RandomState(1))
+    second = unwrapped.permute_observations(batch, np_random=np.random.RandomState(1))
+    for array, other in zip(_arrays(first), _arrays(second)):
+        assert (array == other).all()
+
+
+def _arrays(observation):
+    return observation if isinstance(observation, tuple) else (observation,)
+
+
+@pytest.mark.parametrize(
+    "name",
+    [ENV_NAMES["small"], ENV_NAMES["wide"], ENV_NAMES["tsu"], ENV_NAMES["boxed-small"], ENV_NAMES["boxed-tsu"]],
+)
+def test_mirror_observation(name):
+    env = make(name)
+    env.seed(0)
+    env.reset()
+    observations = []
+    for _ in range(3):
+        observation, _, _, _ = env.step(env.action_space.sample())
+        observations.append(observation)
+    unwrapped = env.unwrapped
+    state = unwrapped.state
+    twin = state.clone()
+    twin.mirror()
+    unwrapped.state = twin
+    if isinstance(observation, tuple):
+        expected = twin.encode()
+        batch = tuple(np.stack(arrays) for arrays in zip(*observations))
+    else:
+        expected = unwrapped.encode()
+        batch = np.stack(observations)
+    unwrapped.state = state
+
+    mirrored, permutation = unwrapped.mirror_observation(observation)
+    batch_mirrored, _ = unwrapped.mirror_observation(batch)
+    for array, batch_array, expected_array in zip(_arrays(mirrored), _arrays(batch_mirrored), _arrays(expected)):
+        assert (array == expected_array).all()
+        assert (batch_array[-1] == expected_array).all()
+    assert (permutation[permutation] == np.arange(env.action_space.n)).all()
+
+    # Mirrored actions lead to mirrored fields.
+    for action in range(env.action_space.n):
+        child = state.clone()
+        reward = child.step(*state.actions[action])
+        child.mirror()
+        mirrored_child = twin.clone()
+        assert (mirrored_child.step(*state.actions[permutation[action]]) == reward)
+        assert (mirrored_child.field.to_list() == child.field.to_list())
+
+
 @pytest.mark.parametrize(
     "name",
     [
@@ -0,0 +1,51 @@
+import pytest
+from gym import make
+
+import puyocore as core
+from gym_puyopuyo.agent import AGENTS
+from gym_puyopuyo.env import ENV_NAMES
+from gym_puyopuyo.profiling import profile
+from gym_puyopuyo.state import State
+
+
+def test_profile():
+    env = make(ENV_NAMES["tsu"])
+    env.reset()
+    agent = AGENTS["tsu"]()
+    agent.depth = 2
+    agent.table = core.transposition_table(10)
+    step = State.step
+    with profile() as result:
+        for _ in range(3):
+            env.step(agent.get_action(env.unwrapped.state))
+        with pytest.raises(RuntimeError):
+            with profile():
+                pass
+    assert (State.step is step)
+
+    stats = result.to_dict()
+    phases = stats["phases"]
+    for phase in ("env.step", "step", "validate", "move", "resolve", "encode", "search"):
+        assert (phases[phase]["calls"] >= 3)
+        assert (phases[phase]["ns"] > 0)
+    assert (phases["step"]["ns"] <= phases["env.step"]["ns"])
+    search = stats["search"]
+    assert (search["leaves"] > 0)
+    assert (search["nodes"] >= search["leaves"])
+    assert (search["table_probes"] >= search["table_hits"] > 0)
+
+    # Nothing is counted once the profile is over.
+    env.step(agent.get_action(env.unwrapped.state))
+    assert (core.get_search_counters() == search)
+
+
+def test_profile_versus():
+    env = make(ENV_NAMES["vs-small"])
+    env.reset()
+    with profile() as result:
+        for _ in range(3):
+            env.step(env.action_space.sample())
+    assert (result.calls["env.step"] == 3)
+    assert (result.calls["game.step"] == 3)
+    for phase in ("opponent", "versus.step", "validate", "encode"):
+        assert (result.calls[phase] >= 3)
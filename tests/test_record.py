@@ -1,10 +1,12 @@
 from __future__ import unicode_literals
 
 import json
+import random
 
+import pytest
 from six import StringIO
 
-from gym_puyopuyo.record import read_record, write_record
+from gym_puyopuyo.record import BinaryRecordReader, BinaryRecordWriter, read_record, write_record
 from gym_puyopuyo.state import State
 
 
@@ -84,3 +86,75 @@ def test_read_record():
         assert (action[0] == expected_action[0])
         assert (action[1] % 2 == expected_action[1])
     assert (total_reward == 4840)
+
+
+@pytest.mark.parametrize("height", [8, 13, 16])
+@pytest.mark.parametrize("checkpoint_interval", [0, 5])
+def test_binary_record(height, checkpoint_interval, tmpdir):
+    path = str(tmpdir.join("games.bin"))
+    tsu_rules = (height == 13)
+    writer = BinaryRecordWriter(path, height, 6, 4, 3, tsu_rules=tsu_rules, checkpoint_interval=checkpoint_interval)
+    games = []
+    for seed in range(4):
+        state = State(height, 6, 4, 3, tsu_rules=tsu_rules, seed=seed)
+        rng = random.Random(seed)
+        # Start from a non-empty field
+        state.step(*state.actions[0])
+        actions = [rng.randrange(len(state.actions)) for _ in range(10 + 7 * seed)]
+        writer.write_game(state, actions)
+        expected = list(read_replay(state, actions))
+        games.append(expected)
+    writer.close()
+
+    reader = BinaryRecordReader(path)
+    assert (len(reader) == len(games))
+    for index in reversed(range(len(games))):
+        expected = games[index]
+        record = reader[index]
+        assert (len(record) == len(expected) - 1)
+        replay = list(record.replay(include_last=True))
+        for (state, action, reward), (expected_state, expected_action, expected_reward) in zip(replay, expected):
+            assert (action == expected_action)
+            assert (reward == expected_reward)
+            assert (state.field.data == expected_state.field.data)
+            assert (state.deals == expected_state.deals)
+        for move in (len(record), len(record) // 2, 0):
+            state = record.get_state(move)
+            assert (state.field.data == expected[move][0].field.data)
+            assert (state.deals == expected[move][0].deals)
+    reader.close()
+
+
+def test_binary_record_fixed_deals(tmpdir):
+    path = str(tmpdir.join("games.bin"))
+    writer = BinaryRecordWriter(path, 8, 6, 4, 3)
+    rng = random.Random(0)
+    state = State(8, 6, 4, 3, seed=0)
+    state.num_deals = None
+    state.deals = [(rng.randrange(4), rng.randrange(4)) for _ in range(6)]
+    actions = [rng.randrange(len(state.actions)) for _ in range(8)]
+    writer.write_game(state, actions)
+    expected = list(read_replay(state.clone(), actions))
+    assert (len(expected) == 8)
+    writer.close()
+
+    reader = BinaryRecordReader(path)
+    record = reader[0]
+    assert (len(record) == 7)
+    for (state, action, _), (expected_state, expected_action, _) in zip(record.replay(include_last=True), expected):
+        assert (action == expected_action)
+        assert (state.field.data == expected_state.field.data)
+        assert (state.deals == expected_state.deals[:3])
+    del record
+    reader.close()
+
+
+def read_replay(state, actions):
+    for index in actions:
+        clone = state.clone()
+        action = state.actions[index]
+        reward = state.step(*action)
+        yield clone, action, reward
+        if reward < 0:
+            break
+    yield state, None, None
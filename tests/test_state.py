@@ -5,8 +5,10 @@ import random
 import numpy as np
 import pytest
 
+import puyocore as core
+
 from gym_puyopuyo import util
-from gym_puyopuyo.field import BottomField, TallField
+from gym_puyopuyo.field import BottomField, TallField, mirror_fields
 from gym_puyopuyo.state import State
 
 _ = None
@@ -213,6 +215,51 @@ def test_garbage_tsu():
     assert (state.field.popcount == 51)
 
 
+def _reference_add_garbage(state, amount):
+    garbage = state.field.num_colors
+    stack = []
+    while amount:
+        line = [None] * state.field.WIDTH
+        while state.garbage_x < state.width and amount:
+            line[state.garbage_x] = garbage
+            state.garbage_x += 1
+            amount -= 1
+        if state.garbage_x >= state.width:
+            state.garbage_x = 0
+        stack = line + stack
+    if len(stack) > state.field.WIDTH * state.field.HEIGHT:
+        stack = [garbage] * (state.field.WIDTH * state.field.HEIGHT)
+    field = type(state.field).from_list(stack, num_layers=state.num_layers)
+    for i, yours in enumerate(field.data):
+        row = i % 8 + 8 * state.num_layers * (i // (8 * state.num_layers))
+        mask = 0
+        for k in range(state.num_layers):
+            mask |= state.field.data[row + 8 * k]
+        state.field.data[i] |= yours & ~mask
+    state.field.handle_gravity()
+
+
+@pytest.mark.parametrize("height", [8, 13, 16])
+def test_add_garbage_matches_reference(height):
+    rng = random.Random(height)
+    for _ in range(30):
+        width = 6 if height == 13 else rng.randint(1, 8)
+        state = State(height, width, 4, 1, tsu_rules=(height == 13), has_garbage=True, seed=rng.randint(0, 100))
+        twin = state.clone()
+        for _ in range(10):
+            if rng.random() < 0.5:
+                action = rng.choice(state.actions)
+                state.step(*action)
+                twin.step(*action)
+                twin.deals = state.deals[:]
+            else:
+                amount = rng.randint(1, 3 * width * (1 + rng.randint(0, 8)))
+                state.add_garbage(amount)
+                _reference_add_garbage(twin, amount)
+                assert (state.garbage_x == twin.garbage_x)
+            assert (state.field.data == twin.field.data)
+
+
 @pytest.mark.parametrize("height", [8, 16])
 def test_mirror(height):
     state = State(height, 5, 3, 5)
@@ -233,6 +280,39 @@ def test_mirror(height):
     assert (state.field.to_list() == twin.field.to_list())
 
 
+@pytest.mark.parametrize("height", [8, 13, 16])
+def test_mirror_narrow(height):
+    tsu_rules = (height == 13)
+    rng = random.Random(height)
+    states = []
+    expected = []
+    for width in range(3, 9):
+        state = State(height, width, 4, 1, tsu_rules=tsu_rules, seed=width)
+        for _ in range(12):
+            state.step(*rng.choice(state.actions))
+        stack = state.field.to_list()
+        mirrored = []
+        for y in range(state.field.HEIGHT):
+            row = stack[y * state.field.WIDTH:(y + 1) * state.field.WIDTH]
+            mirrored.extend(row[:width][::-1] + row[width:])
+        states.append(state)
+        expected.append(mirrored)
+
+    # A batch of fields of different widths can only be flipped in full.
+    fields = np.array([np.frombuffer(bytes(state.field.data), dtype=np.uint64) for state in states])
+    batch = mirror_fields(fields.copy())
+    for state, field in zip(states, batch):
+        full = state.field.clone()
+        full.mirror()
+        assert (field.tobytes() == bytes(full.data))
+
+    for state, mirrored, field in zip(states, expected, fields):
+        narrow = mirror_fields(field[None].copy(), state.width)
+        state.mirror()
+        assert (state.field.to_list() == mirrored)
+        assert (narrow.tobytes() == bytes(state.field.data))
+
+
 @pytest.mark.parametrize("height", [8, 13, 16])
 def test_field_to_int(height):
     tsu_rules = (height == 13)
@@ -262,3 +342,110 @@ def test_render_in_place(height):
     print("hey!")
     state.render()
     print("wohou!")
+
+
+@pytest.mark.parametrize("height", [8, 13, 16])
+def test_encode_in_place(height):
+    state = State(height, 6, 4, 3, tsu_rules=(height == 13))
+    for _ in range(10):
+        state.step(*random.choice(state.actions))
+    deals, field = state.encode()
+    out = (np.ones_like(deals), np.ones_like(field))
+    encoded = state.encode(out=out)
+    assert (encoded[0] is out[0])
+    assert (encoded[1] is out[1])
+    assert (out[0] == deals).all()
+    assert (out[1] == field).all()
+
+    expected = np.zeros((state.num_layers, state.field.HEIGHT, state.field.WIDTH), dtype=np.int8)
+    for index, puyo in enumerate(state.field.to_list()):
+        if puyo is not None:
+            y, x = divmod(index, state.field.WIDTH)
+            expected[puyo, y, x] = 1
+    assert (field == expected[:, -state.height:, :state.width]).all()
+
+
+@pytest.mark.parametrize("height", [8, 13, 16])
+def test_clone(height):
+    state = State(height, 6, 4, 3, tsu_rules=(height == 13), has_garbage=True)
+    state.add_garbage(3)
+    for _ in range(5):
+        state.step(*random.choice(state.actions))
+    clone = state.clone()
+    assert (clone.actions is state.actions)
+    assert (clone.field.data == state.field.data)
+    assert (clone.deals == state.deals)
+    assert (clone.garbage_x == state.garbage_x)
+    assert (clone.tsu_rules == state.tsu_rules)
+    action = random.choice(state.actions)
+    data = bytearray(state.field.data)
+    deals = state.deals[:]
+    clone.step(*action)
+    assert (state.field.data == data)
+    assert (state.deals == deals)
+    assert (len(clone.deals) == len(deals))
+
+    # Clones draw their deals from generators of their own.
+    twin = state.clone()
+    assert (twin.np_random is not clone.np_random)
+    assert (twin.np_random is not state.np_random)
+    twin.seed(1)
+    clone.seed(1)
+    for _ in range(3):
+        twin.make_deal()
+        clone.make_deal()
+    assert (twin.deals[-3:] == clone.deals[-3:])
+
+    # The shared action tables can't be changed through a single state.
+    with pytest.raises(AttributeError):
+        clone.actions.append((0, 0))
+    with pytest.raises(ValueError):
+        clone._mask_indices[0] = 0
+
+
+@pytest.mark.parametrize("height", [8, 13, 16])
+def test_action_mask_matches_validation(height):
+    state = State(height, 5, 3, 3, tsu_rules=(height == 13))
+    for _ in range(30):
+        mask = state.get_action_mask()
+        expected = [state.validate_action(*action) for action in state.actions]
+        assert (list(mask.astype(bool)) == expected)
+        if state.step(*random.choice(state.actions)) < 0:
+            break
+    assert (State(height, 5, 3, 3, tsu_rules=(height == 13)).actions is state.actions)
+
+
+@pytest.mark.parametrize("height", [8, 13, 16])
+@pytest.mark.parametrize("has_garbage", [False, True])
+def test_incremental_resolve(height, has_garbage):
+    rng = random.Random(height)
+    tall = (height != 8)
+    for _ in range(20):
+        seed = rng.randint(0, 1 << 30)
+        state = State(height, 6, 4 + has_garbage, 3, tsu_rules=(height == 13), has_garbage=has_garbage, seed=seed)
+        for _ in range(40):
+            if has_garbage and rng.random() < 0.2:
+                state.add_garbage(rng.randint(1, 6))
+                # Garbage above the ghost row vanishes
+                state.field.resolve()
+            mask = state.get_action_mask()
+            valid = [action for action, valid in zip(state.actions, mask) if valid]
+            if not valid:
+                break
+            x, orientation = rng.choice(valid)
+            index = state._action_indices[(x, orientation)]
+            puyo_a, puyo_b = state.deals[0]
+            full = bytearray(state.field.data)
+            core.make_move(full, index, puyo_a, puyo_b)
+            incremental = bytearray(full)
+            placed = core.make_move(bytearray(state.field.data), index, puyo_a, puyo_b)
+            num_layers = state.num_layers
+            if tall:
+                expected = core.tall_resolve(full, num_layers, state.tsu_rules, has_garbage)
+                result = core.tall_resolve_incremental(incremental, num_layers, state.tsu_rules, has_garbage, placed)
+            else:
+                expected = core.bottom_resolve(full, num_layers, has_garbage)
+                result = core.bottom_resolve_incremental(incremental, num_layers, has_garbage, placed)
+            assert (result == expected)
+            assert (incremental == full)
+            state.step(x, orientation)
@@ -1,5 +1,7 @@
 from __future__ import print_function
 
+import random
+
 import pytest
 
 from gym_puyopuyo import util
@@ -36,7 +38,7 @@ def test_gravity():
     ]
     field = TallField.from_list(stack)
     field.render()
-    field.handle_gravity()
+    iterations = field.handle_gravity()
     print()
     field.render()
     stack = field.to_list()
@@ -58,6 +60,38 @@ def test_gravity():
         R, _, _, _, _, _, R, _,
         G, R, _, _, _, _, R, G,
     ])
+    # One pass per row fallen plus the final pass where nothing moves.
+    assert (iterations == 16)
+    assert (field.handle_gravity() == 1)
+
+
+def test_gravity_random():
+    rng = random.Random(0)
+    for _ in range(100):
+        density = rng.random()
+        stack = [rng.randrange(4) if rng.random() < density else None for _ in range(8 * 16)]
+        field = TallField.from_list(stack, num_layers=4)
+        expected = []
+        for x in range(8):
+            column = [stack[x + 8 * y] for y in range(16) if stack[x + 8 * y] is not None]
+            expected.append([None] * (16 - len(column)) + column)
+        expected = [expected[x][y] for y in range(16) for x in range(8)]
+        assert ((field.handle_gravity() > 1) == (expected != stack))
+        assert (field.to_list() == expected)
+        assert (field.handle_gravity() == 1)
+        # The resolves settle the fields with the column compaction instead.
+        field = TallField.from_list(stack, num_layers=4)
+        reference = TallField.from_list(stack, num_layers=4)
+        score = 0
+        chain = 0
+        while reference.handle_gravity() > 1 or not chain:
+            cleared = reference.clear_groups(chain)
+            if not cleared:
+                break
+            score += cleared
+            chain += 1
+        assert (field.resolve() == (score, chain))
+        assert (field.to_list() == reference.to_list())
 
 
 @pytest.mark.parametrize("tsu_rules", [True, False])
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from gym_puyopuyo.env import ENV_NAMES, ENV_PARAMS
+from gym_puyopuyo.env.vector import PuyoPuyoVersusVectorEnv
+from gym_puyopuyo.env.versus import PuyoPuyoVersusEnv
+
+
+def first_valid(game):
+    return int(np.argmax(game.players[0].get_action_mask()))
+
+
+def failing_opponent(game):
+    raise ValueError("Opponent failed")
+
+
+@pytest.mark.parametrize("key", ["vs-small", "vs-tsu"])
+def test_vector_matches_serial(key):
+    params = ENV_PARAMS[ENV_NAMES[key]]
+    env = PuyoPuyoVersusVectorEnv(5, first_valid, params, garbage_clue_weight=0.01, num_workers=2)
+    seeds = env.seed(1234)
+    references = []
+    for seed in seeds:
+        reference = PuyoPuyoVersusEnv(first_valid, params, garbage_clue_weight=0.01)
+        reference.seed(seed)
+        references.append(reference)
+    expected = [reference.reset() for reference in references]
+    observations = env.reset()
+    rng = np.random.RandomState(0)
+    try:
+        for _ in range(40):
+            for i, players in enumerate(expected):
+                for p, player in enumerate(players):
+                    for name, value in player.items():
+                        assert (observations[p][name][i] == value).all()
+                assert (env.get_action_masks()[i] == references[i].get_action_mask()).all()
+            actions = rng.randint(0, env.action_space.n, size=env.num_envs)
+            env.step_async(actions)
+            expected = []
+            expected_rewards = []
+            expected_dones = []
+            for reference, action in zip(references, actions):
+                observation, reward, done, _ = reference.step(action)
+                if done:
+                    observation = reference.reset()
+                expected.append(observation)
+                expected_rewards.append(reward)
+                expected_dones.append(done)
+            observations, rewards, dones, _ = env.step_wait()
+            assert (list(rewards) == expected_rewards)
+            assert (list(dones) == expected_dones)
+            games = env.get_games()
+            for game, reference in zip(games, references):
+                for player, reference_player in zip(game.players, reference.state.players):
+                    assert (player.field.data == reference_player.field.data)
+    finally:
+        env.close()
+
+
+def test_worker_error():
+    params = ENV_PARAMS[ENV_NAMES["vs-small"]]
+    env = PuyoPuyoVersusVectorEnv(3, failing_opponent, params, num_workers=2)
+    try:
+        env.reset()
+        with pytest.raises(RuntimeError) as info:
+            env.step(np.zeros(env.num_envs, dtype=int))
+        assert ("Opponent failed" in str(info.value))
+        assert (not env.waiting)
+        with pytest.raises(RuntimeError):
+            env.reset()
+    finally:
+        env.close()
@@ -2,7 +2,7 @@ import random
 
 import pytest
 
-from gym_puyopuyo.versus import Game
+from gym_puyopuyo.versus import Game, VersusState
 
 
 @pytest.mark.parametrize("height", [8, 16])
@@ -109,3 +109,111 @@ def test_random(height):
         if done:
             break
     assert (result in (-1, 0, 1))
+
+
+def test_clone():
+    params = {
+        "height": 13,
+        "tsu_rules": True,
+        "width": 6,
+        "num_colors": 4,
+        "num_deals": 3,
+        "target_score": 70,
+        "step_bonus": 10,
+    }
+    game = Game(state_params=params)
+    for i in range(20):
+        game.step([random.choice(p.actions) for p in game.players])
+    clone = game.clone()
+    for player, twin in zip(game.players, clone.players):
+        assert (player.field.data == twin.field.data)
+        assert (player.deals == twin.deals)
+        assert (player.encode()["pending_score"] == twin.encode()["pending_score"])
+        assert (player.pending_garbage == twin.pending_garbage)
+        assert (player.target_score == twin.target_score)
+    data = bytearray(game.players[0].field.data)
+    clone.step([random.choice(p.actions) for p in clone.players])
+    assert (game.players[0].field.data == data)
+
+
+def _reference_step(state, x, orientation):
+    """
+    The versus step of a single player implemented on top of the field methods.
+    """
+    if not state.chain_number:
+        if not state.deals:
+            return 0, True
+        if not state.validate_action(x, orientation):
+            return 0, True
+        state.play_deal(x, orientation)
+        state.step_score += state.step_bonus
+
+    had_chain = bool(state.chain_number)
+    fell = (state.field.handle_gravity() > 1)
+    score = state.field.clear_groups(state.chain_number)
+    if score:
+        state.chain_score += score
+        state.chain_number += 1
+
+    released_garbage = 0
+    if had_chain and not (fell or score):
+        state.chain_number = 0
+        state.chain_score += state.step_score
+        state.step_score = 0
+        if state.all_clear_pending:
+            state.chain_score += state.all_clear_bonus
+        state.all_clear_pending = False
+        if state.chain_score >= 0:
+            released_garbage, state.chain_score = divmod(state.chain_score, state.target_score)
+        if not any(state.field.data):
+            state.all_clear_pending = True
+
+    if state.pending_garbage <= released_garbage:
+        released_garbage -= state.pending_garbage
+        state.pending_garbage = 0
+    else:
+        state.pending_garbage -= released_garbage
+        released_garbage = 0
+
+    if not state.chain_number:
+        amount = min(state.pending_garbage, state.max_received_garbage)
+        state.pending_garbage -= amount
+        state.add_garbage(amount)
+        if state.tsu_rules:
+            state.field.resolve()
+    return released_garbage, False
+
+
+@pytest.mark.parametrize("height", [8, 13, 16])
+@pytest.mark.parametrize("max_received_garbage", [float("inf"), 7])
+def test_native_step(height, max_received_garbage):
+    rng = random.Random(height)
+    for game in range(10):
+        params = {
+            "height": height,
+            "width": rng.randint(3, 8) if height != 13 else 6,
+            "num_colors": 3,
+            "num_deals": 2,
+            "tsu_rules": (height == 13),
+            "seed": game,
+            "step_bonus": rng.choice([0, 10]),
+            "all_clear_bonus": rng.choice([0, 100]),
+            "target_score": 1 if height == 8 else 70,
+            "max_received_garbage": max_received_garbage,
+        }
+        state = VersusState(**params)
+        twin = VersusState(**params)
+        for _ in range(200):
+            if rng.random() < 0.1:
+                amount = rng.randint(1, 60)
+                state.pending_garbage += amount
+                twin.pending_garbage += amount
+            action = rng.choice(state.actions)
+            result = state.step(*action)
+            assert (result == _reference_step(twin, *action))
+            assert (state.field.data == twin.field.data)
+            assert (state.deals == twin.deals)
+            for name in VersusState.__slots__ + ("garbage_x",):
+                assert (getattr(state, name) == getattr(twin, name))
+            if result[1]:
+                break